@@ -194,8 +194,8 @@ def run_benchmark(
 ) -> dict:
     """Run the RLM over `examples`, score each, and print a compact report.
 
-    Samples run concurrently up to `concurrency` at a time (each `fast_rlm.run`
-    is a blocking subprocess, so we offload it to a thread and gate with a
+    Samples run concurrently up to `concurrency` at a time (each one is a
+    `fast_rlm.arun` engine subprocess on the event loop, gated with a
     semaphore). Results are reported as they complete; the summary preserves
     input order.
     """
@@ -211,8 +211,7 @@ def run_benchmark(
                "error": None, "detail": ""}
         async with sem:
             try:
-                r = await asyncio.to_thread(
-                    fast_rlm.run,
+                r = await fast_rlm.arun(
                     ex.query,
                     prefix=f"{prefix or name}_{i}",
                     config=config,
@@ -0,0 +1,77 @@
+// Peak-memory benchmark for handing a large string context to a Pyodide REPL.
+//
+// Compares the old path (context spliced into the setup source as a JSON string
+// literal) with stageContext() (one UTF-8 copy written to Pyodide's FS, read back
+// by Python), on the main thread ("fs") and in a REPL worker ("worker", the
+// repl_workers default; the buffer is transferred to it). Each mode runs in its
+// own Deno process and reports peak RSS (VmHWM, Linux only, workers included)
+// relative to the payload size. No LLM is involved.
+//
+// Run:  deno run --allow-read --allow-env --allow-net --allow-write --allow-run \
+//         benchmarks/context_handoff_bench.ts [--mb 200]
+import { loadPyodide } from "pyodide";
+import { encodeContext, stageContext } from "../src/pyodide_context.ts";
+import { WorkerRepl } from "../src/worker_repl.ts";
+
+function flag(name: string, fallback: string): string {
+    const i = Deno.args.indexOf(name);
+    return i >= 0 && i + 1 < Deno.args.length ? Deno.args[i + 1] : fallback;
+}
+
+function peakRssMb(): number {
+    const status = Deno.readTextFileSync("/proc/self/status");
+    const kb = Number(/VmHWM:\s+(\d+)/.exec(status)?.[1] ?? 0);
+    return kb / 1024;
+}
+
+async function measure(mode: string, mb: number): Promise<void> {
+    const worker = mode === "worker" ? new WorkerRepl() : null;
+    if (worker) await worker.boot(null, null);
+    const pyodide = worker ? null : await loadPyodide();
+    const baseline = peakRssMb();
+    // Text with quotes, backslashes, newlines and non-ASCII so escaping costs show.
+    const chunk = 'line "quoted" \\ back\\slash — ünïcode\r\n';
+    const context = chunk.repeat(Math.ceil((mb * 1024 * 1024) / chunk.length));
+    const afterPayload = peakRssMb();
+    const start = performance.now();
+    let ok = false;
+    if (worker) {
+        await worker.run(await worker.stageContext(encodeContext(context)));
+        await worker.run("__context_len__ = len(context)");
+        ok = await worker.get("__context_len__") === context.length;
+    } else if (mode === "literal") {
+        await pyodide!.runPythonAsync(`context = ${JSON.stringify(context)}\n`);
+    } else {
+        await pyodide!.runPythonAsync(stageContext(pyodide!, encodeContext(context)));
+    }
+    const ms = performance.now() - start;
+    if (!worker) ok = pyodide!.runPython(`len(context)`) === context.length;
+    const payloadMb = afterPayload - baseline;
+    const extra = peakRssMb() - afterPayload;
+    console.log(JSON.stringify({
+        mode,
+        payload_mb: Math.round(payloadMb),
+        handoff_peak_extra_mb: Math.round(extra),
+        extra_over_payload: Number((extra / Math.max(1, payloadMb)).toFixed(2)),
+        handoff_ms: Math.round(ms),
+        ok,
+    }));
+    worker?.close();
+}
+
+const mb = Number(flag("--mb", "200"));
+const mode = flag("--mode", "");
+if (mode) {
+    await measure(mode, mb);
+} else {
+    for (const m of ["literal", "fs", "worker"]) {
+        const { stdout } = await new Deno.Command(Deno.execPath(), {
+            args: [
+                "run", "--allow-read", "--allow-env", "--allow-net", "--allow-write",
+                new URL(import.meta.url).pathname, "--mode", m, "--mb", String(mb),
+            ],
+            stderr: "inherit",
+        }).output();
+        Deno.stdout.writeSync(stdout);
+    }
+}
@@ -0,0 +1,81 @@
+// Prompt tokens per step for an agent loop under different history policies.
+//
+// Replays a synthetic agent transcript (reasoning + a repl block per reply,
+// truncated REPL output per step) and, before each step's LLM call, measures
+// what compactHistory() would send: system prompt + history, in estimated
+// tokens (~4 chars/token). No LLM or Pyodide is involved. Also checks that the
+// step-0 probe is sent byte-for-byte under every policy.
+//
+// Run:  deno run benchmarks/history_compaction_bench.ts [--steps 20] [--output-chars 5000]
+import { type CompactionPolicy, compactHistory } from "../src/history.ts";
+import { buildSystemPrompt } from "../src/prompt.ts";
+
+function flag(name: string, fallback: string): string {
+    const i = Deno.args.indexOf(name);
+    return i >= 0 && i + 1 < Deno.args.length ? Deno.args[i + 1] : fallback;
+}
+
+const steps = Number(flag("--steps", "20"));
+const outputChars = Number(flag("--output-chars", "5000"));
+
+const policies: Record<string, CompactionPolicy> = {
+    "full": { dropReasoning: false, keepSteps: null },
+    "drop-reasoning": { dropReasoning: true, keepSteps: null },
+    "keep-4": { dropReasoning: true, keepSteps: 4 },
+    "keep-2": { dropReasoning: true, keepSteps: 2 },
+};
+
+function filler(label: string, chars: number): string {
+    const line = `${label}: the quick brown fox jumps over the lazy dog 0123456789\n`;
+    return line.repeat(Math.ceil(chars / line.length)).slice(0, chars);
+}
+
+// deno-lint-ignore no-explicit-any
+function promptTokens(system: string, messages: any[]): number {
+    let chars = system.length;
+    for (const m of messages) {
+        chars += String(m.content).length;
+        chars += String(m.reasoning ?? "").length;
+    }
+    return Math.ceil(chars / 4);
+}
+
+const system = buildSystemPrompt(false);
+const probe = {
+    role: "user",
+    content: `Outputs will always be truncated to last ${outputChars} characters.\n` +
+        "code:\n```repl\nprint(type(context), len(context))\n```\nOutput:\n" + filler("probe", 1500),
+};
+
+const perStep: Record<string, number[]> = {};
+for (const name of Object.keys(policies)) perStep[name] = [];
+
+// deno-lint-ignore no-explicit-any
+const messages: any[] = [probe];
+const probeBytes = JSON.stringify(probe);
+for (let step = 1; step <= steps; step++) {
+    for (const [name, policy] of Object.entries(policies)) {
+        const sent = compactHistory(messages, policy);
+        if (JSON.stringify(sent[0]) !== probeBytes) throw new Error(`${name}: step-0 prefix changed`);
+        perStep[name].push(promptTokens(system, sent));
+    }
+    messages.push({
+        role: "assistant",
+        content: `Next I will look at part ${step}.\n\`\`\`repl\n${filler(`code ${step}`, 600)}\`\`\``,
+        reasoning: filler(`thinking ${step}`, 2000),
+    });
+    messages.push({ role: "user", content: `Output: \n${filler(`output ${step}`, outputChars)}` });
+}
+
+for (const [name, tokens] of Object.entries(perStep)) {
+    const total = tokens.reduce((a, b) => a + b, 0);
+    console.log(JSON.stringify({
+        policy: name,
+        steps,
+        first_step_tokens: tokens[0],
+        last_step_tokens: tokens[tokens.length - 1],
+        total_prompt_tokens: total,
+        vs_full: Number((total / perStep["full"].reduce((a, b) => a + b, 0)).toFixed(3)),
+        per_step: tokens,
+    }));
+}
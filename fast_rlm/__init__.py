@@ -1,3 +1,5 @@
-from fast_rlm._runner import RLMConfig, run
+from fast_rlm._pool import Engine, run_many
+from fast_rlm._runner import RLMConfig, arun, run
+from fast_rlm._stream import astream, stream
 
-__all__ = ["RLMConfig", "run"]
+__all__ = ["Engine", "RLMConfig", "arun", "astream", "run", "run_many", "stream"]
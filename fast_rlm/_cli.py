@@ -26,7 +26,8 @@ def main():
                         "itself (the extension is passed to it). Becomes the query "
                         "context; the prompt stays the instruction.")
     p.add_argument("--primary-agent", default=None,
-                   help="Root-agent model (e.g. 'z-ai/glm-5', 'acp:opencode').")
+                   help="Root-agent model (e.g. 'z-ai/glm-5', 'acp:opencode', "
+                        "'mock:fanout').")
     p.add_argument("--sub-agent", default=None,
                    help="Sub-agent model (defaults to --primary-agent).")
     p.add_argument("--max-depth", type=int, default=None,
@@ -39,6 +40,10 @@ def main():
     p.add_argument("--acp-agents", default=None,
                    help="JSON registry of custom ACP agents (or @file.json). "
                         "Only needed for non-preset agents.")
+    p.add_argument("--mock-models", default=None,
+                   help="JSON registry of scripted mock models (or @file.json), "
+                        "selected as 'mock:<name>'. Not needed for mock:leaf / "
+                        "mock:fanout.")
     p.add_argument("--prefix", default=None, help="Log filename prefix.")
     p.add_argument("--vertex", action="store_true",
                    help="Route models through Vertex AI (ADC auth).")
@@ -69,6 +74,12 @@ def main():
             with open(raw[1:]) as f:
                 raw = f.read()
         config["acp_agents"] = json.loads(raw)
+    if args.mock_models:
+        raw = args.mock_models
+        if raw.startswith("@"):
+            with open(raw[1:]) as f:
+                raw = f.read()
+        config["mock_models"] = json.loads(raw)
 
     # Imported here so `fast-rlm-log` and --help don't pay the import cost.
     from fast_rlm._runner import run
@@ -0,0 +1,398 @@
+"""Warm engine processes.
+
+`run()` normally starts a fresh `deno run src/subagents.ts` per call, which pays
+Deno's module load + type-check and the npm/Pyodide warm-up every time. An
+`Engine` keeps N engine processes alive in `--serve` mode and hands them run
+requests over their stdin/stdout pipes, so only the first run pays startup.
+
+Protocol (one JSON object per line): requests go to the engine's stdin; the
+engine answers on stdout with lines prefixed by `SERVE_PREFIX`. Everything the
+engine prints for humans (step panels, spinners) goes to stderr in this mode.
+"""
+
+import itertools
+import json
+import queue
+import subprocess
+import threading
+from typing import Any, Callable, Optional
+
+from fast_rlm._runner import (
+    RLMConfig,
+    _RunSpec,
+    _check_deno,
+    _deno_prefix_cmd,
+    _engine_env,
+    _engine_permissions,
+    _find_engine_dir,
+    _prepare_run,
+)
+
+SERVE_PREFIX = "@@fast-rlm@@ "
+
+_ids = itertools.count(1)
+
+# Engines entered via `with Engine(...)`, innermost last. run() uses the top one.
+_active: list["Engine"] = []
+_active_lock = threading.Lock()
+
+
+def _active_engine() -> "Optional[Engine]":
+    with _active_lock:
+        return _active[-1] if _active else None
+
+
+class _EngineProcess:
+    """One engine process running `src/subagents.ts --serve`."""
+
+    def __init__(
+        self,
+        *,
+        vertex: bool = False,
+        allow_run: "bool | str" = False,
+        verbose: bool = True,
+    ):
+        self.vertex = vertex
+        self.allow_run = allow_run
+        self.verbose = verbose
+        self._proc: Optional[subprocess.Popen] = None
+        self._write_lock = threading.Lock()
+
+    def start(self) -> None:
+        engine_dir = _find_engine_dir()
+        cmd = _deno_prefix_cmd() + ["run"] + _engine_permissions(self.allow_run) + [
+            "src/subagents.ts",
+            "--serve",
+        ]
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None if self.verbose else subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            cwd=str(engine_dir),
+            env=_engine_env(self.vertex),
+        )
+        msg = self.read()
+        if msg is None or msg.get("type") != "ready":
+            code = self._proc.poll()
+            self.close()
+            raise RuntimeError(
+                f"fast-rlm engine failed to start (exit code {code})."
+            )
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def send(self, msg: dict) -> None:
+        assert self._proc is not None and self._proc.stdin is not None
+        with self._write_lock:
+            self._proc.stdin.write(json.dumps(msg) + "\n")
+            self._proc.stdin.flush()
+
+    def read(self) -> Optional[dict]:
+        """Next protocol message, or None once the engine's stdout closes."""
+        assert self._proc is not None and self._proc.stdout is not None
+        for line in self._proc.stdout:
+            if line.startswith(SERVE_PREFIX):
+                return json.loads(line[len(SERVE_PREFIX):])
+        return None
+
+    def submit(self, spec: _RunSpec, *, events: bool = False) -> int:
+        """Send one run request and return its id (see `replies`)."""
+        req_id = next(_ids)
+        request = {**spec.to_request(), "id": req_id}
+        if events:
+            request["events"] = True
+        self.send(request)
+        return req_id
+
+    def replies(self, req_id: int):
+        """Yield request `req_id`'s event dicts, then its result dict.
+
+        The result is the last item, with the engine's `type`/`id` stripped.
+        Events are the engine Logger's records (`event_type`, `depth`, ...).
+        """
+        while True:
+            msg = self.read()
+            if msg is None:
+                raise RuntimeError(
+                    f"fast-rlm engine exited mid-run (exit code {self._proc.poll()})."
+                )
+            if msg.get("id") != req_id:
+                continue
+            if msg.get("type") == "event":
+                yield msg["event"]
+            elif msg.get("type") == "result":
+                msg.pop("type")
+                msg.pop("id")
+                yield msg
+                return
+
+    def cancel(self, req_id: int) -> None:
+        """Ask the engine to abort request `req_id` before its next step."""
+        self.send({"type": "cancel", "id": req_id})
+
+    def request(
+        self,
+        spec: _RunSpec,
+        on_event: Optional[Callable[[dict], Any]] = None,
+    ) -> dict:
+        """Run one spec to completion and return the engine's result dict.
+
+        `on_event` is called with every event of the run. If it raises, the run
+        is cancelled, its reply drained, and the exception re-raised.
+        """
+        req_id = self.submit(spec, events=on_event is not None)
+        replies = self.replies(req_id)
+        for msg in replies:
+            if "event_type" not in msg:
+                return msg
+            try:
+                on_event(msg)
+            except BaseException:
+                self.cancel(req_id)
+                for _ in replies:
+                    pass
+                raise
+        raise AssertionError("unreachable")
+
+    def kill(self) -> None:
+        """Stop the engine now, abandoning whatever it is running."""
+        if self._proc is None:
+            return
+        self._proc.kill()
+        self._proc.wait()
+        self._proc = None
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        try:
+            if self._proc.stdin:
+                self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+        self._proc = None
+
+
+class Engine:
+    """A pool of warm fast-rlm engine processes.
+
+    Use it as a context manager; every `fast_rlm.run()` inside the block is
+    served by one of the pool's processes instead of a freshly started one::
+
+        with fast_rlm.Engine(workers=4):
+            results = [fast_rlm.run(q, config=cfg) for q in queries]
+
+    Each worker runs one query at a time, so `workers` is also the number of
+    runs in flight. `run()` is thread-safe while an engine is active. Workers
+    that die are restarted on the next run.
+
+    Args:
+        workers: Number of engine processes to keep warm.
+        vertex: Route models through Vertex AI (ADC auth), like `run(vertex=True)`.
+            Runs whose `vertex` flag differs from the engine's fall back to a
+            dedicated process.
+        allow_run: Grant the workers unrestricted `--allow-run` so they can
+            spawn ACP agents and stdio MCP servers. Off by default: REPL code
+            can reach Deno through Pyodide, so it could start host processes
+            too. Runs that need it fall back to a dedicated process. Vertex
+            engines may always run gcloud.
+    """
+
+    def __init__(self, workers: int = 1, *, vertex: bool = False, allow_run: bool = False):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.workers = workers
+        self.vertex = vertex
+        self.allow_run = allow_run
+        self._idle: "queue.Queue[_EngineProcess]" = queue.Queue()
+        self._procs: list[_EngineProcess] = []
+        self._started = False
+
+    def _spawn(self) -> _EngineProcess:
+        proc = _EngineProcess(
+            vertex=self.vertex, allow_run=self.allow_run or ("gcloud" if self.vertex else False)
+        )
+        proc.start()
+        return proc
+
+    def start(self) -> "Engine":
+        """Start the worker processes (blocks until each one is warm)."""
+        if self._started:
+            return self
+        _check_deno()
+        try:
+            for _ in range(self.workers):
+                proc = self._spawn()
+                self._procs.append(proc)
+                self._idle.put(proc)
+        except Exception:
+            self.close()
+            raise
+        self._started = True
+        return self
+
+    def close(self) -> None:
+        """Stop every worker process."""
+        for proc in self._procs:
+            proc.close()
+        self._procs.clear()
+        self._idle = queue.Queue()
+        self._started = False
+
+    def __enter__(self) -> "Engine":
+        self.start()
+        with _active_lock:
+            _active.append(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with _active_lock:
+            if self in _active:
+                _active.remove(self)
+        self.close()
+
+    def accepts(self, spec: _RunSpec) -> bool:
+        """Whether this engine can serve `spec` (else run() starts a new process)."""
+        if not self._started or spec.vertex != self.vertex:
+            return False
+        # A Vertex spec needs only gcloud, which a Vertex engine grants.
+        return self.allow_run or spec.needs_run_permission in (False, "gcloud")
+
+    def submit(
+        self,
+        spec: _RunSpec,
+        on_event: Optional[Callable[[dict], Any]] = None,
+    ) -> dict:
+        """Run `spec` on the next idle worker and return the raw result dict."""
+        if not self._started:
+            raise RuntimeError("Engine is not started; use `with Engine(...)` or start().")
+        proc = self._idle.get()
+        try:
+            if not proc.alive:
+                if proc in self._procs:
+                    self._procs.remove(proc)
+                proc = self._spawn()
+                self._procs.append(proc)
+            return proc.request(spec, on_event)
+        finally:
+            self._idle.put(proc)
+
+
+def _iter_run_many(proc: _EngineProcess, spec: _RunSpec, queries: list, concurrency: int):
+    """Send one run_many request and yield (index, result) as runs complete."""
+    req_id = next(_ids)
+    request = {**spec.to_request(), "type": "run_many", "id": req_id,
+               "queries": queries, "concurrency": concurrency}
+    request.pop("query")
+    proc.send(request)
+    while True:
+        msg = proc.read()
+        if msg is None:
+            raise RuntimeError(
+                f"fast-rlm engine exited mid-run (exit code {proc._proc.poll()})."
+            )
+        if msg.get("id") != req_id:
+            continue
+        if msg.get("type") == "done":
+            if "error" in msg:
+                raise RuntimeError(f"fast-rlm run_many failed: {msg['error']}")
+            return
+        if msg.get("type") == "result":
+            index = msg.pop("index")
+            msg.pop("type")
+            msg.pop("id")
+            yield index, msg
+
+
+def run_many(
+    queries: "list[str | dict | list]",
+    config: "Optional[RLMConfig | dict]" = None,
+    *,
+    concurrency: int = 4,
+    as_completed: bool = False,
+    return_exceptions: bool = False,
+    prefix: Optional[str] = None,
+    verbose: bool = False,
+    output_schema: Optional[Any] = None,
+    tools: Optional[list[Callable]] = None,
+    env_variables: Optional[dict[str, str]] = None,
+    mcp_servers: Optional[dict[str, dict]] = None,
+    llm_kwargs: Optional[dict] = None,
+    vertex: bool = False,
+    instruction: Optional[str] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+):
+    """Run many independent queries with one config inside ONE engine process.
+
+    The engine starts once, reads the config and connects `mcp_servers` once,
+    then runs up to `concurrency` root agents at a time. Each query gets its own
+    usage totals and budgets (`max_money_spent` etc. apply per query), and
+    `deadline_s` limits each query separately. All runs share one log file.
+    The remaining arguments mean the same as in `run()`.
+
+    Args:
+        queries: List of queries (str, dict or list each).
+        concurrency: Max root runs in flight inside the engine.
+        as_completed: If True, return an iterator of ``(index, result)`` pairs
+            in completion order instead of a list in input order.
+        return_exceptions: If True, a failed query yields a RuntimeError in its
+            place instead of raising.
+
+    Returns:
+        A list of result dicts (like `run()`'s) in input order, or an iterator
+        of ``(index, result)`` pairs when `as_completed=True`.
+    """
+    queries = list(queries)
+    if concurrency < 1:
+        raise ValueError("concurrency must be >= 1")
+    for q in queries:
+        if not isinstance(q, (str, dict, list)):
+            raise TypeError(
+                f"queries must be str, dict, or list, got {type(q).__name__}"
+            )
+    _check_deno()
+    spec = _prepare_run(
+        queries[0] if queries else "", prefix, config, verbose, output_schema,
+        tools, env_variables, mcp_servers, llm_kwargs, vertex, instruction, None,
+        record, replay, deadline_s,
+    )
+
+    def _results():
+        if not queries:
+            return
+        proc = _EngineProcess(
+            vertex=spec.vertex, allow_run=spec.needs_run_permission, verbose=verbose
+        )
+        proc.start()
+        try:
+            for index, data in _iter_run_many(proc, spec, queries, concurrency):
+                if "error" in data:
+                    err = RuntimeError(f"fast-rlm subagent failed: {data['error']}")
+                    if not return_exceptions:
+                        raise err
+                    yield index, err
+                else:
+                    yield index, data
+        finally:
+            proc.close()
+
+    if as_completed:
+        return _results()
+    ordered: list = [None] * len(queries)
+    for index, data in _results():
+        ordered[index] = data
+    return ordered
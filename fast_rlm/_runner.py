@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import json
 import os
@@ -82,12 +83,116 @@ class RLMConfig:
     enable_compression_guard: bool = True
     compression_min_chars: int = 5000
     compression_ratio: float = 0.6
+    # Spare Pyodide REPLs the engine keeps booted so new (sub-)agents skip the
+    # interpreter + package boot. 0 boots a fresh REPL per agent.
+    repl_pool_size: int = 2
+    # Boot REPLs from a Pyodide memory snapshot cached under ~/.cache/fast-rlm
+    # (override with $FAST_RLM_CACHE_DIR). Rebuilt automatically when the
+    # Pyodide version or the REPL boot code changes.
+    repl_snapshot: bool = True
+    # Extra pure-Python packages (pip requirement strings) importable in every
+    # REPL besides requests/httpx, e.g. ["beautifulsoup4", "pyyaml"]. Resolved
+    # once into a local wheel store (~/.cache/fast-rlm/wheels) and installed
+    # offline on first import.
+    repl_packages: Optional[list] = None
+    # Run each agent's REPL in its own Deno Web Worker so CPU-heavy Python in
+    # sibling agents runs in parallel. False keeps every REPL on the main thread.
+    repl_workers: bool = True
+    # Open connections to the model endpoints when the engine starts (and at
+    # each run), so the first LLM call doesn't pay the TCP/TLS handshake.
+    prewarm_connections: bool = False
+    # Stream completions and cut each one off after its first closed ```repl
+    # block (saves tokens and latency; records time to first token).
+    stream_completions: bool = True
+    # History compaction: resend only the last N steps of an agent verbatim and
+    # collapse older ones into a short digest (None resends every step), and
+    # strip provider reasoning from replies before resending them.
+    history_keep_steps: Optional[int] = None
+    history_drop_reasoning: bool = True
+    # Ask providers to cache the shared prompt prefix (system prompt + context
+    # probe + history): Anthropic cache_control breakpoints, OpenAI/OpenRouter
+    # prompt_cache_key. Cached prompt tokens show up in usage["cached_tokens"].
+    prompt_caching: bool = True
+    # Opt-in disk cache of LLM responses: a request identical to an earlier one
+    # (model, prompts, messages, llm_kwargs) is answered from disk. Only useful
+    # for deterministic settings (temperature 0 / fixed seed). The directory
+    # defaults to ~/.cache/fast-rlm/responses; least recently used entries are
+    # evicted past response_cache_max_mb. Hits/misses: usage["response_cache"].
+    response_cache: bool = False
+    response_cache_dir: Optional[str] = None
+    response_cache_max_mb: int = 1024
+    # Identical llm_query calls within a run (same context, instruction,
+    # schema, tools, MCP grant and depth) share one child run: a call whose twin
+    # is still running waits for it, a later one gets the memoized result.
+    # Counts: usage["llm_query_dedup"].
+    dedupe_llm_queries: bool = True
+    # Provider rate limits. Keys are a model string, a backend ("openai" for the
+    # OpenAI-compatible endpoint, "anthropic", "vertex", "mock") or "default";
+    # values are {rpm?, tpm?, max_in_flight?}. Example:
+    #   rate_limits={"openai": {"rpm": 500, "max_in_flight": 32}}
+    # Calls queue for a slot; a 429 pauses the limiter for its Retry-After and
+    # halves its concurrency, and retries (api_max_retries) happen there.
+    rate_limits: Optional[dict] = None
+    # Caps on agents alive at once and on their Pyodide memory (MB) across the
+    # engine; new agents wait for a slot, deepest first. A parent waiting on its
+    # children doesn't count as making progress, so a tree never deadlocks on
+    # the caps. None = no cap.
+    max_live_agents: Optional[int] = None
+    max_repl_memory_mb: Optional[int] = None
+    # Hedged requests: {"percentile": 95, "min_samples": 20, "alternate_model":
+    # None}. An LLM call still running at the model's p95 latency gets a
+    # duplicate (to alternate_model, or the same model); the first reply wins
+    # and the other is cancelled. Both are billed. None = off.
+    hedge_requests: Optional[dict] = None
+    # Endpoint pools for the OpenAI-compatible backend, by model string or
+    # "default": lists of {base_url, api_key | api_key_env, weight,
+    # max_in_flight, model}. Each call goes to one endpoint (see
+    # endpoint_routing) and fails over to another on 5xx/429/timeouts. Example:
+    #   endpoints={"default": [{"base_url": "http://gpu1:8000/v1"},
+    #                          {"base_url": "http://gpu2:8000/v1", "weight": 2}]}
+    endpoints: Optional[dict] = None
+    # "least_outstanding" (fewest requests in flight per weight) or
+    # "least_latency" (also favours endpoints that have been answering faster).
+    endpoint_routing: str = "least_outstanding"
+    # Model routing, in place of primary_agent at the root and sub_agent below:
+    #   by_depth          {"2": "cheap-model"}: a model per depth ("0" = root)
+    #   by_context_chars  [{"max_chars": 4000, "model": "cheap-model"}]: for
+    #                     sub-agents, the first rule their context fits under
+    #   cascade           {"models": ["cheap-model"], "min_depth": 1}: try these
+    #                     first, escalating to the next model when FINAL fails
+    #                     output_schema validation or the agent runs out of steps
+    # Usage then reports cost and LLM time per model under "by_model".
+    model_routing: Optional[dict] = None
+    # Prices in USD per 1M tokens for models whose provider doesn't report cost
+    # (native Anthropic, Vertex, most self-hosted servers), over the bundled
+    # table: {"my-model": {"input": 0.5, "output": 1.5, "cached_input": 0.05}}.
+    # They also price the pre-flight check that refuses a call whose prompt
+    # would breach max_money_spent.
+    model_prices: Optional[dict] = None
+    # Give each llm_query child a budget carved out of its parent's remaining
+    # one (an even share across a batch_llm_query, or llm_query(budget=...)),
+    # returned less its spend when the child ends. Keeps max_money_spent and
+    # the token budgets from being overshot by wide fan-outs.
+    budget_reservations: bool = True
+    # Wall-clock limit on each run, in seconds (None = none); run(deadline_s=...)
+    # sets it per call. Sub-agents inherit the remaining time less a margin,
+    # agents are told to call FINAL as it nears, and when it passes the run
+    # returns its last output with "partial": True instead of failing.
+    deadline_s: Optional[float] = None
     # ACP backdoor: register non-preset Agent Client Protocol agents by command,
     # then select one via primary_agent/sub_agent="acp:<name>". Built-in presets
     # (acp:claude-code, acp:codex, acp:opencode) need no entry here. Example:
     #   acp_agents={"hermes": {"command": "hermes", "args": ["acp"]}}
     # Each value: {command, args?, readonly_mode?, model?, env?}.
     acp_agents: Optional[dict] = None
+    # Scripted mock models for load tests with no network or spend: register
+    # scripts by name, then select one via primary_agent/sub_agent="mock:<name>".
+    # Built-in mock:leaf and mock:fanout need no entry. Example:
+    #   mock_models={"two_step": {"steps": ["print(len(context))", "FINAL('done')"],
+    #                             "latency": "exp:500"}}
+    # Each value: {steps, leaf_steps?, latency?, ms_per_token?, prompt_tokens?,
+    # completion_tokens?, input_price?, output_price?, error_rate?, seed?, vars?}.
+    mock_models: Optional[dict] = None
 
     @classmethod
     def default(cls) -> "RLMConfig":
@@ -197,6 +302,299 @@ def _load_input_file(path: str):
         return f.read(), ext
 
 
+@dataclass
+class _RunSpec:
+    """A validated, engine-ready run: everything `run()` resolved from its
+    arguments, before it is handed to a one-shot engine process or to a warm
+    `Engine` worker."""
+
+    query: Any
+    config: dict
+    prefix: Optional[str]
+    log_dir: str
+    verbose: bool
+    vertex: bool
+    output_schema: Optional[dict] = None
+    tool_sources: Optional[list[str]] = None
+    env_variables: Optional[dict[str, str]] = None
+    mcp_servers: Optional[dict[str, dict]] = None
+    llm_kwargs: Optional[dict] = None
+    # Absolute cassette paths (run(record=...) / run(replay=...)).
+    record: Optional[str] = None
+    replay: Optional[str] = None
+
+    @property
+    def needs_run_permission(self) -> "bool | str":
+        """What the engine must be allowed to spawn, as `_engine_permissions`
+        takes it: True (anything) for ACP agents and stdio MCP servers, which
+        run as child processes (e.g. npx/opencode); "gcloud" for Vertex AI ADC;
+        False otherwise."""
+        if any(a.startswith("acp:") for a in _config_models(self.config)):
+            return True
+        if self.mcp_servers and any("url" not in cfg for cfg in self.mcp_servers.values()):
+            return True
+        return "gcloud" if self.vertex else False
+
+    def to_request(self) -> dict:
+        """Wire form sent to an engine started with `--serve`."""
+        return {
+            "type": "run",
+            "query": self.query,
+            "config": self.config,
+            "prefix": self.prefix,
+            "log_dir": self.log_dir,
+            "verbose": self.verbose,
+            "output_schema": self.output_schema,
+            "tools": self.tool_sources,
+            "env": self.env_variables,
+            "mcp_servers": self.mcp_servers,
+            "llm_kwargs": self.llm_kwargs,
+            "record": self.record,
+            "replay": self.replay,
+        }
+
+
+def _merge_config(engine_dir: Path, config: Optional[RLMConfig | dict], instruction: Optional[str]) -> dict:
+    """Load yaml defaults, overlay user overrides, REQUIRE primary_agent, and
+    default sub_agent to primary_agent when it is unset."""
+    if isinstance(config, RLMConfig):
+        cfg_dict = asdict(config)
+    else:
+        cfg_dict = dict(config) if config else {}
+
+    default_config_path = engine_dir / "rlm_config.yaml"
+    _defaults = {}
+    if default_config_path.exists():
+        with open(default_config_path) as f:
+            _defaults = yaml.safe_load(f) or {}
+    merged_config = {**_defaults, **cfg_dict}
+    if instruction is not None:
+        merged_config["instruction"] = instruction
+
+    if not merged_config.get("primary_agent"):
+        raise ValueError(
+            "primary_agent is required and has no default. Set it explicitly, e.g. "
+            "run(query, config=RLMConfig(primary_agent='z-ai/glm-5')) or "
+            "config={'primary_agent': '...'}."
+        )
+    if not merged_config.get("sub_agent"):
+        merged_config["sub_agent"] = merged_config["primary_agent"]
+    return merged_config
+
+
+def _prepare_run(
+    query: "str | dict | list | None" = None,
+    prefix: Optional[str] = None,
+    config: Optional[RLMConfig | dict] = None,
+    verbose: bool = True,
+    output_schema: Optional[Any] = None,
+    tools: Optional[list[Callable]] = None,
+    env_variables: Optional[dict[str, str]] = None,
+    mcp_servers: Optional[dict[str, dict]] = None,
+    llm_kwargs: Optional[dict] = None,
+    vertex: bool = False,
+    instruction: Optional[str] = None,
+    input_file: Optional[str] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> _RunSpec:
+    """Validate `run()` arguments and resolve them into a `_RunSpec`."""
+    engine_dir = _find_engine_dir()
+
+    # Resolve input_file into the query (so the CLI can be a thin shim). This is
+    # the file-type contract above; raw-text inputs also get an extension note
+    # appended to the instruction so the model knows how to parse them.
+    if input_file is not None:
+        if query is not None:
+            raise ValueError("Pass either `query` or `input_file`, not both.")
+        query, _ext = _load_input_file(input_file)
+        if isinstance(query, dict) and instruction and "instruction" not in query:
+            query["instruction"] = instruction
+        if isinstance(query, str):
+            _note = _string_path_note(_ext)
+            instruction = f"{instruction}\n\n{_note}" if instruction else _note
+    if query is None:
+        raise ValueError("Provide either `query` or `input_file`.")
+
+    # RLMConfig merge + validation (done early, before any temp files are created).
+    merged_config = _merge_config(engine_dir, config, instruction)
+    if deadline_s is not None:
+        if isinstance(deadline_s, bool) or not isinstance(deadline_s, (int, float)) or deadline_s <= 0:
+            raise ValueError("deadline_s must be a positive number of seconds")
+        merged_config["deadline_s"] = deadline_s
+
+    if not isinstance(query, (str, dict, list)):
+        raise TypeError(
+            f"query must be a str, dict, or list, got {type(query).__name__}"
+        )
+
+    if env_variables:
+        if not isinstance(env_variables, dict) or not all(
+            isinstance(k, str) and isinstance(v, str) for k, v in env_variables.items()
+        ):
+            raise TypeError("env_variables must be a dict[str, str]")
+
+    tool_sources = [_extract_tool_source(t) for t in tools] if tools else None
+
+    schema_dict = _to_json_schema(output_schema) if output_schema is not None else None
+
+    if mcp_servers:
+        if not isinstance(mcp_servers, dict) or not all(
+            isinstance(k, str) and isinstance(v, dict) for k, v in mcp_servers.items()
+        ):
+            raise TypeError("mcp_servers must be a dict[str, dict]")
+
+    if llm_kwargs is not None:
+        if not isinstance(llm_kwargs, dict) or not all(
+            isinstance(k, str) for k in llm_kwargs
+        ):
+            raise TypeError("llm_kwargs must be a dict with string keys")
+
+    if record is not None and replay is not None:
+        raise ValueError("Pass either `record` or `replay`, not both.")
+    if replay is not None and not os.path.exists(replay):
+        raise FileNotFoundError(f"cassette not found: {replay}")
+
+    return _RunSpec(
+        query=query,
+        config=merged_config,
+        prefix=prefix,
+        log_dir=os.path.join(os.getcwd(), "logs"),
+        verbose=verbose,
+        vertex=vertex,
+        output_schema=schema_dict,
+        tool_sources=tool_sources,
+        env_variables=env_variables or None,
+        mcp_servers=mcp_servers or None,
+        llm_kwargs=llm_kwargs,
+        # The engine runs from its own directory; hand it absolute paths.
+        record=os.path.abspath(record) if record is not None else None,
+        replay=os.path.abspath(replay) if replay is not None else None,
+    )
+
+
+def _engine_permissions(allow_run: "bool | str") -> list[str]:
+    """Deno permission flags for the engine. `allow_run` is False, True (any
+    subprocess) or a comma-separated allow-list (e.g. "gcloud")."""
+    flags = [
+        "--allow-read",
+        "--allow-env",
+        "--allow-net",
+        "--allow-sys=hostname,osRelease",
+        "--allow-write",
+    ]
+    if allow_run is True:
+        flags.append("--allow-run")
+    elif allow_run:
+        flags.append(f"--allow-run={allow_run}")
+    return flags
+
+
+def _engine_env(vertex: bool) -> Optional[dict]:
+    # Vertex AI: signal the Deno engine to use ADC auth
+    if vertex:
+        return {**os.environ, "RLM_VERTEX_AI": "1"}
+    return None
+
+
+def _config_models(config: dict) -> "list[str]":
+    """Every model string a run's config can select, including model_routing's."""
+    models = [config.get("primary_agent") or "", config.get("sub_agent") or ""]
+    routing = config.get("model_routing") or {}
+    models += list((routing.get("by_depth") or {}).values())
+    models += [r.get("model") or "" for r in routing.get("by_context_chars") or []]
+    models += list((routing.get("cascade") or {}).get("models") or [])
+    return models
+
+
+def _write_tmp_json(value: Any, suffix: str) -> str:
+    path = tempfile.mktemp(suffix=suffix)
+    with open(path, "w") as f:
+        json.dump(value, f)
+    return path
+
+
+def _one_shot_command(spec: _RunSpec, output_file: str) -> "tuple[list[str], list[str]]":
+    """Build the `deno run src/subagents.ts ...` command for a single run.
+
+    Returns (cmd, tmpfiles); the caller deletes the tmpfiles when the run ends.
+    """
+    cmd = _deno_prefix_cmd() + ["run"] + _engine_permissions(spec.needs_run_permission) + [
+        "src/subagents.ts",
+        "--log-dir",
+        spec.log_dir,
+        "--output",
+        output_file,
+    ]
+    # String queries go over stdin as raw UTF-8 (no JSON escaping to undo).
+    if not isinstance(spec.query, str):
+        cmd.append("--input-json")
+
+    if spec.prefix:
+        cmd += ["--prefix", spec.prefix]
+
+    tmpfiles: list[str] = []
+
+    def _file_arg(flag: str, value: Any, suffix: str) -> None:
+        path = _write_tmp_json(value, suffix)
+        tmpfiles.append(path)
+        cmd.extend([flag, path])
+
+    if spec.env_variables:
+        _file_arg("--env-file", spec.env_variables, ".env.json")
+    if spec.tool_sources:
+        _file_arg("--tools-file", spec.tool_sources, ".tools.json")
+    if spec.output_schema is not None:
+        _file_arg("--output-schema-file", spec.output_schema, ".schema.json")
+    if spec.mcp_servers:
+        _file_arg("--mcp-file", spec.mcp_servers, ".mcp.json")
+    if spec.llm_kwargs is not None:
+        _file_arg("--llm-kwargs-file", spec.llm_kwargs, ".llm_kwargs.json")
+    if spec.record is not None:
+        cmd += ["--record", spec.record]
+    if spec.replay is not None:
+        cmd += ["--replay", spec.replay]
+
+    # Write the merged+validated config (always present — primary_agent is required)
+    # to a temp file and hand it to the engine.
+    config_tmpfile = tempfile.mktemp(suffix=".yaml")
+    with open(config_tmpfile, "w") as f:
+        yaml.dump(spec.config, f)
+    tmpfiles.append(config_tmpfile)
+    cmd += ["--config", config_tmpfile]
+
+    return cmd, tmpfiles
+
+
+def _stdin_payload(spec: _RunSpec) -> bytes:
+    """The query as the one-shot engine reads it from stdin (see --input-json)."""
+    if isinstance(spec.query, str):
+        return spec.query.encode("utf-8")
+    return json.dumps(spec.query).encode("utf-8")
+
+
+def _cleanup(paths: list[str]) -> None:
+    for path in paths:
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+
+def _read_output(output_file: str, returncode: Optional[int], stderr: str) -> dict:
+    if not os.path.exists(output_file):
+        raise RuntimeError(
+            f"fast-rlm engine failed (exit code {returncode}).\n{stderr}"
+        )
+    with open(output_file) as f:
+        return json.load(f)
+
+
+def _check_result(data: dict) -> dict:
+    if "error" in data:
+        raise RuntimeError(f"fast-rlm subagent failed: {data['error']}")
+    return data
+
+
 def run(
     query: "str | dict | list | None" = None,
     prefix: Optional[str] = None,
@@ -210,6 +608,10 @@ def run(
     vertex: bool = False,
     instruction: Optional[str] = None,
     input_file: Optional[str] = None,
+    on_event: Optional[Callable[[dict], Any]] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
 ) -> dict:
     """Run a fast-rlm query.
 
@@ -266,196 +668,144 @@ def run(
             noted in the instruction so it knows the format). When the loaded
             value is a dict with no ``instruction`` key, `instruction` is injected
             into it.
+        on_event: Optional callback invoked with each live event of the run
+            (``agent_start``, ``code_generated``, ``execution_result``,
+            ``final_result``, ``usage``, ``budget_warning``, ``agent_end``; see
+            `fast_rlm.stream`). Raising from it cancels the run and re-raises.
+        record: Optional path of a cassette file to write. Every LLM
+            completion and MCP tool/resource result of the run is saved there,
+            per agent and in order.
+        replay: Optional path of a cassette written by ``record=``. LLM and MCP
+            calls are answered from it with no network access and no API keys.
+            The REPL code still runs for real. The run fails if it asks for a
+            call the recording doesn't have, e.g. because the code is
+            nondeterministic. Pass ``record`` or ``replay``, not both.
+        deadline_s: Optional wall-clock limit on the run, in seconds, counted
+            from when the engine starts it (overrides the config's
+            ``deadline_s``). Sub-agents get the remaining time less a safety
+            margin, and agents are told to call FINAL as it nears. When it
+            passes, the run returns the root agent's last step output as
+            ``results``, with ``"partial": True``, instead of raising.
+
+    When called inside a ``with fast_rlm.Engine(...)`` block, the run is
+    handed to one of the engine's warm processes instead of starting a new one
+    (see `Engine`).
 
     Returns:
-        Dict with 'results', 'usage', and optionally 'log_file'.
+        Dict with 'results', 'usage', and optionally 'log_file' and 'partial'
+        (True when `deadline_s` cut the run short).
     """
     _check_deno()
-    engine_dir = _find_engine_dir()
-
-    # Resolve input_file into the query (so the CLI can be a thin shim). This is
-    # the file-type contract above; raw-text inputs also get an extension note
-    # appended to the instruction so the model knows how to parse them.
-    if input_file is not None:
-        if query is not None:
-            raise ValueError("Pass either `query` or `input_file`, not both.")
-        query, _ext = _load_input_file(input_file)
-        if isinstance(query, dict) and instruction and "instruction" not in query:
-            query["instruction"] = instruction
-        if isinstance(query, str):
-            _note = _string_path_note(_ext)
-            instruction = f"{instruction}\n\n{_note}" if instruction else _note
-    if query is None:
-        raise ValueError("Provide either `query` or `input_file`.")
+    spec = _prepare_run(
+        query, prefix, config, verbose, output_schema, tools, env_variables,
+        mcp_servers, llm_kwargs, vertex, instruction, input_file, record, replay,
+        deadline_s,
+    )
 
-    # RLMConfig merge + validation (done early, before any temp files are created):
-    # load yaml defaults, overlay user overrides, REQUIRE primary_agent, and default
-    # sub_agent to primary_agent when it is unset.
-    if isinstance(config, RLMConfig):
-        cfg_dict = asdict(config)
-    else:
-        cfg_dict = dict(config) if config else {}
+    # A warm engine pool (fast_rlm.Engine) takes the run if one is active and
+    # can serve it; otherwise fall back to a dedicated engine process.
+    from fast_rlm._pool import _active_engine, _EngineProcess
 
-    default_config_path = engine_dir / "rlm_config.yaml"
-    _defaults = {}
-    if default_config_path.exists():
-        with open(default_config_path) as f:
-            _defaults = yaml.safe_load(f) or {}
-    merged_config = {**_defaults, **cfg_dict}
-    if instruction is not None:
-        merged_config["instruction"] = instruction
+    engine = _active_engine()
+    if engine is not None and engine.accepts(spec):
+        return _check_result(engine.submit(spec, on_event))
 
-    if not merged_config.get("primary_agent"):
-        raise ValueError(
-            "primary_agent is required and has no default. Set it explicitly, e.g. "
-            "run(query, config=RLMConfig(primary_agent='z-ai/glm-5')) or "
-            "config={'primary_agent': '...'}."
+    # Events need the serve protocol's pipe, so use a one-off serving process.
+    if on_event is not None:
+        proc = _EngineProcess(
+            vertex=spec.vertex, allow_run=spec.needs_run_permission, verbose=verbose
         )
-    if not merged_config.get("sub_agent"):
-        merged_config["sub_agent"] = merged_config["primary_agent"]
+        proc.start()
+        try:
+            return _check_result(proc.request(spec, on_event))
+        finally:
+            proc.close()
 
+    engine_dir = _find_engine_dir()
     output_file = tempfile.mktemp(suffix=".json")
-    log_dir = os.path.join(os.getcwd(), "logs")
+    cmd, tmpfiles = _one_shot_command(spec, output_file)
 
-    cmd = _deno_prefix_cmd() + [
-        "run",
-        "--allow-read",
-        "--allow-env",
-        "--allow-net",
-        "--allow-sys=hostname,osRelease",
-        "--allow-write",
-    ]
+    try:
+        result = subprocess.run(
+            cmd,
+            input=_stdin_payload(spec),
+            cwd=str(engine_dir),
+            env=_engine_env(spec.vertex),
+            stdout=None if verbose else subprocess.PIPE,
+            stderr=None if verbose else subprocess.PIPE,
+        )
+        data = _read_output(
+            output_file,
+            result.returncode,
+            result.stderr.decode("utf-8", errors="replace") if result.stderr else "",
+        )
+    finally:
+        _cleanup([output_file, *tmpfiles])
 
-    # Vertex AI ADC via gcloud CLI needs subprocess permission
-    if vertex:
-        cmd.append("--allow-run=gcloud")
+    return _check_result(data)
 
-    # ACP agents are spawned as child processes (e.g. npx/opencode), so the Deno
-    # host needs --allow-run when either agent is an "acp:" model.
-    _agents = [merged_config.get("primary_agent") or "", merged_config.get("sub_agent") or ""]
-    if any(a.startswith("acp:") for a in _agents):
-        cmd.append("--allow-run")
 
-    cmd += [
-        "src/subagents.ts",
-        "--log-dir",
-        log_dir,
-        "--output",
-        output_file,
-        "--input-json",
-    ]
+async def arun(
+    query: "str | dict | list | None" = None,
+    prefix: Optional[str] = None,
+    config: Optional[RLMConfig | dict] = None,
+    verbose: bool = True,
+    output_schema: Optional[Any] = None,
+    tools: Optional[list[Callable]] = None,
+    env_variables: Optional[dict[str, str]] = None,
+    mcp_servers: Optional[dict[str, dict]] = None,
+    llm_kwargs: Optional[dict] = None,
+    vertex: bool = False,
+    instruction: Optional[str] = None,
+    input_file: Optional[str] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> dict:
+    """Asyncio variant of `run()`: same arguments, same return dict.
 
-    if prefix:
-        cmd += ["--prefix", prefix]
+    The engine is started with `asyncio.create_subprocess_exec` and its pipes
+    are drained without blocking the event loop, so many runs can be in flight
+    on one loop without a thread each. Cancelling the awaiting task kills the
+    engine process and removes its temp files.
 
-    if not isinstance(query, (str, dict, list)):
-        raise TypeError(
-            f"query must be a str, dict, or list, got {type(query).__name__}"
-        )
-    stdin_payload = json.dumps(query)
-
-    env_tmpfile = None
-    if env_variables:
-        if not isinstance(env_variables, dict) or not all(
-            isinstance(k, str) and isinstance(v, str) for k, v in env_variables.items()
-        ):
-            raise TypeError("env_variables must be a dict[str, str]")
-        env_tmpfile = tempfile.mktemp(suffix=".env.json")
-        with open(env_tmpfile, "w") as f:
-            json.dump(env_variables, f)
-        cmd += ["--env-file", env_tmpfile]
-
-    tools_tmpfile = None
-    if tools:
-        tool_sources = [_extract_tool_source(t) for t in tools]
-        tools_tmpfile = tempfile.mktemp(suffix=".tools.json")
-        with open(tools_tmpfile, "w") as f:
-            json.dump(tool_sources, f)
-        cmd += ["--tools-file", tools_tmpfile]
-
-    schema_tmpfile = None
-    if output_schema is not None:
-        schema_dict = _to_json_schema(output_schema)
-        schema_tmpfile = tempfile.mktemp(suffix=".schema.json")
-        with open(schema_tmpfile, "w") as f:
-            json.dump(schema_dict, f)
-        cmd += ["--output-schema-file", schema_tmpfile]
-
-    mcp_tmpfile = None
-    if mcp_servers:
-        if not isinstance(mcp_servers, dict) or not all(
-            isinstance(k, str) and isinstance(v, dict) for k, v in mcp_servers.items()
-        ):
-            raise TypeError("mcp_servers must be a dict[str, dict]")
-        # stdio servers (no 'url') require Deno to spawn subprocesses.
-        if any("url" not in cfg for cfg in mcp_servers.values()):
-            cmd.insert(cmd.index("src/subagents.ts"), "--allow-run")
-        mcp_tmpfile = tempfile.mktemp(suffix=".mcp.json")
-        with open(mcp_tmpfile, "w") as f:
-            json.dump(mcp_servers, f)
-        cmd += ["--mcp-file", mcp_tmpfile]
-
-    llm_kwargs_tmpfile = None
-    if llm_kwargs is not None:
-        if not isinstance(llm_kwargs, dict) or not all(
-            isinstance(k, str) for k in llm_kwargs
-        ):
-            raise TypeError("llm_kwargs must be a dict with string keys")
-        llm_kwargs_tmpfile = tempfile.mktemp(suffix=".llm_kwargs.json")
-        with open(llm_kwargs_tmpfile, "w") as f:
-            json.dump(llm_kwargs, f)
-        cmd += ["--llm-kwargs-file", llm_kwargs_tmpfile]
-
-    # Write the merged+validated config (always present — primary_agent is required)
-    # to a temp file and hand it to the engine.
-    config_tmpfile = tempfile.mktemp(suffix=".yaml")
-    with open(config_tmpfile, "w") as f:
-        yaml.dump(merged_config, f)
-    cmd += ["--config", config_tmpfile]
+    `arun()` always starts a dedicated engine process; it does not use an
+    active `Engine` pool.
+    """
+    _check_deno()
+    spec = _prepare_run(
+        query, prefix, config, verbose, output_schema, tools, env_variables,
+        mcp_servers, llm_kwargs, vertex, instruction, input_file, record, replay,
+        deadline_s,
+    )
 
-    # Vertex AI: signal the Deno engine to use ADC auth
-    run_env = None
-    if vertex:
-        run_env = {**os.environ, "RLM_VERTEX_AI": "1"}
+    engine_dir = _find_engine_dir()
+    output_file = tempfile.mktemp(suffix=".json")
+    cmd, tmpfiles = _one_shot_command(spec, output_file)
 
     try:
-        result = subprocess.run(
-            cmd,
-            input=stdin_payload,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=None if verbose else asyncio.subprocess.PIPE,
+            stderr=None if verbose else asyncio.subprocess.PIPE,
             cwd=str(engine_dir),
-            env=run_env,
-            stdout=None if verbose else subprocess.PIPE,
-            stderr=None if verbose else subprocess.PIPE,
+            env=_engine_env(spec.vertex),
+        )
+        try:
+            _, stderr = await proc.communicate(_stdin_payload(spec))
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.kill()
+                # Reap the child even though this task is being cancelled.
+                await asyncio.shield(proc.wait())
+            raise
+        data = _read_output(
+            output_file,
+            proc.returncode,
+            stderr.decode("utf-8", errors="replace") if stderr else "",
         )
-
-        if not os.path.exists(output_file):
-            stderr = result.stderr or "" if not verbose else ""
-            raise RuntimeError(
-                f"fast-rlm engine failed (exit code {result.returncode}).\n{stderr}"
-            )
-
-        with open(output_file) as f:
-            data = json.load(f)
     finally:
-        if os.path.exists(output_file):
-            os.unlink(output_file)
-        if config_tmpfile and os.path.exists(config_tmpfile):
-            os.unlink(config_tmpfile)
-        if schema_tmpfile and os.path.exists(schema_tmpfile):
-            os.unlink(schema_tmpfile)
-        if tools_tmpfile and os.path.exists(tools_tmpfile):
-            os.unlink(tools_tmpfile)
-        if env_tmpfile and os.path.exists(env_tmpfile):
-            os.unlink(env_tmpfile)
-        if mcp_tmpfile and os.path.exists(mcp_tmpfile):
-            os.unlink(mcp_tmpfile)
-        if llm_kwargs_tmpfile and os.path.exists(llm_kwargs_tmpfile):
-            os.unlink(llm_kwargs_tmpfile)
+        _cleanup([output_file, *tmpfiles])
 
-    if "error" in data:
-        raise RuntimeError(f"fast-rlm subagent failed: {data['error']}")
-
-    return data
+    return _check_result(data)
@@ -0,0 +1,184 @@
+"""Live run events.
+
+`stream()` / `astream()` run one query on a dedicated engine process in
+`--serve` mode with events switched on, and yield the engine Logger's records
+as they happen instead of only the final result. The records are the same
+objects written to the run's JSONL log (plus live-only `usage` deltas), so the
+log viewer's field names apply.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from fast_rlm._pool import SERVE_PREFIX, _EngineProcess, _ids
+from fast_rlm._runner import (
+    RLMConfig,
+    _check_deno,
+    _deno_prefix_cmd,
+    _engine_env,
+    _engine_permissions,
+    _find_engine_dir,
+    _prepare_run,
+)
+
+# Large enough for any single protocol line (events carry REPL output).
+_LINE_LIMIT = 1 << 30
+
+
+def _run_result(msg: dict) -> dict:
+    return {"event_type": "run_result", **msg}
+
+
+def stream(
+    query: "str | dict | list | None" = None,
+    prefix: Optional[str] = None,
+    config: Optional[RLMConfig | dict] = None,
+    verbose: bool = False,
+    output_schema: Optional[Any] = None,
+    tools: Optional[list[Callable]] = None,
+    env_variables: Optional[dict[str, str]] = None,
+    mcp_servers: Optional[dict[str, dict]] = None,
+    llm_kwargs: Optional[dict] = None,
+    vertex: bool = False,
+    instruction: Optional[str] = None,
+    input_file: Optional[str] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> Iterator[dict]:
+    """Run a query and yield its events as they happen.
+
+    Arguments are the same as `run()` (but `verbose` defaults to False). Each
+    event is a dict with ``event_type`` and the emitting agent's ``run_id``,
+    ``parent_run_id`` and ``depth``:
+
+    - ``agent_start`` / ``agent_end``
+    - ``code_generated`` — ``step``, ``code``, ``reasoning``, ``usage``
+    - ``execution_result`` — as above plus ``output`` and ``hasError``
+    - ``final_result`` — ``result`` (every agent, sub-agents included)
+    - ``usage`` — one LLM call's ``usage`` and the run's ``totalUsage``
+    - ``budget_warning`` — ``budget``, ``used``, ``limit`` once a run-wide
+      budget passes 80%
+
+    The last item is ``{"event_type": "run_result", "results", "usage",
+    "log_file"}`` (plus ``"error"`` if the run failed, or ``"partial": True``
+    if its ``deadline_s`` passed). Closing the generator
+    early (``break``) kills the engine and aborts the run.
+    """
+    _check_deno()
+    spec = _prepare_run(
+        query, prefix, config, verbose, output_schema, tools, env_variables,
+        mcp_servers, llm_kwargs, vertex, instruction, input_file, record, replay,
+        deadline_s,
+    )
+    proc = _EngineProcess(
+        vertex=spec.vertex, allow_run=spec.needs_run_permission, verbose=verbose
+    )
+    proc.start()
+    finished = False
+    try:
+        for msg in proc.replies(proc.submit(spec, events=True)):
+            if "event_type" in msg:
+                yield msg
+            else:
+                finished = True
+                yield _run_result(msg)
+    finally:
+        if finished:
+            proc.close()
+        else:
+            proc.kill()
+
+
+async def astream(
+    query: "str | dict | list | None" = None,
+    prefix: Optional[str] = None,
+    config: Optional[RLMConfig | dict] = None,
+    verbose: bool = False,
+    output_schema: Optional[Any] = None,
+    tools: Optional[list[Callable]] = None,
+    env_variables: Optional[dict[str, str]] = None,
+    mcp_servers: Optional[dict[str, dict]] = None,
+    llm_kwargs: Optional[dict] = None,
+    vertex: bool = False,
+    instruction: Optional[str] = None,
+    input_file: Optional[str] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> AsyncIterator[dict]:
+    """Asyncio variant of `stream()`: same arguments, same events.
+
+    ``async for event in fast_rlm.astream(...)``. Breaking out of the loop,
+    closing the iterator or cancelling the consuming task kills the engine.
+    """
+    _check_deno()
+    spec = _prepare_run(
+        query, prefix, config, verbose, output_schema, tools, env_variables,
+        mcp_servers, llm_kwargs, vertex, instruction, input_file, record, replay,
+        deadline_s,
+    )
+    cmd = _deno_prefix_cmd() + ["run"] + _engine_permissions(spec.needs_run_permission) + [
+        "src/subagents.ts",
+        "--serve",
+    ]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=None if verbose else asyncio.subprocess.DEVNULL,
+        cwd=str(_find_engine_dir()),
+        env=_engine_env(spec.vertex),
+        limit=_LINE_LIMIT,
+    )
+
+    async def read() -> Optional[dict]:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                return None
+            text = line.decode("utf-8", errors="replace")
+            if text.startswith(SERVE_PREFIX):
+                return json.loads(text[len(SERVE_PREFIX):])
+
+    finished = False
+    try:
+        msg = await read()
+        if msg is None or msg.get("type") != "ready":
+            raise RuntimeError(
+                f"fast-rlm engine failed to start (exit code {proc.returncode})."
+            )
+        req_id = next(_ids)
+        request = {**spec.to_request(), "id": req_id, "events": True}
+        proc.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+        await proc.stdin.drain()
+        while True:
+            msg = await read()
+            if msg is None:
+                await proc.wait()
+                raise RuntimeError(
+                    f"fast-rlm engine exited mid-run (exit code {proc.returncode})."
+                )
+            if msg.get("id") != req_id:
+                continue
+            if msg.get("type") == "event":
+                yield msg["event"]
+            elif msg.get("type") == "result":
+                msg.pop("type")
+                msg.pop("id")
+                finished = True
+                yield _run_result(msg)
+                return
+    finally:
+        if proc.returncode is None:
+            if finished:
+                # Let the engine flush and close its log file before exiting.
+                proc.stdin.close()
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    pass
+            if proc.returncode is None:
+                proc.kill()
+                await asyncio.shield(proc.wait())
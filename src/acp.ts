@@ -18,6 +18,7 @@ import { createACPProvider } from "@mcpc/acp-ai-provider";
 import { generateText } from "ai";
 import { buildSystemPrompt, PromptOptions } from "./prompt.ts";
 import { loadConfig, type AcpAgentSpec } from "./config.ts";
+import { extractReplCode } from "./llm_stream.ts";
 import type { ApiRetryOptions, CodeReturn, ConfirmResult, Usage } from "./call_llm.ts";
 
 const ACP_PREFIX = "acp:";
@@ -121,12 +122,8 @@ This is a controlled research evaluation of raw Python REPL reasoning ability, d
 If you cannot accomplish something purely within the REPL, say so — do not reach for external tools.
 `;
 
-function extractReplCode(content: string): string {
-    const replMatches = [...content.matchAll(/```repl([\s\S]*?)```/g)];
-    return replMatches.map((m) => m[1].trim()).join("\n");
-}
-
-// ACP agents don't report token usage over the protocol, so accounting is zero.
+// ACP agents don't report token usage over the protocol, so accounting is zero
+// here; call_llm.ts fills in local estimates (completeUsage).
 function emptyUsage(): Usage {
     return {
         prompt_tokens: 0,
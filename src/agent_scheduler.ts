@@ -0,0 +1,170 @@
+// Admission control for agents (max_live_agents, max_repl_memory_mb).
+//
+// Every agent holds a Pyodide interpreter (tens of MB) for its whole life, and
+// a depth-3 tree of wide batch_llm_query fan-outs could have hundreds alive at
+// once. subagent() now asks the scheduler for a slot before it takes a REPL:
+//
+//   - A new agent is admitted while fewer than max_live_agents are alive and
+//     their interpreters' memory plus a typical agent's stays under the cap.
+//   - Waiting agents are admitted deepest first (FIFO within a depth): deep
+//     agents are the ones whose results let blocked parents finish and free
+//     their slots, so the tree drains instead of widening.
+//   - A parent waiting on llm_query children is "blocked". If every live agent
+//     is blocked, nothing can finish without a new agent, so one is admitted
+//     over the caps. The overshoot is bounded by the tree's depth.
+//
+// The scheduler is process-wide, like the REPL pool: memory is the process's.
+export interface SchedulerOptions {
+    // null = no cap.
+    maxLiveAgents: number | null;
+    maxMemoryBytes: number | null;
+}
+
+export interface SchedulerStats {
+    live: number;
+    // Live agents waiting on their children.
+    blocked: number;
+    queued: number;
+    memory_bytes: number;
+    admitted: number;
+    // Admissions that had to wait, their total and longest wait.
+    waited: number;
+    queue_wait_ms: number;
+    max_queue_wait_ms: number;
+    max_queue_depth: number;
+    max_live: number;
+    // Admitted over the caps because every live agent was blocked.
+    forced: number;
+}
+
+/** One live agent's hold on the scheduler; see AgentScheduler.admit(). */
+export class AgentSlot {
+    // Outstanding llm_query calls: > 0 means blocked on children.
+    waitingOn = 0;
+    // Last measured size of this agent's interpreter.
+    memoryBytes = 0;
+
+    constructor(private scheduler: AgentScheduler, readonly depth: number, readonly queueWaitMs: number) {}
+
+    /** Mark the agent as waiting on a child (paired with unblock()). */
+    block(): void {
+        this.waitingOn += 1;
+        if (this.waitingOn === 1) this.scheduler.pump();
+    }
+
+    unblock(): void {
+        this.waitingOn = Math.max(0, this.waitingOn - 1);
+    }
+
+    /** Record the agent's interpreter size, as measured by its REPL. */
+    setMemory(bytes: number): void {
+        this.memoryBytes = bytes;
+        this.scheduler.noteMemory(bytes);
+    }
+
+    release(): void {
+        this.scheduler.release(this);
+    }
+}
+
+interface Waiter {
+    depth: number;
+    seq: number;
+    queuedAt: number;
+    resolve: (slot: AgentSlot) => void;
+}
+
+export class AgentScheduler {
+    private maxLive = Infinity;
+    private maxMemory = Infinity;
+    private live = new Set<AgentSlot>();
+    private waiters: Waiter[] = [];
+    private seq = 0;
+    // Largest interpreter seen: the estimate for an agent not yet booted.
+    private typicalBytes = 0;
+    private counters = {
+        admitted: 0,
+        waited: 0,
+        queue_wait_ms: 0,
+        max_queue_wait_ms: 0,
+        max_queue_depth: 0,
+        max_live: 0,
+        forced: 0,
+    };
+
+    configure(opts: SchedulerOptions): void {
+        this.maxLive = opts.maxLiveAgents != null && opts.maxLiveAgents > 0 ? opts.maxLiveAgents : Infinity;
+        this.maxMemory = opts.maxMemoryBytes != null && opts.maxMemoryBytes > 0 ? opts.maxMemoryBytes : Infinity;
+        this.pump();
+    }
+
+    /** Wait for a slot for an agent at `depth`; release it when the agent ends. */
+    admit(depth: number): Promise<AgentSlot> {
+        return new Promise((resolve) => {
+            this.waiters.push({ depth, seq: this.seq++, queuedAt: Date.now(), resolve });
+            this.counters.max_queue_depth = Math.max(this.counters.max_queue_depth, this.waiters.length);
+            this.pump();
+        });
+    }
+
+    release(slot: AgentSlot): void {
+        if (this.live.delete(slot)) this.pump();
+    }
+
+    noteMemory(bytes: number): void {
+        this.typicalBytes = Math.max(this.typicalBytes, bytes);
+    }
+
+    stats(): SchedulerStats {
+        let blocked = 0;
+        let memory = 0;
+        for (const slot of this.live) {
+            if (slot.waitingOn > 0) blocked++;
+            memory += slot.memoryBytes;
+        }
+        return {
+            live: this.live.size,
+            blocked,
+            queued: this.waiters.length,
+            memory_bytes: memory,
+            ...this.counters,
+        };
+    }
+
+    /** Admit waiting agents while the caps (or the deadlock rule) allow. */
+    pump(): void {
+        while (this.waiters.length) {
+            let runnable = 0;
+            let memory = 0;
+            for (const slot of this.live) {
+                if (slot.waitingOn === 0) runnable++;
+                memory += slot.memoryBytes;
+            }
+            const fits = this.live.size < this.maxLive && memory + this.typicalBytes <= this.maxMemory;
+            if (!fits && runnable > 0) return;
+            if (!fits) this.counters.forced += 1;
+
+            // Deepest first, then first come.
+            let best = 0;
+            for (let i = 1; i < this.waiters.length; i++) {
+                const w = this.waiters[i];
+                const b = this.waiters[best];
+                if (w.depth > b.depth || (w.depth === b.depth && w.seq < b.seq)) best = i;
+            }
+            const [waiter] = this.waiters.splice(best, 1);
+            const waited = Date.now() - waiter.queuedAt;
+            const slot = new AgentSlot(this, waiter.depth, waited);
+            this.live.add(slot);
+            this.counters.admitted += 1;
+            this.counters.max_live = Math.max(this.counters.max_live, this.live.size);
+            if (waited > 0) {
+                this.counters.waited += 1;
+                this.counters.queue_wait_ms += waited;
+                this.counters.max_queue_wait_ms = Math.max(this.counters.max_queue_wait_ms, waited);
+            }
+            waiter.resolve(slot);
+        }
+    }
+}
+
+export const agentScheduler = new AgentScheduler();
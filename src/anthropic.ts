@@ -11,6 +11,9 @@
 import Anthropic from "@anthropic-ai/sdk";
 import { buildSystemPrompt, PromptOptions } from "./prompt.ts";
 import type { ApiRetryOptions, CodeReturn, ConfirmResult, Usage } from "./call_llm.ts";
+import { sharedClient } from "./llm_clients.ts";
+import { type TextBlock, textBlock } from "./prompt_cache.ts";
+import { estimateTokens, extractReplCode, isAbortError, ReplBlockWatcher, type StreamOptions, type StreamTiming } from "./llm_stream.ts";
 
 const DEFAULT_MAX_RETRIES = 3;
 const DEFAULT_TIMEOUT_MS = 600000;
@@ -38,20 +41,24 @@ export function stripAnthropicPrefix(model: string): string {
 
 // fast-rlm messages are OpenAI-shaped {role, content}. Anthropic takes the system
 // prompt as a top-level param (built here, like the other backends) and a
-// user/assistant message list with string content.
+// user/assistant message list of text blocks. Consecutive same-role messages
+// (e.g. the probe followed by a history digest) become one message with a
+// block each, so the probe's block — and its cache breakpoint — stay intact.
+// With `cache`, the probe (first message) and the newest message (if
+// `cacheLast`) are cache breakpoints; see prompt_cache.ts.
 // deno-lint-ignore no-explicit-any
-function toAnthropicMessages(messages: any[]): any[] {
-    return messages
-        .filter((m) => m && m.role !== "system")
-        .map((m) => ({
-            role: m.role === "assistant" ? "assistant" : "user",
-            content: typeof m.content === "string" ? m.content : JSON.stringify(m.content ?? ""),
-        }));
-}
-
-function extractReplCode(content: string): string {
-    const replMatches = [...content.matchAll(/```repl([\s\S]*?)```/g)];
-    return replMatches.map((m) => m[1].trim()).join("\n");
+function toAnthropicMessages(messages: any[], cache = false, cacheLast = false): any[] {
+    const turns = messages.filter((m) => m && m.role !== "system");
+    const out: { role: string; content: TextBlock[] }[] = [];
+    turns.forEach((m, i) => {
+        const role = m.role === "assistant" ? "assistant" : "user";
+        const text = typeof m.content === "string" ? m.content : JSON.stringify(m.content ?? "");
+        const block = textBlock(text, cache && (i === 0 || (cacheLast && i === turns.length - 1)));
+        const last = out[out.length - 1];
+        if (last && last.role === role) last.content.push(block);
+        else out.push({ role, content: [block] });
+    });
+    return out;
 }
 
 // Map Anthropic's split usage onto fast-rlm's Usage. Anthropic separates uncached
@@ -81,14 +88,26 @@ async function anthropicComplete(
     options: ApiRetryOptions | undefined,
     promptOpts: PromptOptions | undefined,
     llmKwargs: Record<string, unknown> | null | undefined,
-): Promise<{ text: string; usage: Usage }> {
+    // Also make the newest message a cache breakpoint (agent steps, which the
+    // next step extends; not the one-off guard question).
+    cacheLast: boolean,
+    stream?: StreamOptions | null,
+): Promise<{ text: string; usage: Usage; timing?: StreamTiming }> {
     const baseURL = anthropicBaseURL();
-    const client = new Anthropic({
-        apiKey: anthropicApiKey(),
+    const key = {
+        backend: "anthropic" as const,
+        baseURL: baseURL ?? "",
+        apiKey: anthropicApiKey() ?? "",
         maxRetries: options?.maxRetries ?? DEFAULT_MAX_RETRIES,
         timeout: options?.timeout ?? DEFAULT_TIMEOUT_MS,
+    };
+    const client = sharedClient(key, (fetch) => new Anthropic({
+        apiKey: key.apiKey,
+        maxRetries: key.maxRetries,
+        timeout: key.timeout,
+        fetch,
         ...(baseURL ? { baseURL } : {}),
-    });
+    }));
 
     // max_tokens is required by the API and not part of the OpenAI llm_kwargs
     // convention, so pull it out of llmKwargs if present and default otherwise.
@@ -96,14 +115,19 @@ async function anthropicComplete(
     const max_tokens = typeof kwargs.max_tokens === "number" ? kwargs.max_tokens as number : DEFAULT_MAX_TOKENS;
     delete kwargs.max_tokens;
 
-    const resp = await client.messages.create({
+    const cache = options?.promptCaching ?? false;
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const params = {
         model: stripAnthropicPrefix(model_name),
         max_tokens,
-        system: buildSystemPrompt(is_leaf_agent, promptOpts ?? {}),
-        messages: toAnthropicMessages(messages),
+        system: cache ? [textBlock(system, true)] : system,
+        messages: toAnthropicMessages(messages, cache, cacheLast),
         ...kwargs,
-        // deno-lint-ignore no-explicit-any
-    } as any);
+    };
+    if (stream) return await anthropicStream(client, params, stream);
+
+    // deno-lint-ignore no-explicit-any
+    const resp = await client.messages.create(params as any, options?.signal ? { signal: options.signal } : undefined);
 
     // deno-lint-ignore no-explicit-any
     const text = (resp.content as any[])
@@ -113,6 +137,65 @@ async function anthropicComplete(
     return { text, usage: mapUsage(resp.usage) };
 }
 
+// Streamed Messages API turn (stream_completions): input tokens arrive with
+// message_start, text as deltas; the request is cut off once the first repl
+// block closes or the budget check trips. Output tokens are estimated when the
+// final message_delta (which carries them) never arrives.
+async function anthropicStream(
+    client: Anthropic,
+    params: Record<string, unknown>,
+    stream: StreamOptions,
+): Promise<{ text: string; usage: Usage; timing: StreamTiming }> {
+    const events = await client.messages.create(
+        // deno-lint-ignore no-explicit-any
+        { ...params, stream: true } as any,
+        stream.signal ? { signal: stream.signal } : undefined,
+        // deno-lint-ignore no-explicit-any
+    ) as any;
+    const watcher = new ReplBlockWatcher();
+    // deno-lint-ignore no-explicit-any
+    let startUsage: any = null;
+    let outputTokens: number | null = null;
+    const timing: StreamTiming = { early_stop: false, budget_stop: false };
+    // Summed per delta: re-estimating the whole text each time is quadratic.
+    let estimated = 0;
+    try {
+        for await (const event of events) {
+            if (event.type === "message_start") {
+                startUsage = event.message?.usage ?? null;
+            } else if (event.type === "message_delta") {
+                outputTokens = event.usage?.output_tokens ?? outputTokens;
+            } else if (event.type === "content_block_delta") {
+                const delta = event.delta;
+                const text = delta?.type === "text_delta" ? delta.text as string : "";
+                if ((text || delta?.type === "thinking_delta") && !timing.first_token_at) {
+                    timing.first_token_at = new Date().toISOString();
+                }
+                if (!text) continue;
+                estimated += estimateTokens(text);
+                const end = watcher.push(text);
+                if (end >= 0) {
+                    watcher.text = watcher.text.slice(0, end);
+                    timing.early_stop = true;
+                } else if (stream.overBudget?.(estimated)) {
+                    timing.budget_stop = true;
+                }
+                if (timing.early_stop || timing.budget_stop) {
+                    events.controller.abort();
+                    break;
+                }
+            }
+        }
+    } catch (error) {
+        if (!(timing.early_stop || timing.budget_stop) || !isAbortError(error)) throw error;
+    }
+    const usage = mapUsage({
+        ...(startUsage ?? {}),
+        output_tokens: outputTokens ?? estimateTokens(watcher.text),
+    });
+    return { text: watcher.text, usage, timing };
+}
+
 // Drop-in for generate_code when model_name is a Claude model with a key set.
 // Throws on failure so call_llm.ts can fall back to the OpenAI/OpenRouter path.
 export async function generateAnthropicCode(
@@ -122,11 +205,14 @@ export async function generateAnthropicCode(
     options?: ApiRetryOptions,
     promptOpts?: PromptOptions,
     llmKwargs?: Record<string, unknown> | null,
+    stream?: StreamOptions | null,
 ): Promise<CodeReturn> {
-    const { text, usage } = await anthropicComplete(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+    const { text, usage, timing } = await anthropicComplete(
+        messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, true, stream,
+    );
     const code = extractReplCode(text);
     const message = { role: "assistant", content: text };
-    return { code, success: !!code, message, usage };
+    return { code, success: !!code, message, usage, ...(timing ? { timing } : {}) };
 }
 
 // Drop-in for confirmDelegation (compression guard) when model_name is Claude.
@@ -140,7 +226,9 @@ export async function confirmAnthropicDelegation(
     llmKwargs?: Record<string, unknown> | null,
 ): Promise<ConfirmResult> {
     const messages = [...baseMessages, { role: "user", content: confirmQuestion }];
-    const { text, usage } = await anthropicComplete(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+    const { text, usage } = await anthropicComplete(
+        messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, false,
+    );
     const content = text.trim();
     // Fail-open: only an explicit "NO" (as the first word) rejects.
     const firstWord = content.replace(/^[^a-zA-Z]+/, "").slice(0, 4).toUpperCase();
@@ -0,0 +1,122 @@
+// Hierarchical budget reservations (budget_reservations).
+//
+// The run's budgets (max_money_spent, max_prompt_tokens,
+// max_completion_tokens) were checked against the run total after each call
+// returned. A batch_llm_query of 20 children all passed the check together,
+// so the run overshot by 20 calls' worth. Each agent now spends from its own
+// budget node:
+//
+//   - The root's node holds the run's budgets.
+//   - Starting a child carves a grant out of the parent's remaining budget:
+//     llm_query(..., budget=...) if given, else an even share among the
+//     batch's children. A tenth of the parent's own limit is held back so it
+//     can still finish after its children spend their grants.
+//   - Calls are checked against the agent's node before they are sent (the
+//     estimated prompt must fit), and a streamed completion is cut off where
+//     it would run past what is left.
+//   - When a child ends, its grant is returned and what it actually spent is
+//     charged to the parent: unused budget flows back.
+//
+// Siblings can't spend each other's grants, so overshoot no longer grows with
+// the fan-out: it is bounded by the estimation error of the calls in flight.
+import type { Usage } from "./call_llm.ts";
+
+export interface BudgetAmounts {
+    // USD; only calls with a known cost count (see pricing.ts).
+    money: number;
+    prompt_tokens: number;
+    completion_tokens: number;
+}
+
+const DIMENSIONS = ["money", "prompt_tokens", "completion_tokens"] as const;
+
+// Share of its own limit a parent keeps back from its children's grants.
+const PARENT_HOLDBACK = 0.1;
+
+function amounts(f: (key: keyof BudgetAmounts) => number): BudgetAmounts {
+    return { money: f("money"), prompt_tokens: f("prompt_tokens"), completion_tokens: f("completion_tokens") };
+}
+
+/** Parse llm_query's `budget` argument (as it arrives over the bridge). */
+export function parseBudgetRequest(value: unknown): Partial<BudgetAmounts> | null {
+    if (value == null) return null;
+    if (typeof value === "number" && value >= 0) return { money: value };
+    if (typeof value === "object" && !Array.isArray(value)) {
+        const out: Partial<BudgetAmounts> = {};
+        for (const [key, v] of Object.entries(value as Record<string, unknown>)) {
+            if (!(DIMENSIONS as readonly string[]).includes(key) || typeof v !== "number" || v < 0) {
+                throw new Error(
+                    `llm_query budget: ${key}=${JSON.stringify(v)} is not valid; expected non-negative numbers ` +
+                    `for money, prompt_tokens and/or completion_tokens`,
+                );
+            }
+            out[key as keyof BudgetAmounts] = v;
+        }
+        return out;
+    }
+    throw new Error(
+        `llm_query budget must be a number (USD) or a dict of money/prompt_tokens/completion_tokens, got ${typeof value}`,
+    );
+}
+
+export class BudgetNode {
+    private spent: BudgetAmounts = amounts(() => 0);
+    // Outstanding grants to children that haven't ended yet.
+    private granted: BudgetAmounts = amounts(() => 0);
+    private closed = false;
+
+    constructor(readonly limit: BudgetAmounts, private parent: BudgetNode | null = null) {}
+
+    /** Limit less what was spent and what is granted to live children. */
+    available(): BudgetAmounts {
+        return amounts((k) => this.limit[k] - this.spent[k] - this.granted[k]);
+    }
+
+    charge(usage: Usage): void {
+        this.spent.money += usage.cost ?? 0;
+        this.spent.prompt_tokens += usage.prompt_tokens || 0;
+        this.spent.completion_tokens += usage.completion_tokens || 0;
+    }
+
+    /**
+     * Carve a child's budget: `cap` where given, else an even share among the
+     * `share` children still to start (this one included). Throws when a
+     * dimension has nothing left to give.
+     */
+    grant(cap: Partial<BudgetAmounts> | null, share = 1): BudgetNode {
+        const avail = this.available();
+        const limit = amounts((k) => {
+            if (!Number.isFinite(this.limit[k])) return cap?.[k] ?? Infinity;
+            const spendable = Math.max(0, avail[k] - PARENT_HOLDBACK * this.limit[k]);
+            return cap?.[k] != null ? Math.min(cap[k]!, spendable) : spendable / Math.max(1, share);
+        });
+        for (const k of DIMENSIONS) {
+            if (limit[k] <= 0 && (Number.isFinite(this.limit[k]) || cap?.[k] != null)) {
+                throw new Error(
+                    `Budget exhausted: no ${k.replace("_", " ")} budget left for a sub-agent ` +
+                    `(${Math.max(0, avail[k]).toLocaleString()} remaining, part of it held back for this agent). ` +
+                    `Finish with what you have.`,
+                );
+            }
+        }
+        for (const k of DIMENSIONS) {
+            if (Number.isFinite(limit[k])) this.granted[k] += limit[k];
+        }
+        return new BudgetNode(limit, this);
+    }
+
+    /** The child ended: return its grant and charge its spend to the parent. */
+    close(): void {
+        if (this.closed || !this.parent) return;
+        this.closed = true;
+        for (const k of DIMENSIONS) {
+            if (Number.isFinite(this.limit[k])) this.parent.granted[k] -= this.limit[k];
+            this.parent.spent[k] += this.spent[k];
+        }
+    }
+
+    /** The finite limits, for logging. */
+    finiteLimits(): Partial<BudgetAmounts> {
+        return Object.fromEntries(DIMENSIONS.filter((k) => Number.isFinite(this.limit[k])).map((k) => [k, this.limit[k]]));
+    }
+}
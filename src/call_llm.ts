@@ -1,9 +1,33 @@
 import { OpenAI } from "openai";
 import chalk from "npm:chalk@5";
 import { buildSystemPrompt, PromptOptions } from "./prompt.ts";
-import { createVertexClient, refreshVertexClient, isVertexModel, stripVertexPrefix } from "./vertex.ts";
+import { getVertexClient, getVertexEndpoint, isVertexModel, stripVertexPrefix } from "./vertex.ts";
 import { confirmAcpDelegation, generateAcpCode, isAcpModel } from "./acp.ts";
-import { anthropicApiKey, confirmAnthropicDelegation, generateAnthropicCode, isAnthropicModel } from "./anthropic.ts";
+import { confirmMockDelegation, generateMockCode, isMockModel } from "./mock.ts";
+import {
+    anthropicApiKey,
+    anthropicBaseURL,
+    confirmAnthropicDelegation,
+    generateAnthropicCode,
+    isAnthropicModel,
+} from "./anthropic.ts";
+import { prewarmConnections, sharedClient } from "./llm_clients.ts";
+import { addOpenAICacheHints } from "./prompt_cache.ts";
+import { responseCache } from "./response_cache.ts";
+import { type LimitedBackend, rateLimited } from "./rate_limit.ts";
+import { type HedgeOutcome, type HedgePolicy, hedged } from "./hedging.ts";
+import { endpointPool, type EndpointSpec } from "./endpoint_pool.ts";
+import { withCost } from "./pricing.ts";
+import { emptyUsage } from "./usage.ts";
+import {
+    estimatePromptTokens,
+    estimateTokens,
+    extractReplCode,
+    isAbortError,
+    ReplBlockWatcher,
+    type StreamOptions,
+    type StreamTiming,
+} from "./llm_stream.ts";
 
 const DEFAULT_MAX_RETRIES = 3;
 const DEFAULT_TIMEOUT_MS = 600000;
@@ -11,6 +35,12 @@ const DEFAULT_TIMEOUT_MS = 600000;
 export interface ApiRetryOptions {
     maxRetries?: number;
     timeout?: number;
+    // Send provider prompt-cache hints (prompt_caching; see prompt_cache.ts).
+    promptCaching?: boolean;
+    // Duplicate slow generate_code calls (hedge_requests; see hedging.ts).
+    hedge?: HedgePolicy | null;
+    // Cancels the request (hedging cancels the losing call through it).
+    signal?: AbortSignal | null;
 }
 
 export interface Usage {
@@ -27,6 +57,14 @@ export interface CodeReturn {
     success: boolean;
     message: any;
     usage: Usage;
+    // Streamed calls only: time to first token and why the stream stopped.
+    timing?: StreamTiming;
+    // Set when response_cache is on: served from the cache or not.
+    cache_hit?: boolean;
+    // When the provider request left the rate limiter's queue (rate_limit.ts).
+    request_start?: string;
+    // Set when the call was hedged: which of the two calls won (hedging.ts).
+    hedge?: HedgeOutcome;
 }
 
 // The default backend is any OpenAI-compatible API (OpenAI, DeepSeek, OpenRouter,
@@ -51,15 +89,196 @@ function requireModelApiKey(): string {
             "via RLM_MODEL_BASE_URL.\n" +
             "For Vertex AI, set RLM_VERTEX_AI=1 and GOOGLE_CLOUD_PROJECT instead.\n" +
             "For Anthropic models, set ANTHROPIC_API_KEY instead.\n" +
-            "(ACP agents such as acp:opencode need no API key.)",
+            "(ACP agents such as acp:opencode and mock:* models need no API key.)",
         );
     }
     return apiKey;
 }
 
-let vertexClient: OpenAI | null = null;
+// Runs `call` with the (shared, keep-alive) client and provider model id for
+// model_name on the OpenAI-compatible path: Vertex AI, the model's endpoint
+// pool (endpoint_pool.ts), or RLM_MODEL_BASE_URL. `endpoint` is the base URL
+// for cache hints; null for Vertex, which caches implicitly.
+async function withOpenAIClient<T>(
+    model_name: string,
+    options: ApiRetryOptions | undefined,
+    signal: AbortSignal | null | undefined,
+    call: (client: OpenAI, resolvedModel: string, endpoint: string | null) => Promise<T>,
+): Promise<T> {
+    const maxRetries = options?.maxRetries ?? DEFAULT_MAX_RETRIES;
+    const timeout = options?.timeout ?? DEFAULT_TIMEOUT_MS;
+    if (isVertexModel(model_name) || vertexMode) {
+        const client = await getVertexClient({ maxRetries, timeout });
+        return call(client, isVertexModel(model_name) ? stripVertexPrefix(model_name) : model_name, null);
+    }
+    const pool = endpointPool(model_name);
+    if (!pool) {
+        return call(openaiClientFor(baseURL, requireModelApiKey(), maxRetries, timeout), model_name, baseURL);
+    }
+    return pool.run(signal, ({ spec }) => call(
+        openaiClientFor(spec.base_url, endpointApiKey(spec), maxRetries, timeout),
+        spec.model || model_name,
+        spec.base_url,
+    ));
+}
 
+function openaiClientFor(url: string, key: string, maxRetries: number, timeout: number): OpenAI {
+    return sharedClient({ backend: "openai", baseURL: url, apiKey: key, maxRetries, timeout }, (fetch) =>
+        new OpenAI({ apiKey: key, baseURL: url, maxRetries, timeout, fetch }));
+}
+
+// A pool endpoint's key: its own, its env var's, else the default key. Local
+// servers (vLLM, llama.cpp) take any key, so none at all is not an error.
+function endpointApiKey(spec: EndpointSpec): string {
+    if (spec.api_key) return spec.api_key;
+    if (spec.api_key_env) {
+        const key = Deno.env.get(spec.api_key_env);
+        if (!key) throw new Error(`Endpoint ${spec.base_url}: ${spec.api_key_env} is not set`);
+        return key;
+    }
+    return apiKey ?? "EMPTY";
+}
+
+// Every provider call goes through its backend's limiter (rate_limit.ts),
+// which also owns retries: `call` gets the options with SDK retries off.
+function limited<T extends { usage: Usage }>(
+    backend: LimitedBackend,
+    model_name: string,
+    system: string,
+    // deno-lint-ignore no-explicit-any
+    promptMessages: any[],
+    options: ApiRetryOptions | undefined,
+    signal: AbortSignal | null | undefined,
+    call: (options: ApiRetryOptions) => Promise<T>,
+): Promise<T & { request_start: string }> {
+    return rateLimited(
+        backend, model_name, estimatePromptTokens(system, promptMessages),
+        options?.maxRetries ?? DEFAULT_MAX_RETRIES, signal,
+        () => call({ ...options, maxRetries: 0 }),
+    );
+}
+
+function openaiBackend(model_name: string): LimitedBackend {
+    return isVertexModel(model_name) || vertexMode ? "vertex" : "openai";
+}
+
+/**
+ * Open connections to the endpoints `models` will call, ahead of the first
+ * step (prewarm_connections). Best-effort; ACP agents have no endpoint.
+ */
+export async function prewarmModelConnections(models: string[]): Promise<void> {
+    const urls = new Set<string>();
+    for (const model of models) {
+        if (isAcpModel(model) || isMockModel(model)) continue;
+        try {
+            if (isVertexModel(model) || vertexMode) {
+                urls.add(getVertexEndpoint());
+            } else if (isAnthropicModel(model) && anthropicApiKey()) {
+                urls.add(anthropicBaseURL() ?? "https://api.anthropic.com");
+            } else {
+                const pool = endpointPool(model);
+                if (pool) pool.endpoints.forEach((e) => urls.add(e.spec.base_url));
+                else urls.add(baseURL);
+            }
+        } catch {
+            // Misconfigured backend; the first real call reports it.
+        }
+    }
+    await prewarmConnections([...urls]);
+}
+
+// Checked before every generate_code / confirmDelegation call on any backend
+// when response_cache is on (response_cache.ts). A hit costs nothing, so it
+// reports zero usage; `cache_hit` tells the caller which it was.
 export async function generate_code(
+    messages: any[],
+    model_name: string,
+    is_leaf_agent: boolean = false,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    llmKwargs?: Record<string, unknown> | null,
+    stream?: StreamOptions | null,
+): Promise<CodeReturn> {
+    if (!responseCache.active) {
+        return generateCodeHedged(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, stream);
+    }
+    const key = await responseCache.key({
+        kind: "code",
+        model: model_name,
+        system: buildSystemPrompt(is_leaf_agent, promptOpts ?? {}),
+        messages,
+        llm_kwargs: llmKwargs ?? null,
+    });
+    const hit = await responseCache.get<CodeReturn>(key);
+    if (hit) return { ...hit, usage: emptyUsage(), cache_hit: true };
+    const out = await generateCodeHedged(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, stream);
+    // A reply cut short by the budget check isn't what the request produces.
+    if (!out.timing?.budget_stop) {
+        const { timing: _timing, request_start: _start, hedge: _hedge, ...stored } = out;
+        await responseCache.put(key, stored);
+    }
+    return { ...out, cache_hit: false };
+}
+
+// generate_code under the run's hedging policy, if any (hedging.ts). ACP
+// agents aren't hedged: their sessions can't be cancelled mid-turn.
+function generateCodeHedged(
+    messages: any[],
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    llmKwargs?: Record<string, unknown> | null,
+    stream?: StreamOptions | null,
+): Promise<CodeReturn> {
+    if (!options?.hedge || isAcpModel(model_name)) {
+        return generateCodeUncached(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, stream);
+    }
+    return hedged(
+        model_name,
+        options.hedge,
+        stream?.signal ?? options.signal,
+        (model, signal) => generateCodeUncached(
+            messages, model, is_leaf_agent, { ...options, signal }, promptOpts, llmKwargs,
+            stream ? { ...stream, signal } : null,
+        ),
+        // A call cancelled before it reported usage: its prompt was still sent.
+        (model) => {
+            const prompt = estimatePromptTokens(buildSystemPrompt(is_leaf_agent, promptOpts ?? {}), messages);
+            return withCost(model, { ...emptyUsage(), prompt_tokens: prompt, total_tokens: prompt });
+        },
+    );
+}
+
+// One generate_code call, with its usage completed (completeUsage).
+async function generateCodeUncached(
+    messages: any[],
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    llmKwargs?: Record<string, unknown> | null,
+    stream?: StreamOptions | null,
+): Promise<CodeReturn> {
+    const out = await generateCodeCall(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs, stream);
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    return { ...out, usage: completeUsage(model_name, out.usage, system, messages, String(out.message?.content ?? "")) };
+}
+
+// Fills in what a provider left out of a call's usage: ACP agents report no
+// tokens, so theirs are estimated locally, and a missing cost comes from the
+// pricing table (pricing.ts).
+// deno-lint-ignore no-explicit-any
+function completeUsage(model_name: string, usage: Usage, system: string, promptMessages: any[], reply: string): Usage {
+    if (isAcpModel(model_name) && usage.total_tokens === 0) {
+        const prompt = estimatePromptTokens(system, promptMessages);
+        const completion = estimateTokens(reply);
+        usage = { ...usage, prompt_tokens: prompt, completion_tokens: completion, total_tokens: prompt + completion };
+    }
+    return withCost(model_name, usage);
+}
+
+async function generateCodeCall(
     messages: any[],
     model_name: string,
     is_leaf_agent: boolean = false,
@@ -67,89 +286,86 @@ export async function generate_code(
     promptOpts?: PromptOptions,
     // Arbitrary extra params (temperature, top_p, seed, ...) spread into the
     // chat.completions.create call. Passed end-to-end from run(llm_kwargs=...).
-    llmKwargs?: Record<string, unknown> | null
+    llmKwargs?: Record<string, unknown> | null,
+    // Set (stream_completions) to stream the completion and stop it after the
+    // first closed repl block; see llm_stream.ts.
+    stream?: StreamOptions | null,
 ): Promise<CodeReturn> {
     // ACP agents (e.g. "acp:codex") are a separate backend — see acp.ts.
     if (isAcpModel(model_name)) {
         return generateAcpCode(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
     }
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const signal = stream?.signal ?? options?.signal;
+    // Scripted mock models for load tests ("mock:fanout") — see mock.ts.
+    if (isMockModel(model_name)) {
+        return limited("mock", model_name, system, messages, options, signal, (opts) =>
+            generateMockCode(messages, model_name, is_leaf_agent, opts, promptOpts, llmKwargs, stream));
+    }
 
     // Claude models prefer the native Anthropic API (anthropic.ts) when a key is
     // set; on any failure fall through to the OpenAI/OpenRouter path below with the
     // original model string. Explicit Vertex (prefix or RLM_VERTEX_AI) wins.
     if (isAnthropicModel(model_name) && anthropicApiKey() && !isVertexModel(model_name) && !vertexMode) {
         try {
-            return await generateAnthropicCode(messages, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+            return await limited("anthropic", model_name, system, messages, options, signal, (opts) =>
+                generateAnthropicCode(messages, model_name, is_leaf_agent, opts, promptOpts, llmKwargs, stream));
         } catch (error) {
+            // Cancelled (run cancelled, or a hedge that lost): don't fall back.
+            if (signal?.aborted) throw error;
             const msg = error instanceof Error ? error.message : String(error);
             console.error(chalk.yellow(`⚠ Anthropic endpoint unavailable (${msg}); falling back to ${baseURL}`));
         }
     }
 
-    const maxRetries = options?.maxRetries ?? DEFAULT_MAX_RETRIES;
-    const timeout = options?.timeout ?? DEFAULT_TIMEOUT_MS;
+    try {
+        return await limited(openaiBackend(model_name), model_name, system, messages, options, signal, (opts) =>
+            withOpenAIClient(model_name, opts, signal, async (client, resolvedModel, endpoint): Promise<CodeReturn> => {
+                // deno-lint-ignore no-explicit-any
+                const createParams: any = {
+                    model: resolvedModel,
+                    messages: [
+                        { role: "system", content: system },
+                        ...messages
+                    ],
+                    ...(llmKwargs ?? {}),
+                };
+                if (opts.promptCaching && endpoint) {
+                    addOpenAICacheHints(createParams, endpoint, resolvedModel, true);
+                }
+                if (stream) {
+                    return await streamCode(client, createParams, stream);
+                }
+                const completion = await client.chat.completions.create(createParams, signal ? { signal } : undefined);
 
-    let client: OpenAI;
-    let resolvedModel = model_name;
+                const content = completion.choices[0].message.content || "";
+                const code = extractReplCode(content);
 
-    if (isVertexModel(model_name) || vertexMode) {
-        resolvedModel = isVertexModel(model_name) ? stripVertexPrefix(model_name) : model_name;
-        if (!vertexClient) {
-            vertexClient = await createVertexClient({ maxRetries, timeout });
-        } else {
-            vertexClient = await refreshVertexClient(vertexClient, { maxRetries, timeout });
-        }
-        client = vertexClient;
-    } else {
-        client = new OpenAI({
-            apiKey: requireModelApiKey(),
-            baseURL,
-            maxRetries: maxRetries,
-            timeout: timeout,
-        });
-    }
+                const usage: Usage = {
+                    prompt_tokens: completion.usage?.prompt_tokens ?? 0,
+                    completion_tokens: completion.usage?.completion_tokens ?? 0,
+                    total_tokens: completion.usage?.total_tokens ?? 0,
+                    cached_tokens: completion.usage?.prompt_tokens_details?.cached_tokens ?? 0,
+                    reasoning_tokens: completion.usage?.completion_tokens_details?.reasoning_tokens ?? 0,
+                    cost: (completion.usage as any)?.cost ?? undefined,
+                };
 
-    try {
-        // deno-lint-ignore no-explicit-any
-        const createParams: any = {
-            model: resolvedModel,
-            messages: [
-                { role: "system", content: buildSystemPrompt(is_leaf_agent, promptOpts ?? {}) },
-                ...messages
-            ],
-            ...(llmKwargs ?? {}),
-        };
-        const completion = await client.chat.completions.create(createParams);
-
-        const content = completion.choices[0].message.content || "";
-
-        const replMatches = [...content.matchAll(/```repl([\s\S]*?)```/g)];
-        let code = replMatches.map(m => m[1].trim()).join("\n");
-
-        const usage: Usage = {
-            prompt_tokens: completion.usage?.prompt_tokens ?? 0,
-            completion_tokens: completion.usage?.completion_tokens ?? 0,
-            total_tokens: completion.usage?.total_tokens ?? 0,
-            cached_tokens: completion.usage?.prompt_tokens_details?.cached_tokens ?? 0,
-            reasoning_tokens: completion.usage?.completion_tokens_details?.reasoning_tokens ?? 0,
-            cost: (completion.usage as any)?.cost ?? undefined,
-        };
-
-        if (!code) {
-            return {
-                code: "",
-                success: false,
-                message: completion.choices[0].message,
-                usage,
-            };
-        }
+                if (!code) {
+                    return {
+                        code: "",
+                        success: false,
+                        message: completion.choices[0].message,
+                        usage,
+                    };
+                }
 
-        return {
-            code,
-            success: true,
-            message: completion.choices[0].message,
-            usage,
-        };
+                return {
+                    code,
+                    success: true,
+                    message: completion.choices[0].message,
+                    usage,
+                };
+            }));
     } catch (error) {
         const msg = error instanceof Error ? error.message : String(error);
         console.error(chalk.red(`✖ API call failed: ${msg}`));
@@ -157,10 +373,95 @@ export async function generate_code(
     }
 }
 
+// Streamed variant of the OpenAI-compatible call in generate_code: stops the
+// request once the first repl block closes (or the budget check trips) and
+// estimates usage when the provider's final usage chunk never arrives.
+async function streamCode(
+    client: OpenAI,
+    // deno-lint-ignore no-explicit-any
+    createParams: any,
+    stream: StreamOptions,
+): Promise<CodeReturn> {
+    const completion = await client.chat.completions.create(
+        { ...createParams, stream: true, stream_options: { include_usage: true } },
+        stream.signal ? { signal: stream.signal } : undefined,
+    );
+    const watcher = new ReplBlockWatcher();
+    let reasoning = "";
+    // deno-lint-ignore no-explicit-any
+    let reported: any = null;
+    const timing: StreamTiming = { early_stop: false, budget_stop: false };
+    // Summed per delta: re-estimating the whole text each time is quadratic.
+    let estimated = 0;
+    try {
+        for await (const chunk of completion) {
+            if (chunk.usage) reported = chunk.usage;
+            // deno-lint-ignore no-explicit-any
+            const delta = chunk.choices?.[0]?.delta as any;
+            // OpenRouter streams `reasoning`, DeepSeek `reasoning_content`.
+            const thought = delta?.reasoning ?? delta?.reasoning_content;
+            if (typeof thought === "string" && thought) {
+                reasoning += thought;
+                estimated += estimateTokens(thought);
+            }
+            const text = typeof delta?.content === "string" ? delta.content : "";
+            if ((text || thought) && !timing.first_token_at) timing.first_token_at = new Date().toISOString();
+            if (!text) continue;
+            estimated += estimateTokens(text);
+            const end = watcher.push(text);
+            if (end >= 0) {
+                watcher.text = watcher.text.slice(0, end);
+                timing.early_stop = true;
+            } else if (stream.overBudget?.(estimated)) {
+                timing.budget_stop = true;
+            }
+            if (timing.early_stop || timing.budget_stop) {
+                completion.controller.abort();
+                break;
+            }
+        }
+    } catch (error) {
+        if (!(timing.early_stop || timing.budget_stop) || !isAbortError(error)) throw error;
+    }
+
+    const content = watcher.text;
+    const code = extractReplCode(content);
+    const usage: Usage = reported
+        ? {
+            prompt_tokens: reported.prompt_tokens ?? 0,
+            completion_tokens: reported.completion_tokens ?? 0,
+            total_tokens: reported.total_tokens ?? 0,
+            cached_tokens: reported.prompt_tokens_details?.cached_tokens ?? 0,
+            reasoning_tokens: reported.completion_tokens_details?.reasoning_tokens ?? 0,
+            cost: reported.cost ?? undefined,
+        }
+        : estimatedUsage(createParams.messages, content, reasoning);
+    const message = { role: "assistant", content, ...(reasoning ? { reasoning } : {}) };
+    return { code, success: !!code, message, usage, timing };
+}
+
+// Usage for a stream stopped before the provider reported it. The cost is
+// filled in from the pricing table afterwards (completeUsage).
+// deno-lint-ignore no-explicit-any
+function estimatedUsage(promptMessages: any[], content: string, reasoning: string): Usage {
+    const prompt = estimatePromptTokens("", promptMessages);
+    const completion = estimateTokens(content + reasoning);
+    return {
+        prompt_tokens: prompt,
+        completion_tokens: completion,
+        total_tokens: prompt + completion,
+        cached_tokens: 0,
+        reasoning_tokens: estimateTokens(reasoning),
+        cost: undefined,
+    };
+}
+
 export interface ConfirmResult {
     approve: boolean;
     reason: string;
     usage: Usage;
+    // Set when response_cache is on: served from the cache or not.
+    cache_hit?: boolean;
 }
 
 /**
@@ -177,67 +478,99 @@ export async function confirmDelegation(
     options?: ApiRetryOptions,
     promptOpts?: PromptOptions,
     llmKwargs?: Record<string, unknown> | null
+): Promise<ConfirmResult> {
+    if (!responseCache.active) {
+        return confirmDelegationUncached(
+            baseMessages, confirmQuestion, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+    }
+    const key = await responseCache.key({
+        kind: "confirm",
+        model: model_name,
+        system: buildSystemPrompt(is_leaf_agent, promptOpts ?? {}),
+        messages: baseMessages,
+        question: confirmQuestion,
+        llm_kwargs: llmKwargs ?? null,
+    });
+    const hit = await responseCache.get<ConfirmResult>(key);
+    if (hit) return { ...hit, usage: emptyUsage(), cache_hit: true };
+    const out = await confirmDelegationUncached(
+        baseMessages, confirmQuestion, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+    await responseCache.put(key, out);
+    return { ...out, cache_hit: false };
+}
+
+// One confirmation call, with its usage completed (completeUsage).
+async function confirmDelegationUncached(
+    baseMessages: any[],
+    confirmQuestion: string,
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    llmKwargs?: Record<string, unknown> | null
+): Promise<ConfirmResult> {
+    const out = await confirmDelegationCall(
+        baseMessages, confirmQuestion, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const promptMessages = [...baseMessages, { role: "user", content: confirmQuestion }];
+    return { ...out, usage: completeUsage(model_name, out.usage, system, promptMessages, out.reason) };
+}
+
+async function confirmDelegationCall(
+    baseMessages: any[],
+    confirmQuestion: string,
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    llmKwargs?: Record<string, unknown> | null
 ): Promise<ConfirmResult> {
     if (isAcpModel(model_name)) {
         return confirmAcpDelegation(baseMessages, confirmQuestion, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
     }
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const promptMessages = [...baseMessages, { role: "user", content: confirmQuestion }];
+    // The agent's deadline / run cancellation, as for generate_code.
+    const signal = options?.signal;
+    if (isMockModel(model_name)) {
+        return limited("mock", model_name, system, promptMessages, options, signal, (opts) =>
+            confirmMockDelegation(baseMessages, confirmQuestion, model_name, is_leaf_agent, opts, promptOpts, llmKwargs));
+    }
 
     if (isAnthropicModel(model_name) && anthropicApiKey() && !isVertexModel(model_name) && !vertexMode) {
         try {
-            return await confirmAnthropicDelegation(baseMessages, confirmQuestion, model_name, is_leaf_agent, options, promptOpts, llmKwargs);
+            return await limited("anthropic", model_name, system, promptMessages, options, signal, (opts) =>
+                confirmAnthropicDelegation(baseMessages, confirmQuestion, model_name, is_leaf_agent, opts, promptOpts, llmKwargs));
         } catch (error) {
+            // Cancelled (deadline or run cancelled): don't fall back.
+            if (signal?.aborted) throw error;
             const msg = error instanceof Error ? error.message : String(error);
             console.error(chalk.yellow(`⚠ Anthropic endpoint unavailable (${msg}); falling back to ${baseURL}`));
         }
     }
 
-    let client: OpenAI;
-    let resolvedModel = model_name;
-
-    if (isVertexModel(model_name) || vertexMode) {
-        resolvedModel = isVertexModel(model_name) ? stripVertexPrefix(model_name) : model_name;
-        if (!vertexClient) {
-            vertexClient = await createVertexClient({
-                maxRetries: options?.maxRetries ?? DEFAULT_MAX_RETRIES,
-                timeout: options?.timeout ?? DEFAULT_TIMEOUT_MS,
-            });
-        } else {
-            vertexClient = await refreshVertexClient(vertexClient, {
-                maxRetries: options?.maxRetries ?? DEFAULT_MAX_RETRIES,
-                timeout: options?.timeout ?? DEFAULT_TIMEOUT_MS,
-            });
-        }
-        client = vertexClient;
-    } else {
-        client = new OpenAI({
-            apiKey: requireModelApiKey(),
-            baseURL,
-            maxRetries: options?.maxRetries ?? DEFAULT_MAX_RETRIES,
-            timeout: options?.timeout ?? DEFAULT_TIMEOUT_MS,
-        });
-    }
-
-    // deno-lint-ignore no-explicit-any
-    const createParams: any = {
-        model: resolvedModel,
-        messages: [
-            { role: "system", content: buildSystemPrompt(is_leaf_agent, promptOpts ?? {}) },
-            ...baseMessages,
-            { role: "user", content: confirmQuestion },
-        ],
-        ...(llmKwargs ?? {}),
-    };
-    const completion = await client.chat.completions.create(createParams);
-    const content = (completion.choices[0].message.content || "").trim();
-
-    const usage: Usage = {
-        prompt_tokens: completion.usage?.prompt_tokens ?? 0,
-        completion_tokens: completion.usage?.completion_tokens ?? 0,
-        total_tokens: completion.usage?.total_tokens ?? 0,
-        cached_tokens: completion.usage?.prompt_tokens_details?.cached_tokens ?? 0,
-        reasoning_tokens: completion.usage?.completion_tokens_details?.reasoning_tokens ?? 0,
-        cost: (completion.usage as any)?.cost ?? undefined,
-    };
+    const { content, usage } = await limited(openaiBackend(model_name), model_name, system, promptMessages, options, signal, (opts) =>
+        withOpenAIClient(model_name, opts, signal, async (client, resolvedModel, endpoint) => {
+            // deno-lint-ignore no-explicit-any
+            const createParams: any = {
+                model: resolvedModel,
+                messages: [{ role: "system", content: system }, ...promptMessages],
+                ...(llmKwargs ?? {}),
+            };
+            if (opts.promptCaching && endpoint) {
+                addOpenAICacheHints(createParams, endpoint, resolvedModel, false);
+            }
+            const completion = await client.chat.completions.create(createParams, signal ? { signal } : undefined);
+            const usage: Usage = {
+                prompt_tokens: completion.usage?.prompt_tokens ?? 0,
+                completion_tokens: completion.usage?.completion_tokens ?? 0,
+                total_tokens: completion.usage?.total_tokens ?? 0,
+                cached_tokens: completion.usage?.prompt_tokens_details?.cached_tokens ?? 0,
+                reasoning_tokens: completion.usage?.completion_tokens_details?.reasoning_tokens ?? 0,
+                cost: (completion.usage as any)?.cost ?? undefined,
+            };
+            return { content: (completion.choices[0].message.content || "").trim(), usage };
+        }));
 
     // Fail-open: only an explicit "NO" (as the first word) rejects.
     const firstWord = content.replace(/^[^a-zA-Z]+/, "").slice(0, 4).toUpperCase();
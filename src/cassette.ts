@@ -0,0 +1,110 @@
+// Record/replay cassettes: run(..., record=path) / run(..., replay=path).
+//
+// A recording captures, per agent and in call order, everything the engine
+// gets from outside: LLM completions (agent steps and compression-guard
+// calls) and MCP tool/resource results, plus the MCP servers' tool listing.
+// Replaying serves those back with no network and no API keys, while the REPL
+// code itself runs for real — so a replayed run exercises exactly the engine
+// (Pyodide, bridges, scheduling) and nothing else.
+//
+// Agents are identified by their position in the run's agent tree ("0" is
+// the root, "0.2" the root's second llm_query child, ...), which is the same in
+// both modes as long as the REPL code is deterministic. A replay that asks for
+// a call the recording doesn't have fails with an error naming the agent.
+import type { McpHandle } from "./mcp.ts";
+
+const VERSION = 1;
+
+interface CassetteEntry {
+    kind: string;
+    value?: unknown;
+    error?: string;
+}
+
+type McpListing = Pick<McpHandle, "tools" | "resources" | "resourceTemplates" | "serverNames">;
+
+interface CassetteFile {
+    version: number;
+    mcp: McpListing | null;
+    agents: Record<string, CassetteEntry[]>;
+}
+
+export class Cassette {
+    private data: CassetteFile = { version: VERSION, mcp: null, agents: {} };
+    // Replay position per agent.
+    private cursors = new Map<string, number>();
+
+    private constructor(readonly mode: "record" | "replay", readonly path: string) {}
+
+    static recorder(path: string): Cassette {
+        return new Cassette("record", path);
+    }
+
+    static async load(path: string): Promise<Cassette> {
+        const cassette = new Cassette("replay", path);
+        const data = JSON.parse(await Deno.readTextFile(path)) as CassetteFile;
+        if (data.version !== VERSION) {
+            throw new Error(`cassette ${path}: unsupported version ${data.version} (expected ${VERSION})`);
+        }
+        cassette.data = data;
+        return cassette;
+    }
+
+    /**
+     * Route one external call of `agent` through the cassette: recording runs
+     * `call` and stores its result (or error); replaying returns the stored one
+     * without calling. Slots are taken when the call starts, so concurrent
+     * calls from one agent replay in the order they were made.
+     */
+    async through<T>(agent: string, kind: string, call: () => Promise<T>): Promise<T> {
+        if (this.mode === "replay") {
+            const n = this.cursors.get(agent) ?? 0;
+            this.cursors.set(agent, n + 1);
+            const entry = this.data.agents[agent]?.[n];
+            if (!entry || entry.kind !== kind) {
+                throw new Error(
+                    `cassette ${this.path}: agent ${agent} made ${kind} call #${n + 1}, but the recording has ` +
+                    `${entry ? `a ${entry.kind} call` : "no more calls"} there — the run diverged from the recording`,
+                );
+            }
+            if (entry.error !== undefined) throw new Error(entry.error);
+            return entry.value as T;
+        }
+        const entries = this.data.agents[agent] ??= [];
+        const slot = entries.push({ kind }) - 1;
+        try {
+            const value = await call();
+            entries[slot] = { kind, value };
+            return value;
+        } catch (err) {
+            entries[slot] = { kind, error: err instanceof Error ? err.message : String(err) };
+            throw err;
+        }
+    }
+
+    /** Remember the connected MCP servers' listing (recording). */
+    recordMcp(handle: McpHandle): void {
+        const { tools, resources, resourceTemplates, serverNames } = handle;
+        this.data.mcp = { tools, resources, resourceTemplates, serverNames };
+    }
+
+    /**
+     * A stand-in for the recorded MCP connection (replaying): same listing, no
+     * servers. Its calls are never made — runAgent routes them through
+     * `through()` — so they throw if reached.
+     */
+    replayMcp(): McpHandle | null {
+        const listing = this.data.mcp;
+        if (!listing) return null;
+        const offline = () => Promise.reject(new Error(`cassette ${this.path}: MCP is offline in replay`));
+        return { ...listing, callTool: offline, readResource: offline, closeAll: () => Promise.resolve() };
+    }
+
+    /** Write the recording (atomically). No-op when replaying. */
+    async save(): Promise<void> {
+        if (this.mode !== "record") return;
+        const tmp = `${this.path}.${Deno.pid}.tmp`;
+        await Deno.writeTextFile(tmp, JSON.stringify(this.data));
+        await Deno.rename(tmp, this.path);
+    }
+}
@@ -1,4 +1,9 @@
 import { parse as parseYaml } from "@std/yaml";
+import type { RateLimits } from "./rate_limit.ts";
+import type { HedgePolicy } from "./hedging.ts";
+import type { EndpointPools, EndpointRouting } from "./endpoint_pool.ts";
+import type { ModelRouting } from "./model_routing.ts";
+import type { ModelPrices } from "./pricing.ts";
 
 // A user-registered ACP agent ("backdoor"). Built-in presets (claude-code,
 // codex, opencode) live in acp.ts; anything else is declared here by command.
@@ -27,6 +32,33 @@ export interface AcpAgentSpec {
     config_files?: Record<string, unknown>;
 }
 
+// A user-registered mock model script, selected as "mock:<name>" (see
+// mock.ts). Built-in scripts (leaf, fanout) need no entry.
+export interface MockModelSpec {
+    // Python for each agent step's repl block; the last one repeats.
+    // {{name}} is replaced by the parameter `name` ({{step}}: the step index).
+    steps: string[];
+    // Used instead of `steps` by leaf agents (max depth; no llm_query).
+    leaf_steps?: string[];
+    // Latency to the first token, e.g. "lognormal:800,0.6" (default "fixed:0").
+    latency?: string;
+    ms_per_token?: number;
+    // Fixed token counts per call (default: estimated from the text).
+    prompt_tokens?: number;
+    completion_tokens?: number;
+    // USD per 1M prompt / completion tokens (default 0).
+    input_price?: number;
+    output_price?: number;
+    // Probability a call fails like a provider error (default 0), the HTTP
+    // status it fails with (e.g. 429; default none) and its Retry-After (s).
+    error_rate?: number;
+    error_status?: number;
+    retry_after?: number;
+    seed?: number;
+    // Extra template values for {{name}}.
+    vars?: Record<string, string | number>;
+}
+
 export interface RlmConfig {
     max_calls_per_subagent?: number;
     max_depth?: number;
@@ -51,12 +83,101 @@ export interface RlmConfig {
     compression_min_chars?: number;
     compression_ratio?: number;
     instruction?: string;
+    // Spare pre-booted Pyodide REPLs kept warm for new agents (0 = boot one per
+    // agent, no pooling).
+    repl_pool_size?: number;
+    // Boot REPLs from a Pyodide memory snapshot cached under ~/.cache/fast-rlm
+    // (or $FAST_RLM_CACHE_DIR); rebuilt when Pyodide or the boot code changes.
+    repl_snapshot?: boolean;
+    // Extra pure-Python packages (pip requirement strings) importable in every
+    // REPL, besides requests and httpx. Resolved once into a local wheel store
+    // and unpacked on first import; see repl_packages.ts.
+    repl_packages?: string[];
+    // Run each REPL in its own Web Worker so agents' Python runs in parallel
+    // (default true); see worker_repl.ts.
+    repl_workers?: boolean;
+    // Open connections to the model endpoints at startup so the first LLM
+    // call skips the TCP/TLS handshake (default false); see llm_clients.ts.
+    prewarm_connections?: boolean;
+    // Stream completions and stop each after its first closed repl block
+    // (default true); see llm_stream.ts.
+    stream_completions?: boolean;
+    // History compaction (history.ts): resend only the last N steps verbatim
+    // and a one-line digest of older ones (default: all steps), and strip
+    // provider reasoning from resent replies (default true).
+    history_keep_steps?: number | null;
+    history_drop_reasoning?: boolean;
+    // Provider prompt-cache hints: Anthropic cache_control breakpoints,
+    // OpenAI/OpenRouter prompt_cache_key (default true); see prompt_cache.ts.
+    prompt_caching?: boolean;
+    // Opt-in disk cache of LLM responses keyed by request fingerprint
+    // (default false), its directory (default <cache dir>/responses) and size
+    // cap in MB before LRU eviction (default 1024); see response_cache.ts.
+    response_cache?: boolean;
+    response_cache_dir?: string | null;
+    response_cache_max_mb?: number;
+    // Identical llm_query calls within a run share one child run: joined while
+    // it runs, memoized once it finishes (default true); see query_memo.ts.
+    dedupe_llm_queries?: boolean;
+    // Provider rate limits, keyed by model string, backend ("openai",
+    // "anthropic", "vertex", "mock") or "default": {rpm, tpm, max_in_flight}.
+    // Calls queue for a slot and back off together on 429s; see rate_limit.ts.
+    rate_limits?: RateLimits | null;
+    // Agent admission caps: agents alive at once, and MB of Pyodide memory
+    // across them (default: no caps). Deeper agents are admitted first; see
+    // agent_scheduler.ts.
+    max_live_agents?: number | null;
+    max_repl_memory_mb?: number | null;
+    // Hedged requests: {percentile, min_samples, alternate_model}. A
+    // generate_code call still running at the model's percentile latency gets
+    // a duplicate; the first reply wins (default: off). See hedging.ts.
+    hedge_requests?: HedgePolicy | null;
+    // Endpoint pools for the OpenAI-compatible backend, by model string (or
+    // "default"): lists of {base_url, api_key | api_key_env, weight,
+    // max_in_flight, model}. Calls are balanced across a pool and fail over
+    // on 5xx/429/timeouts; see endpoint_pool.ts.
+    endpoints?: EndpointPools | null;
+    // How a pool picks an endpoint: "least_outstanding" (default) or
+    // "least_latency".
+    endpoint_routing?: EndpointRouting | null;
+    // Model routing: {by_depth: {"2": model}, by_context_chars: [{max_chars,
+    // model}], cascade: {models: [cheap, ...], min_depth}}. Picks each agent's
+    // model instead of primary_agent / sub_agent; a cascade tries cheaper
+    // models first and escalates on schema failures or running out of steps.
+    // See model_routing.ts.
+    model_routing?: ModelRouting | null;
+    // Per-model prices in USD per 1M tokens, {input, output, cached_input},
+    // over the bundled table. Used for calls whose provider reports no cost
+    // and for the pre-flight money check; see pricing.ts.
+    model_prices?: ModelPrices | null;
+    // Carve each sub-agent's budget out of its parent's remaining one (even
+    // shares across a batch, or llm_query(budget=...)) and return what it
+    // didn't spend when it ends; see budget.ts. Default true.
+    budget_reservations?: boolean;
+    // Wall-clock limit on a run, in seconds. Children inherit what is left
+    // less a margin, agents are nudged to finish near it, and the run returns
+    // its partial result when it passes; see deadline.ts. Also settable per
+    // run with run(deadline_s=...).
+    deadline_s?: number | null;
     // ACP backdoor: name -> adapter spec. Used to resolve "acp:<name>" model
     // strings for agents that aren't one of the built-in presets.
     acp_agents?: Record<string, AcpAgentSpec>;
+    // Scripted mock models for load tests: name -> script. Used to resolve
+    // "mock:<name>" model strings besides the built-in mock:leaf/mock:fanout.
+    mock_models?: Record<string, MockModelSpec>;
+}
+
+// Serve mode (subagents.ts --serve) runs each request with its own config.
+// Modules that read config lazily (e.g. the ACP registry in acp.ts) go through
+// loadConfig(), so the active request's config takes precedence over --config.
+let activeConfig: RlmConfig | null = null;
+
+export function setActiveConfig(config: RlmConfig | null): void {
+    activeConfig = config;
 }
 
 export function loadConfig(): RlmConfig {
+    if (activeConfig) return activeConfig;
     try {
         const configIdx = Deno.args.indexOf("--config");
         const configPath = configIdx !== -1 && Deno.args[configIdx + 1]
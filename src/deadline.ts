@@ -0,0 +1,75 @@
+// Wall-clock deadlines (run(deadline_s=...), llm_query(deadline_s=...)).
+//
+// api_timeout_ms bounds one HTTP call; nothing bounded a whole run, and a deep
+// tree could run for an hour. With a deadline:
+//
+//   - The root agent's deadline is deadline_s after its run starts. A child
+//     inherits its parent's, less a safety margin the parent keeps to use the
+//     child's result (or its failure) and finish; llm_query(deadline_s=...)
+//     can only make it sooner.
+//   - Once an agent's remaining time is down to its last step or two, its
+//     next message carries a nudge to call FINAL with what it has.
+//   - At the deadline, the agent's LLM call is aborted and its REPL code is no
+//     longer waited on. It ends with DeadlineExceeded, carrying its best
+//     partial result: the output of its last step. A child's surfaces in the
+//     parent's REPL as an error; the root's is returned as the run's result,
+//     flagged partial, instead of an error.
+
+// Share of a parent's remaining time it keeps back from a child, and the
+// least it keeps.
+const MARGIN_FRACTION = 0.15;
+const MIN_MARGIN_MS = 2_000;
+// The nudge starts once the time left is under this share of the agent's
+// window, or under two of its average steps.
+const NUDGE_FRACTION = 0.2;
+const NUDGE_STEPS = 2;
+
+/** Thrown by an agent whose deadline passed. */
+export class DeadlineExceeded extends Error {
+    constructor(
+        // The output of the agent's last step, or null before any.
+        readonly partial: string | null,
+        // True when REPL code was still running: the interpreter is dirty.
+        readonly interrupted: boolean,
+    ) {
+        super(
+            `Deadline reached before this sub-agent called FINAL.` +
+            (partial ? ` Its last output (partial result):\n${partial}` : ` It produced no output.`),
+        );
+        this.name = "DeadlineExceeded";
+    }
+}
+
+/**
+ * A child's deadline: the parent's less the margin, capped by the child's own
+ * `deadlineS`. Null when neither is set.
+ */
+export function childDeadline(parent: number | null, deadlineS: number | null, now = Date.now()): number | null {
+    const inherited = parent == null
+        ? null
+        : parent - Math.max(MIN_MARGIN_MS, MARGIN_FRACTION * (parent - now));
+    const own = deadlineS == null ? null : now + deadlineS * 1000;
+    if (inherited == null) return own;
+    return own == null ? inherited : Math.min(inherited, own);
+}
+
+/** Whether an agent with `remainingMs` left of `windowMs` should be nudged. */
+export function shouldNudge(remainingMs: number, windowMs: number, avgStepMs: number): boolean {
+    return remainingMs <= Math.max(NUDGE_FRACTION * windowMs, NUDGE_STEPS * avgStepMs);
+}
+
+export function deadlineNudge(remainingMs: number): string {
+    return (
+        `[DEADLINE: about ${Math.max(0, Math.round(remainingMs / 1000))}s left. Call FINAL(...) in this ` +
+        `reply with the best answer you have, even if incomplete. Start no new llm_query calls.]\n`
+    );
+}
+
+/** Parse llm_query's `deadline_s` argument (as it arrives over the bridge). */
+export function parseDeadline(value: unknown): number | null {
+    if (value == null) return null;
+    if (typeof value !== "number" || !(value > 0)) {
+        throw new Error(`llm_query deadline_s must be a positive number of seconds, got ${JSON.stringify(value)}`);
+    }
+    return value;
+}
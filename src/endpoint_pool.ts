@@ -0,0 +1,264 @@
+// Endpoint pools for the OpenAI-compatible backend (endpoints).
+//
+// The OpenAI-compatible backend used to call exactly one RLM_MODEL_BASE_URL
+// with one key. `endpoints` lists several for a model — vLLM / llama.cpp
+// replicas, or one provider under several keys — and each call picks one:
+//
+//   - Candidates are the healthy endpoints with a free slot (max_in_flight);
+//     when every endpoint is busy, the call waits for one.
+//   - "least_outstanding" (default) picks the fewest requests in flight per
+//     unit of weight; "least_latency" also scales that by the endpoint's
+//     recent latency, so a slow replica gets less of the traffic. Ties are
+//     broken at random by weight.
+//   - A 5xx, 429, timeout or connection error fails the call over to another
+//     endpoint of the pool at once. Health checks are passive: after a few
+//     consecutive failures, or a 429 with Retry-After, the endpoint is
+//     ejected for a backoff and then gets a single trial request before it
+//     takes traffic again. If every endpoint is ejected, calls go to the one
+//     due back first rather than failing outright.
+//
+// Only once every endpoint of the pool has failed does the error reach the
+// rate limiter's retries (rate_limit.ts).
+import chalk from "npm:chalk@5";
+import { isRetryable, retryAfterMs, statusOf } from "./rate_limit.ts";
+
+export interface EndpointSpec {
+    base_url: string;
+    // Key for this endpoint, or the env var that holds it (default: the
+    // RLM_MODEL_API_KEY key).
+    api_key?: string | null;
+    api_key_env?: string | null;
+    // Share of the traffic relative to the pool's other endpoints (default 1).
+    weight?: number | null;
+    // Requests in flight at once on this endpoint (default: no cap).
+    max_in_flight?: number | null;
+    // Model name to send to this endpoint (default: the model string).
+    model?: string | null;
+}
+
+// Pools by model string; "default" serves every model without its own.
+export type EndpointPools = Record<string, EndpointSpec[]>;
+
+export type EndpointRouting = "least_outstanding" | "least_latency";
+
+export interface EndpointStats {
+    pool: string;
+    base_url: string;
+    calls: number;
+    failures: number;
+    // Calls moved to another endpoint after failing on this one.
+    failovers: number;
+    ejections: number;
+    outstanding: number;
+    // Smoothed latency of successful calls (null: none yet).
+    latency_ms: number | null;
+    healthy: boolean;
+}
+
+const EJECT_AFTER_FAILURES = 3;
+const BASE_EJECT_MS = 5_000;
+const MAX_EJECT_MS = 60_000;
+// Weight of the newest sample in the latency average.
+const LATENCY_ALPHA = 0.2;
+
+export class Endpoint {
+    outstanding = 0;
+    latencyMs: number | null = null;
+    ejectedUntil = 0;
+    // Back from an ejection: one trial request at a time until one succeeds.
+    probing = false;
+    private consecutiveFailures = 0;
+    // Ejections since the last success; doubles the next ejection's length.
+    private ejectionStreak = 0;
+    readonly stats = { calls: 0, failures: 0, failovers: 0, ejections: 0 };
+
+    constructor(readonly spec: EndpointSpec) {}
+
+    get weight(): number {
+        return this.spec.weight != null && this.spec.weight > 0 ? this.spec.weight : 1;
+    }
+
+    ejected(now: number): boolean {
+        return now < this.ejectedUntil;
+    }
+
+    /** Can take a call now (not ejected, under its cap, not mid-trial). */
+    available(now: number): boolean {
+        if (this.ejected(now)) return false;
+        if (this.probing) return this.outstanding === 0;
+        const cap = this.spec.max_in_flight;
+        return cap == null || cap <= 0 || this.outstanding < cap;
+    }
+
+    succeeded(ms: number): void {
+        this.latencyMs = this.latencyMs == null ? ms : this.latencyMs + LATENCY_ALPHA * (ms - this.latencyMs);
+        this.answered();
+    }
+
+    /** The endpoint replied (even with an error of the caller's making). */
+    answered(): void {
+        this.consecutiveFailures = 0;
+        this.ejectionStreak = 0;
+        this.probing = false;
+    }
+
+    failed(error: unknown): void {
+        this.stats.failures += 1;
+        this.consecutiveFailures += 1;
+        const asked = statusOf(error) === 429 ? retryAfterMs(error) : null;
+        if (asked == null && !this.probing && this.consecutiveFailures < EJECT_AFTER_FAILURES) return;
+        const backoff = Math.min(MAX_EJECT_MS, BASE_EJECT_MS * 2 ** this.ejectionStreak);
+        this.ejectedUntil = Date.now() + (asked ?? backoff);
+        this.ejectionStreak += 1;
+        this.consecutiveFailures = 0;
+        this.probing = true;
+        this.stats.ejections += 1;
+    }
+
+    score(routing: EndpointRouting): number {
+        const load = (this.outstanding + 1) / this.weight;
+        // An endpoint with no latency yet scores 0, so it gets tried early.
+        return routing === "least_latency" ? load * (this.latencyMs ?? 0) : load;
+    }
+}
+
+export class EndpointPool {
+    readonly endpoints: Endpoint[];
+    private waiters: (() => void)[] = [];
+
+    constructor(readonly name: string, specs: EndpointSpec[], public routing: EndpointRouting) {
+        this.endpoints = specs.map((spec) => new Endpoint(spec));
+    }
+
+    /**
+     * Run `call` on an endpoint, failing over to the pool's other endpoints
+     * on retryable errors. Throws the last error once every one has failed.
+     */
+    async run<T>(signal: AbortSignal | null | undefined, call: (endpoint: Endpoint) => Promise<T>): Promise<T> {
+        const tried = new Set<Endpoint>();
+        let lastError: unknown = new Error(`Endpoint pool "${this.name}" has no endpoints`);
+        for (;;) {
+            const endpoint = await this.acquire(tried, signal);
+            if (!endpoint) throw lastError;
+            tried.add(endpoint);
+            endpoint.stats.calls += 1;
+            const started = Date.now();
+            try {
+                const out = await call(endpoint);
+                endpoint.succeeded(Date.now() - started);
+                return out;
+            } catch (error) {
+                if (signal?.aborted) throw error;
+                if (!isRetryable(error)) {
+                    endpoint.answered();
+                    throw error;
+                }
+                endpoint.failed(error);
+                lastError = error;
+                if (tried.size < this.endpoints.length) {
+                    endpoint.stats.failovers += 1;
+                    console.error(chalk.yellow(
+                        `⚠ ${endpoint.spec.base_url}: ${statusOf(error) ?? "connection error"}, failing over`,
+                    ));
+                }
+            } finally {
+                endpoint.outstanding -= 1;
+                this.wake();
+            }
+        }
+    }
+
+    stats(): EndpointStats[] {
+        const now = Date.now();
+        return this.endpoints.map((e) => ({
+            pool: this.name,
+            base_url: e.spec.base_url,
+            ...e.stats,
+            outstanding: e.outstanding,
+            latency_ms: e.latencyMs == null ? null : Math.round(e.latencyMs),
+            healthy: !e.ejected(now) && !e.probing,
+        }));
+    }
+
+    // The endpoint for the next attempt (its slot taken), or null once every
+    // endpoint has been tried.
+    private acquire(tried: Set<Endpoint>, signal: AbortSignal | null | undefined): Promise<Endpoint | null> {
+        return new Promise((resolve, reject) => {
+            const attempt = (): boolean => {
+                if (signal?.aborted) {
+                    reject(signal.reason);
+                    return true;
+                }
+                const endpoint = this.pick(tried);
+                if (endpoint === "wait") return false;
+                if (endpoint) endpoint.outstanding += 1;
+                resolve(endpoint);
+                return true;
+            };
+            if (attempt()) return;
+            const waiter = () => {
+                if (!attempt()) return;
+                this.waiters = this.waiters.filter((w) => w !== waiter);
+                signal?.removeEventListener("abort", onAbort);
+            };
+            const onAbort = () => {
+                this.waiters = this.waiters.filter((w) => w !== waiter);
+                reject(signal!.reason);
+            };
+            signal?.addEventListener("abort", onAbort, { once: true });
+            this.waiters.push(waiter);
+        });
+    }
+
+    private pick(tried: Set<Endpoint>): Endpoint | null | "wait" {
+        const now = Date.now();
+        const untried = this.endpoints.filter((e) => !tried.has(e));
+        if (!untried.length) return null;
+        const ready = untried.filter((e) => e.available(now));
+        if (!ready.length) {
+            // Busy endpoints free up on release(); if every one left is
+            // ejected instead, send the call to the one due back first.
+            if (untried.some((e) => !e.ejected(now))) return "wait";
+            return untried.reduce((a, b) => (b.ejectedUntil < a.ejectedUntil ? b : a));
+        }
+        const best = Math.min(...ready.map((e) => e.score(this.routing)));
+        const ties = ready.filter((e) => e.score(this.routing) === best);
+        let r = Math.random() * ties.reduce((sum, e) => sum + e.weight, 0);
+        for (const e of ties) {
+            r -= e.weight;
+            if (r < 0) return e;
+        }
+        return ties[ties.length - 1];
+    }
+
+    private wake(): void {
+        for (const waiter of [...this.waiters]) waiter();
+    }
+}
+
+// Process-wide, like the rate limiters: health and latency are the
+// endpoints', whichever run sends the calls. Rebuilt only when a run's
+// `endpoints` differ from the last run's, so that state carries over.
+const pools = new Map<string, EndpointPool>();
+let configured = "";
+
+export function configureEndpointPools(specs: EndpointPools | null, routing: EndpointRouting | null): void {
+    const id = JSON.stringify(specs ?? {});
+    if (id !== configured) {
+        configured = id;
+        pools.clear();
+        for (const [name, endpoints] of Object.entries(specs ?? {})) {
+            if (endpoints?.length) pools.set(name, new EndpointPool(name, endpoints, routing ?? "least_outstanding"));
+        }
+    }
+    for (const pool of pools.values()) pool.routing = routing ?? "least_outstanding";
+}
+
+/** The pool serving `model` (its own, else "default"), or null for none. */
+export function endpointPool(model: string): EndpointPool | null {
+    return pools.get(model) ?? pools.get("default") ?? null;
+}
+
+export function endpointPoolStats(): EndpointStats[] {
+    return [...pools.values()].flatMap((p) => p.stats());
+}
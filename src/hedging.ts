@@ -0,0 +1,182 @@
+// Hedged LLM requests (hedge_requests).
+//
+// A few provider calls take many times the median, and one slow leaf holds up
+// its whole batch_llm_query. With a hedging policy, a generate_code call that
+// is still running at the model's observed p-th percentile latency gets a
+// duplicate (to the same model, or to an alternate one); whichever finishes
+// first wins and the other is cancelled. Both calls are paid for, so the
+// loser's usage is added to the winner's (estimated from the prompt when the
+// loser was cut off before reporting).
+//
+// Latencies come from a rolling window of recent calls per model, measured
+// from when the request left the rate limiter's queue. A call cancelled as the
+// loser is recorded at its elapsed time, a lower bound, so slow tails still
+// count.
+import type { Usage } from "./call_llm.ts";
+
+export interface HedgePolicy {
+    // Latency percentile (0-100) after which the duplicate is sent.
+    percentile: number;
+    // Calls observed for a model before it is hedged (default 20).
+    min_samples?: number | null;
+    // Model string for the duplicate (default: the same model).
+    alternate_model?: string | null;
+}
+
+// Which call won a hedged request.
+export type HedgeOutcome = "primary" | "hedge";
+
+const WINDOW = 256;
+const DEFAULT_MIN_SAMPLES = 20;
+
+class LatencyWindow {
+    private samples: number[] = [];
+    private next = 0;
+
+    push(ms: number): void {
+        if (this.samples.length < WINDOW) this.samples.push(ms);
+        else this.samples[this.next] = ms;
+        this.next = (this.next + 1) % WINDOW;
+    }
+
+    get size(): number {
+        return this.samples.length;
+    }
+
+    percentile(p: number): number {
+        const sorted = [...this.samples].sort((a, b) => a - b);
+        const rank = Math.min(sorted.length - 1, Math.max(0, Math.ceil((p / 100) * sorted.length) - 1));
+        return sorted[rank];
+    }
+}
+
+// Process-wide: a model's latency doesn't depend on which run calls it.
+const windows = new Map<string, LatencyWindow>();
+
+export function recordLatency(model: string, ms: number): void {
+    let window = windows.get(model);
+    if (!window) {
+        window = new LatencyWindow();
+        windows.set(model, window);
+    }
+    window.push(ms);
+}
+
+/** The model's p-th percentile latency in ms, or null with too few samples. */
+export function latencyPercentile(model: string, p: number, minSamples = DEFAULT_MIN_SAMPLES): number | null {
+    const window = windows.get(model);
+    if (!window || window.size < Math.max(1, minSamples)) return null;
+    return window.percentile(p);
+}
+
+export function addUsage(a: Usage, b: Usage): Usage {
+    return {
+        prompt_tokens: a.prompt_tokens + b.prompt_tokens,
+        completion_tokens: a.completion_tokens + b.completion_tokens,
+        total_tokens: a.total_tokens + b.total_tokens,
+        cached_tokens: a.cached_tokens + b.cached_tokens,
+        reasoning_tokens: a.reasoning_tokens + b.reasoning_tokens,
+        cost: a.cost == null && b.cost == null ? undefined : (a.cost ?? 0) + (b.cost ?? 0),
+    };
+}
+
+// A controller that also aborts when `parent` does.
+function childController(parent?: AbortSignal | null): { controller: AbortController; unlink: () => void } {
+    const controller = new AbortController();
+    if (!parent) return { controller, unlink: () => {} };
+    const onAbort = () => controller.abort(parent.reason);
+    if (parent.aborted) onAbort();
+    else parent.addEventListener("abort", onAbort, { once: true });
+    return { controller, unlink: () => parent.removeEventListener("abort", onAbort) };
+}
+
+interface Attempt<T> {
+    model: string;
+    started: number;
+    controller: AbortController;
+    unlink: () => void;
+    result: Promise<T>;
+}
+
+/**
+ * Run `call` for `model` under `policy`: past the model's latency percentile,
+ * race a duplicate against it. `abandonedUsage` prices a call to a model that
+ * was cancelled before it reported usage.
+ */
+export async function hedged<T extends { usage: Usage; request_start?: string }>(
+    model: string,
+    policy: HedgePolicy | null | undefined,
+    signal: AbortSignal | null | undefined,
+    call: (model: string, signal: AbortSignal) => Promise<T>,
+    abandonedUsage: (model: string) => Usage,
+): Promise<T & { hedge?: HedgeOutcome }> {
+    const start = (attemptModel: string): Attempt<T> => {
+        const { controller, unlink } = childController(signal);
+        const started = Date.now();
+        const result = call(attemptModel, controller.signal).then((out) => {
+            const from = out.request_start ? Date.parse(out.request_start) : started;
+            recordLatency(attemptModel, Date.now() - from);
+            return out;
+        });
+        return { model: attemptModel, started, controller, unlink, result };
+    };
+
+    const threshold = policy ? latencyPercentile(model, policy.percentile, policy.min_samples ?? undefined) : null;
+    const primary = start(model);
+    if (threshold == null) {
+        try {
+            return await primary.result;
+        } finally {
+            primary.unlink();
+        }
+    }
+
+    let timer: number | undefined;
+    const fired = await Promise.race([
+        primary.result.then(() => false, () => false),
+        new Promise<boolean>((resolve) => {
+            timer = setTimeout(() => resolve(true), threshold);
+        }),
+    ]);
+    clearTimeout(timer);
+    if (!fired || signal?.aborted) {
+        try {
+            return await primary.result;
+        } finally {
+            primary.unlink();
+        }
+    }
+
+    console.log(`↳ ${model} slower than its p${policy!.percentile} (${(threshold / 1000).toFixed(1)}s); hedging`);
+    const hedge = start(policy!.alternate_model || model);
+    const attempts = [primary, hedge];
+    try {
+        // First success wins; if one fails, the other still can.
+        const winnerIndex = await new Promise<number>((resolve, reject) => {
+            let failed = 0;
+            attempts.forEach((attempt, i) => {
+                attempt.result.then(() => resolve(i), (err) => {
+                    if (++failed === attempts.length) reject(err);
+                });
+            });
+        });
+        const winner = await attempts[winnerIndex].result;
+        const loser = attempts[1 - winnerIndex];
+        loser.controller.abort(new Error("hedged request lost the race"));
+        const loserUsage = await loser.result.then(
+            (out) => out.usage,
+            () => {
+                recordLatency(loser.model, Date.now() - loser.started);
+                return abandonedUsage(loser.model);
+            },
+        );
+        return {
+            ...winner,
+            usage: addUsage(winner.usage, loserUsage),
+            hedge: winnerIndex === 0 ? "primary" : "hedge",
+        };
+    } finally {
+        primary.unlink();
+        hedge.unlink();
+    }
+}
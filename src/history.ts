@@ -0,0 +1,82 @@
+// What an agent resends to the model each step.
+//
+// An agent's `messages` are the step-0 probe followed by one (assistant reply,
+// user "Output: ...") pair per step, and every call used to resend all of it:
+// prompt tokens grew quadratically with steps and max_prompt_tokens was hit
+// early. compactHistory() builds the view actually sent, leaving `messages`
+// itself untouched:
+//
+//   - the step-0 probe is sent byte-for-byte, so the provider's prompt cache
+//     always covers at least the system prompt + probe;
+//   - provider reasoning payloads on assistant messages are dropped;
+//   - with keepSteps set, all but the last keepSteps steps collapse into one
+//     digest message (a line per step: head of the code, tail of the output).
+
+export interface CompactionPolicy {
+    // Strip `reasoning` / `reasoning_content` fields from assistant messages.
+    dropReasoning: boolean;
+    // Steps kept verbatim; older ones go into the digest. null keeps them all.
+    keepSteps: number | null;
+}
+
+// Per-step digest budget: the code's first lines, the output's last chars.
+const DIGEST_CODE_CHARS = 160;
+const DIGEST_OUTPUT_CHARS = 240;
+
+// deno-lint-ignore no-explicit-any
+type Message = any;
+
+function oneLine(text: string): string {
+    return text.replace(/\s+/g, " ").trim();
+}
+
+function digestCode(content: unknown): string {
+    const text = typeof content === "string" ? content : JSON.stringify(content ?? "");
+    const match = /```repl([\s\S]*?)```/.exec(text);
+    if (!match) return "(no repl block)";
+    const code = oneLine(match[1]);
+    return code.length > DIGEST_CODE_CHARS ? code.slice(0, DIGEST_CODE_CHARS) + " …" : code;
+}
+
+function digestOutput(content: unknown): string {
+    const text = typeof content === "string" ? content : JSON.stringify(content ?? "");
+    const at = text.indexOf("Output:");
+    const output = oneLine(at >= 0 ? text.slice(at + "Output:".length) : text);
+    return output.length > DIGEST_OUTPUT_CHARS ? "… " + output.slice(-DIGEST_OUTPUT_CHARS) : output;
+}
+
+function withoutReasoning(message: Message): Message {
+    if (message?.role !== "assistant" || !("reasoning" in message || "reasoning_content" in message)) {
+        return message;
+    }
+    const { reasoning: _r, reasoning_content: _rc, ...rest } = message;
+    return rest;
+}
+
+/** The messages to send for the next step under `policy` (see above). */
+export function compactHistory(messages: Message[], policy: CompactionPolicy): Message[] {
+    if (messages.length === 0) return messages;
+    const [probe, ...rest] = messages;
+    const strip = (m: Message) => policy.dropReasoning ? withoutReasoning(m) : m;
+
+    // Steps are (assistant, user) pairs after the probe.
+    const steps = Math.floor(rest.length / 2);
+    const keep = policy.keepSteps;
+    if (keep == null || steps <= keep) {
+        return [probe, ...rest.map(strip)];
+    }
+    const dropped = steps - keep;
+    const lines: string[] = [];
+    for (let s = 0; s < dropped; s++) {
+        const reply = rest[2 * s];
+        const output = rest[2 * s + 1];
+        lines.push(`Step ${s + 1}: ran: ${digestCode(reply?.content)}\n  output: ${digestOutput(output?.content)}`);
+    }
+    const digest = {
+        role: "user",
+        content:
+            `[Steps 1-${dropped} are summarized to save context; your REPL state from them is intact. ` +
+            `Re-inspect variables in code if you need their details.]\n${lines.join("\n")}`,
+    };
+    return [probe, digest, ...rest.slice(2 * dropped).map(strip)];
+}
@@ -0,0 +1,129 @@
+// Process-wide registry of LLM API clients.
+//
+// Every agent step used to construct a fresh OpenAI / Anthropic client, and
+// with it fresh HTTP connections: each step paid a TCP + TLS handshake to the
+// provider. Clients are now looked up by (backend, baseURL, key, retries,
+// timeout) and shared by all agents of all runs in the engine process, and
+// every client sends its requests through one keep-alive HTTP pool.
+//
+// A credential that rotates (Vertex access tokens) produces a new key; the
+// client it replaces is dropped rather than kept around. Other backends keep
+// one client per key: an endpoint pool may hold several keys for one URL.
+
+export type Backend = "openai" | "anthropic" | "vertex";
+
+export interface ClientKey {
+    backend: Backend;
+    baseURL: string;
+    apiKey: string;
+    maxRetries: number;
+    timeout: number;
+}
+
+// What the SDK constructors accept as their `fetch` option.
+export type SharedFetch = typeof fetch;
+
+interface Entry {
+    key: ClientKey;
+    client: unknown;
+    calls: number;
+}
+
+export interface ClientStats {
+    // Clients constructed (each one a cold start for its first request).
+    created: number;
+    // Calls served by an existing client and its warm connections.
+    reused: number;
+    clients: { backend: Backend; baseURL: string; calls: number }[];
+}
+
+const clients = new Map<string, Entry>();
+let created = 0;
+let reused = 0;
+
+// One HTTP client (connection pool) for every SDK client. Deno's global fetch
+// already pools per process; a dedicated client just makes the pool explicit
+// and lets HTTP/2 multiplex concurrent agents over one connection per host.
+let pooledFetch: SharedFetch | null = null;
+
+function sharedFetch(): SharedFetch {
+    if (!pooledFetch) {
+        pooledFetch = fetch;
+        try {
+            // deno-lint-ignore no-explicit-any
+            const createHttpClient = (Deno as any).createHttpClient;
+            if (typeof createHttpClient === "function") {
+                const client = createHttpClient({ http1: true, http2: true });
+                pooledFetch = ((input: RequestInfo | URL, init?: RequestInit) =>
+                    fetch(input, { ...init, client } as RequestInit)) as SharedFetch;
+            }
+        } catch {
+            // Older runtimes: the global fetch's pool is still shared.
+        }
+    }
+    return pooledFetch;
+}
+
+function rotatedFrom(a: ClientKey, b: ClientKey): boolean {
+    return a.backend === "vertex" && a.backend === b.backend && a.baseURL === b.baseURL &&
+        a.maxRetries === b.maxRetries && a.timeout === b.timeout;
+}
+
+/**
+ * The client for `key`, built with `create` on first use. `create` gets the
+ * shared fetch to pass as the SDK's `fetch` option.
+ */
+export function sharedClient<T>(key: ClientKey, create: (fetch: SharedFetch) => T): T {
+    const id = JSON.stringify([key.backend, key.baseURL, key.apiKey, key.maxRetries, key.timeout]);
+    const hit = clients.get(id);
+    if (hit) {
+        hit.calls += 1;
+        reused += 1;
+        return hit.client as T;
+    }
+    // Rotated credentials: forget the client built with the old ones.
+    for (const [other, entry] of clients) {
+        if (rotatedFrom(entry.key, key)) clients.delete(other);
+    }
+    const client = create(sharedFetch());
+    clients.set(id, { key, client, calls: 1 });
+    created += 1;
+    return client;
+}
+
+/** Client creations vs. reuses since the engine started. */
+export function clientStats(): ClientStats {
+    return {
+        created,
+        reused,
+        clients: [...clients.values()].map((e) => ({
+            backend: e.key.backend,
+            baseURL: e.key.baseURL,
+            calls: e.calls,
+        })),
+    };
+}
+
+/**
+ * Open a connection to each endpoint ahead of the first LLM call, so the
+ * first agent step doesn't pay the handshake. Best-effort: failures are
+ * ignored (the real call reports them).
+ */
+export async function prewarmConnections(baseURLs: string[]): Promise<void> {
+    const origins = new Set<string>();
+    for (const url of baseURLs) {
+        try {
+            origins.add(new URL(url).origin);
+        } catch {
+            // Not a URL; the first real call will say so.
+        }
+    }
+    await Promise.all([...origins].map(async (origin) => {
+        try {
+            const res = await sharedFetch()(origin, { method: "HEAD" });
+            await res.body?.cancel();
+        } catch {
+            // Unreachable now; the first real call will say why.
+        }
+    }));
+}
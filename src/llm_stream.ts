@@ -0,0 +1,140 @@
+// Helpers for streamed completions (stream_completions).
+//
+// The agent only ever runs the code inside its reply's first ```repl ... ```
+// block (extractReplCode); whatever a model writes after that block is paid
+// for and waited on for nothing. Streaming
+// lets the backends (call_llm.ts, anthropic.ts) watch the text as it arrives,
+// stop the request the moment the first repl block closes, note when the
+// first token arrived, and abort a generation that would blow the run's
+// completion-token budget.
+
+// Per-call streaming controls, built by subagents.ts from the run's state.
+export interface StreamOptions {
+    // Called as text arrives with a running estimate of this call's completion
+    // tokens; returning true aborts the generation (budget exhausted).
+    overBudget?: (completionTokens: number) => boolean;
+    // Run cancellation: aborts the request in flight.
+    signal?: AbortSignal | null;
+}
+
+// What a streamed call reports besides its text and usage.
+export interface StreamTiming {
+    // ISO time the first content (or reasoning) token arrived.
+    first_token_at?: string;
+    // The request was cut off after the first closed repl block.
+    early_stop: boolean;
+    // The request was cut off because the budget check tripped.
+    budget_stop: boolean;
+}
+
+const OPEN_FENCE = "```repl";
+const CLOSE_FENCE = "```";
+
+/**
+ * The code of a reply's first repl block ("" if none). Streamed or not, every
+ * backend runs only this block, as the system prompt asks for a single one.
+ */
+export function extractReplCode(content: string): string {
+    const match = /```repl([\s\S]*?)```/.exec(content);
+    return match ? match[1].trim() : "";
+}
+
+/**
+ * Tracks a growing completion and reports where its first repl block closes.
+ * Each push() only rescans the tail, so the check stays linear in the text.
+ */
+export class ReplBlockWatcher {
+    text = "";
+    private openAt = -1;
+    private scanFrom = 0;
+
+    /** Append a delta; returns the end offset of the first closed repl block, or -1. */
+    push(delta: string): number {
+        this.text += delta;
+        if (this.openAt < 0) {
+            const open = this.text.indexOf(OPEN_FENCE, Math.max(0, this.scanFrom - OPEN_FENCE.length));
+            if (open < 0) {
+                this.scanFrom = this.text.length;
+                return -1;
+            }
+            this.openAt = open;
+            this.scanFrom = open + OPEN_FENCE.length;
+        }
+        const close = this.text.indexOf(CLOSE_FENCE, Math.max(this.openAt + OPEN_FENCE.length, this.scanFrom - CLOSE_FENCE.length));
+        if (close < 0) {
+            this.scanFrom = this.text.length;
+            return -1;
+        }
+        return close + CLOSE_FENCE.length;
+    }
+}
+
+// Chat-format overhead per message (role, separators), in tokens.
+const MESSAGE_OVERHEAD_TOKENS = 4;
+
+// ASCII letters, plus the accented / Greek / Cyrillic / ... letters below the
+// CJK blocks (less ×, ÷ and the general punctuation block).
+function isWordChar(c: number): boolean {
+    if ((c >= 97 && c <= 122) || (c >= 65 && c <= 90)) return true;
+    return c >= 0xc0 && c < 0x2e80 && c !== 0xd7 && c !== 0xf7 && !(c >= 0x2000 && c <= 0x206f);
+}
+
+/**
+ * Local token estimate for text the provider didn't meter, or hasn't yet (the
+ * pre-flight budget checks). No tokenizer: one linear scan that counts as BPE
+ * vocabularies tend to split. A short word is one token, a longer one about
+ * one per 4 letters; digits go in groups of 3; punctuation, symbols and CJK
+ * characters are a token each; a run of whitespace is at most one. Code and
+ * JSON come out well above chars / 4, which undercounts them.
+ */
+export function estimateTokens(text: string): number {
+    let tokens = 0;
+    let letters = 0;
+    let digits = 0;
+    let space = 0;
+    const flush = () => {
+        if (letters) tokens += letters <= 6 ? 1 : Math.ceil(letters / 4);
+        if (digits) tokens += Math.ceil(digits / 3);
+        if (space > 1) tokens += 1;
+        letters = digits = space = 0;
+    };
+    for (let i = 0; i < text.length; i++) {
+        const c = text.charCodeAt(i);
+        if (isWordChar(c)) {
+            if (digits || space > 1) flush();
+            digits = space = 0;
+            letters++;
+        } else if (c >= 48 && c <= 57) {
+            if (letters || space > 1) flush();
+            letters = space = 0;
+            digits++;
+        } else if (c === 32 || c === 9 || c === 10 || c === 13) {
+            if (letters || digits) flush();
+            space++;
+        } else {
+            flush();
+            // A surrogate pair (emoji, rare CJK) is one character.
+            if (c >= 0xd800 && c <= 0xdbff) i++;
+            tokens += 1;
+        }
+    }
+    flush();
+    return tokens;
+}
+
+/** Local prompt-token estimate for a system prompt plus chat messages. */
+// deno-lint-ignore no-explicit-any
+export function estimatePromptTokens(system: string, messages: any[]): number {
+    let tokens = estimateTokens(system) + MESSAGE_OVERHEAD_TOKENS;
+    for (const m of messages) {
+        const content = typeof m?.content === "string" ? m.content : JSON.stringify(m?.content ?? "");
+        tokens += estimateTokens(content) + MESSAGE_OVERHEAD_TOKENS;
+    }
+    return tokens;
+}
+
+/** True for the error an SDK throws when we aborted its stream ourselves. */
+export function isAbortError(err: unknown): boolean {
+    return err instanceof Error &&
+        (err.name === "AbortError" || err.name.endsWith("UserAbortError") || /abort/i.test(err.message));
+}
@@ -4,8 +4,12 @@
 
 import pino from "npm:pino";
 import type { Usage } from "./call_llm.ts";
+import type { ClientStats } from "./llm_clients.ts";
+import type { LimiterStats } from "./rate_limit.ts";
+import type { EndpointStats } from "./endpoint_pool.ts";
+import type { SchedulerStats } from "./agent_scheduler.ts";
 import { printStep, showFinalResult, type StepData } from "./ui.ts";
-import { getTotalUsage } from "./usage.ts";
+import { defaultUsageTracker, emptyUsage, type UsageTracker } from "./usage.ts";
 import chalk from "npm:chalk@5";
 
 // Re-export types
@@ -13,13 +17,14 @@ export type { StepData };
 
 // ── Pino logger setup ───────────────────────────────────────────────
 
-let pinoLogger: pino.Logger;
+let pinoLogger: pino.Logger | null = null;
+let pinoDest: ReturnType<typeof pino.destination> | null = null;
 let currentLogFile: string | null = null;
 let logPrefix: string | null = null;
 let logDir = "./logs";
 
 /** Set a custom prefix for the log filename (call before any logging) */
-export function setLogPrefix(prefix: string) {
+export function setLogPrefix(prefix: string | null) {
     logPrefix = prefix;
 }
 
@@ -45,21 +50,41 @@ function initPino() {
         const prefix = logPrefix ? `${logPrefix}_` : "run_";
         currentLogFile = `${logDir}/${prefix}${timestamp}.jsonl`;
 
+        pinoDest = pino.destination({ dest: currentLogFile, sync: false });
         pinoLogger = pino({
             level: "info",
             timestamp: pino.stdTimeFunctions.isoTime,
             base: null, // Skip hostname/pid to avoid --allow-sys requirement
-        }, pino.destination({ dest: currentLogFile, sync: false }));
+        }, pinoDest);
 
         console.log(chalk.dim(`📝 Logging to: ${currentLogFile}\n`));
     }
     return pinoLogger;
 }
 
+/**
+ * Flush and close the current log file. The next log call opens a new file
+ * (with the then-current dir/prefix). Used by serve mode between requests.
+ */
+export async function closeLogFile(): Promise<void> {
+    if (!pinoLogger) return;
+    await Logger.flush();
+    pinoDest?.end();
+    pinoLogger = null;
+    pinoDest = null;
+    currentLogFile = null;
+}
+
 function generateRunId(): string {
     return `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`;
 }
 
+/**
+ * Receives every structured record the Logger writes to the log file, plus
+ * live-only records (usage deltas). Serve mode forwards them to the client.
+ */
+export type EventSink = (event: Record<string, unknown>) => void;
+
 // ── Logger Class ────────────────────────────────────────────────────
 
 export class Logger {
@@ -67,32 +92,67 @@ export class Logger {
     private parent_run_id?: string;
     private depth: number;
     private maxSteps: number;
-
-    constructor(depth: number, maxSteps: number, parent_run_id?: string) {
+    private usage: UsageTracker;
+    private sink: EventSink | null;
+    // This agent's own LLM usage, summed from logUsage().
+    private agentUsage: Usage = emptyUsage();
+
+    constructor(
+        depth: number,
+        maxSteps: number,
+        parent_run_id?: string,
+        usage?: UsageTracker,
+        sink?: EventSink | null,
+    ) {
         this.run_id = generateRunId();
         this.parent_run_id = parent_run_id;
         this.depth = depth;
         this.maxSteps = maxSteps;
+        this.usage = usage ?? defaultUsageTracker();
+        this.sink = sink ?? null;
     }
 
-    logAgentStart(): void {
-        initPino().child({
+    /** Write a record to the log file (unless live-only) and the event sink. */
+    private emit(record: Record<string, unknown>, persist = true): void {
+        const bindings = {
             run_id: this.run_id,
             parent_run_id: this.parent_run_id,
             depth: this.depth,
-        }).info({
+        };
+        if (persist) {
+            initPino().child(bindings).info(record);
+        }
+        if (this.sink) {
+            try {
+                this.sink({ time: new Date().toISOString(), ...bindings, ...record });
+            } catch {
+                // A broken consumer must never take the run down.
+            }
+        }
+    }
+
+    /**
+     * Start of this agent; `queueWaitMs` is how long it waited for a scheduler
+     * slot, `model` the model it was routed to, `budget` the finite limits
+     * a sub-agent was granted (budget.ts).
+     */
+    logAgentStart(queueWaitMs = 0, model?: string, budget?: Record<string, number> | null): void {
+        this.emit({
             event_type: "agent_start",
+            queue_wait_ms: queueWaitMs,
+            ...(model ? { model } : {}),
+            ...(budget && Object.keys(budget).length ? { budget } : {}),
         });
     }
 
+    /**
+     * End of this agent: its own usage (every LLM call it made, not its
+     * sub-agents') and the share of its prompt tokens served from cache.
+     */
     logAgentEnd(): void {
-        initPino().child({
-            run_id: this.run_id,
-            parent_run_id: this.parent_run_id,
-            depth: this.depth,
-        }).info({
-            event_type: "agent_end",
-        });
+        const u = this.agentUsage;
+        const cacheHitRate = u.prompt_tokens > 0 ? Number((u.cached_tokens / u.prompt_tokens).toFixed(4)) : 0;
+        this.emit({ event_type: "agent_end", usage: { ...u }, cache_hit_rate: cacheHitRate });
     }
 
     logStep(data: Omit<StepData, "run_id" | "parent_run_id" | "depth" | "maxSteps" | "totalUsage">): void {
@@ -101,22 +161,15 @@ export class Logger {
             parent_run_id: this.parent_run_id,
             depth: this.depth,
             maxSteps: this.maxSteps,
-            totalUsage: getTotalUsage(), // Add running total
+            totalUsage: this.usage.getTotalUsage(), // Add running total
             ...data,
         };
 
         const { step, code, output, hasError, reasoning, usage, timestamps } = fullData;
 
-        // Log to Pino
-        const log = initPino().child({
-            run_id: this.run_id,
-            parent_run_id: this.parent_run_id,
-            depth: this.depth,
-            step,
-        });
-
         if (output !== undefined) {
-            log.info({
+            this.emit({
+                step,
                 event_type: "execution_result",
                 code,
                 output,
@@ -126,7 +179,8 @@ export class Logger {
                 timestamps,
             });
         } else {
-            log.info({
+            this.emit({
+                step,
                 event_type: "code_generated",
                 code,
                 reasoning,
@@ -140,20 +194,59 @@ export class Logger {
     }
 
     logFinalResult(result: unknown): void {
-        // Log to Pino
-        initPino().child({
-            run_id: this.run_id,
-            parent_run_id: this.parent_run_id,
-            depth: this.depth,
-        }).info({
-            event_type: "final_result",
-            result,
-        });
+        this.emit({ event_type: "final_result", result });
 
         // Display on terminal
         showFinalResult(result, this.depth);
     }
 
+    /** Live-only: one LLM call's usage and the run total after it. */
+    logUsage(usage: Usage, totalUsage: Usage): void {
+        const a = this.agentUsage;
+        a.prompt_tokens += usage.prompt_tokens || 0;
+        a.completion_tokens += usage.completion_tokens || 0;
+        a.total_tokens += usage.total_tokens || 0;
+        a.cached_tokens += usage.cached_tokens || 0;
+        a.reasoning_tokens += usage.reasoning_tokens || 0;
+        if (usage.cost != null) a.cost = (a.cost ?? 0) + usage.cost;
+        this.emit({ event_type: "usage", usage, totalUsage }, false);
+    }
+
+    /** A run-wide budget crossed its warning threshold. */
+    logBudgetWarning(budget: string, used: number, limit: number): void {
+        this.emit({ event_type: "budget_warning", budget, used, limit });
+    }
+
+    /** LLM clients built vs. reused (warm connections) so far in this engine. */
+    logClientStats(stats: ClientStats, limits: LimiterStats[] = [], endpoints: EndpointStats[] = []): void {
+        this.emit({ event_type: "llm_clients", ...stats, rate_limits: limits, endpoints });
+        const queued = limits.reduce((n, l) => n + l.queued, 0);
+        const waitMs = limits.reduce((n, l) => n + l.queue_wait_ms, 0);
+        const limited = limits.reduce((n, l) => n + l.rate_limited, 0);
+        const throttling = queued || limited
+            ? `; ${queued} call(s) queued for ${(waitMs / 1000).toFixed(1)}s in total, ${limited} rate-limited`
+            : "";
+        const failovers = endpoints.reduce((n, e) => n + e.failovers, 0);
+        const unhealthy = endpoints.filter((e) => !e.healthy).length;
+        const pool = failovers || unhealthy
+            ? `; ${failovers} endpoint failover(s), ${unhealthy} endpoint(s) unhealthy`
+            : "";
+        console.log(chalk.dim(
+            `🔌 LLM clients: ${stats.created} created, ${stats.reused} call(s) on reused connections${throttling}${pool}`,
+        ));
+    }
+
+    logSchedulerStats(stats: SchedulerStats): void {
+        this.emit({ event_type: "scheduler", ...stats });
+        if (stats.waited > 0 || stats.forced > 0) {
+            console.log(chalk.dim(
+                `🧵 Agents: ${stats.admitted} admitted, at most ${stats.max_live} alive; ` +
+                `${stats.waited} waited ${(stats.queue_wait_ms / 1000).toFixed(1)}s in total ` +
+                `(queue peaked at ${stats.max_queue_depth}), ${stats.forced} admitted over the caps`,
+            ));
+        }
+    }
+
     static async flush(): Promise<void> {
         if (pinoLogger) {
             await pinoLogger.flush();
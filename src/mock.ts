@@ -0,0 +1,300 @@
+// Mock model backend ("mock:<policy>"), for load tests without network or spend.
+//
+// A mock model answers every agent step with a scripted repl block after a
+// simulated latency, and reports made-up token counts and costs, so the
+// scheduler, the REPL pool and the budget logic can be driven on a laptop:
+//
+//     "mock:leaf"                        -> FINAL(a slice of context), one step
+//     "mock:fanout?n=8"                  -> split context into 8 chunks, one
+//                                           batch_llm_query, FINAL the results
+//     "mock:fanout?latency=lognormal:800,0.6&output_price=10"
+//     "mock:<name>"                      -> a script registered in mock_models
+//
+// Query parameters (all optional; a registered script may set them too):
+//     latency        time to the first token: fixed:MS | uniform:MIN,MAX |
+//                    normal:MEAN,SD | exp:MEAN | lognormal:MEDIAN,SIGMA
+//     ms_per_token   extra delay per completion token (default 0)
+//     prompt_tokens, completion_tokens
+//                    fixed counts per call (default: estimated locally)
+//     input_price, output_price
+//                    USD per 1M prompt / completion tokens (default 0)
+//     error_rate     probability a call throws, like a failed provider call
+//     error_status   HTTP status of those errors, e.g. 429 (default: none, so
+//                    they aren't retried); retry_after sets their Retry-After
+//     seed           varies the random draws; a request and its repeats draw
+//                    the same sequence in every process
+//     n, slice       fan-out width and leaf slice length (built-in scripts)
+// Any other parameter is a template variable: steps may refer to {{name}}.
+//
+// Scripts pick their block by step: the Nth reply of an agent is steps[N] (the
+// last one repeats). Leaf agents, which cannot delegate, use leaf_steps.
+import { buildSystemPrompt, PromptOptions } from "./prompt.ts";
+import { loadConfig, type MockModelSpec } from "./config.ts";
+import { estimatePromptTokens, estimateTokens, type StreamOptions } from "./llm_stream.ts";
+import type { ApiRetryOptions, CodeReturn, ConfirmResult, Usage } from "./call_llm.ts";
+
+const MOCK_PREFIX = "mock:";
+
+const LEAF_STEP = `import json as _json
+_text = context if isinstance(context, str) else _json.dumps(context)
+FINAL(_text[:{{slice}}])`;
+
+const FANOUT_STEP = `import json as _json
+_text = context if isinstance(context, str) else _json.dumps(context)
+_size = max(1, -(-len(_text) // {{n}}))
+_chunks = [_text[i:i + _size] for i in range(0, len(_text), _size)] or [_text]
+_results = await batch_llm_query(*[llm_query(c) for c in _chunks])
+FINAL("\\n".join(str(r) for r in _results))`;
+
+const PRESETS: Record<string, MockModelSpec> = {
+    "leaf": { steps: [LEAF_STEP] },
+    "fanout": { steps: [FANOUT_STEP], leaf_steps: [LEAF_STEP] },
+};
+
+// Defaults for every parameter a script can leave out.
+const DEFAULTS: Record<string, string> = {
+    latency: "fixed:0",
+    ms_per_token: "0",
+    input_price: "0",
+    output_price: "0",
+    error_rate: "0",
+    seed: "0",
+    n: "4",
+    slice: "200",
+};
+
+export function isMockModel(model: string): boolean {
+    return model.startsWith(MOCK_PREFIX);
+}
+
+interface ParsedMock {
+    spec: MockModelSpec;
+    params: Record<string, string>;
+}
+
+// "mock:fanout?n=8" -> script + parameters (defaults < script < query string).
+// Registered scripts (config.mock_models) take precedence over the presets.
+function parseMockModel(model: string): ParsedMock {
+    const rest = model.slice(MOCK_PREFIX.length);
+    const [name, query] = rest.split("?", 2);
+    const registry = loadConfig().mock_models ?? {};
+    const spec = registry[name] ?? PRESETS[name];
+    if (!spec || !Array.isArray(spec.steps) || spec.steps.length === 0) {
+        const known = [...new Set([...Object.keys(PRESETS), ...Object.keys(registry)])].sort();
+        throw new Error(
+            `Unknown mock model "${model}". Built-in: mock:leaf, mock:fanout. ` +
+            `Register scripts via mock_models in your config. Known: ${known.join(", ")}.`,
+        );
+    }
+    const params: Record<string, string> = { ...DEFAULTS };
+    const { steps: _s, leaf_steps: _l, vars, ...fields } = spec;
+    for (const [k, v] of Object.entries({ ...fields, ...(vars ?? {}) })) {
+        if (v != null) params[k] = String(v);
+    }
+    for (const [k, v] of new URLSearchParams(query ?? "")) params[k] = v;
+    return { spec, params };
+}
+
+function num(params: Record<string, string>, name: string): number {
+    const value = Number(params[name]);
+    if (!Number.isFinite(value)) {
+        throw new Error(`mock model: ${name}=${params[name]} is not a number`);
+    }
+    return value;
+}
+
+// 32-bit string hash, to seed each request's draws from its content.
+function hash32(text: string): number {
+    let h = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        h ^= text.charCodeAt(i);
+        h = Math.imul(h, 0x01000193);
+    }
+    return h >>> 0;
+}
+
+// mulberry32: small seeded PRNG returning floats in [0, 1).
+function rng(seed: number): () => number {
+    let a = seed;
+    return () => {
+        a = (a + 0x6d2b79f5) | 0;
+        let t = Math.imul(a ^ (a >>> 15), 1 | a);
+        t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+    };
+}
+
+function gaussian(rand: () => number): number {
+    // Box-Muller; 1 - rand() keeps log() away from 0.
+    return Math.sqrt(-2 * Math.log(1 - rand())) * Math.cos(2 * Math.PI * rand());
+}
+
+/** Draw a latency in ms from a spec like "lognormal:800,0.6". */
+export function sampleLatency(spec: string, rand: () => number): number {
+    const [kind, args = ""] = spec.split(":", 2);
+    const a = args.split(",").map(Number);
+    if (a.some((x) => !Number.isFinite(x))) {
+        throw new Error(`mock model: bad latency "${spec}"`);
+    }
+    let ms: number;
+    switch (kind) {
+        case "fixed":
+            ms = a[0] ?? 0;
+            break;
+        case "uniform":
+            ms = a[0] + rand() * ((a[1] ?? a[0]) - a[0]);
+            break;
+        case "normal":
+            ms = a[0] + (a[1] ?? 0) * gaussian(rand);
+            break;
+        case "exp":
+            ms = -(a[0] ?? 0) * Math.log(1 - rand());
+            break;
+        case "lognormal":
+            ms = (a[0] ?? 0) * Math.exp((a[1] ?? 0) * gaussian(rand));
+            break;
+        default:
+            throw new Error(
+                `mock model: unknown latency distribution "${kind}" ` +
+                `(use fixed, uniform, normal, exp or lognormal)`,
+            );
+    }
+    return Math.max(0, ms);
+}
+
+function sleep(ms: number, signal?: AbortSignal | null): Promise<void> {
+    if (ms <= 0) return Promise.resolve();
+    return new Promise((resolve, reject) => {
+        if (signal?.aborted) return reject(signal.reason);
+        const timer = setTimeout(() => {
+            signal?.removeEventListener("abort", onAbort);
+            resolve();
+        }, ms);
+        const onAbort = () => {
+            clearTimeout(timer);
+            reject(signal!.reason);
+        };
+        signal?.addEventListener("abort", onAbort, { once: true });
+    });
+}
+
+// Steps the agent has taken: its replies, plus any that history compaction
+// folded into the "[Steps 1-N are summarized ...]" digest (history.ts).
+// deno-lint-ignore no-explicit-any
+function stepIndex(messages: any[]): number {
+    let steps = 0;
+    for (const m of messages) {
+        if (m?.role === "assistant") steps++;
+        const digest = m?.role === "user" && typeof m.content === "string"
+            ? /^\[Steps 1-(\d+) are summarized/.exec(m.content)
+            : null;
+        if (digest) steps += Number(digest[1]);
+    }
+    return steps;
+}
+
+function fillTemplate(template: string, params: Record<string, string>): string {
+    return template.replace(/\{\{(\w+)\}\}/g, (match, name) => params[name] ?? match);
+}
+
+// Times each request fingerprint has been simulated in this process.
+const repeats = new Map<number, number>();
+
+// One simulated provider call: waits, maybe fails, and prices the tokens.
+async function simulate(
+    parsed: ParsedMock,
+    // deno-lint-ignore no-explicit-any
+    promptMessages: any[],
+    system: string,
+    reply: string,
+    salt: string,
+    signal?: AbortSignal | null,
+): Promise<{ usage: Usage; firstTokenAt: string }> {
+    const { params } = parsed;
+    // The Nth repeat of a request (e.g. a retry) draws the Nth value of its own
+    // sequence: reproducible, but a retry can succeed where the first try failed.
+    const request = hash32(`${params.seed}|${salt}|${JSON.stringify(promptMessages)}`);
+    const repeat = repeats.get(request) ?? 0;
+    repeats.set(request, repeat + 1);
+    const rand = rng((request + Math.imul(repeat, 0x9e3779b9)) >>> 0);
+    const prompt = params.prompt_tokens !== undefined
+        ? num(params, "prompt_tokens")
+        : estimatePromptTokens(system, promptMessages);
+    const completion = params.completion_tokens !== undefined
+        ? num(params, "completion_tokens")
+        : estimateTokens(reply);
+
+    await sleep(sampleLatency(params.latency, rand), signal);
+    const firstTokenAt = new Date().toISOString();
+    await sleep(completion * num(params, "ms_per_token"), signal);
+    if (rand() < num(params, "error_rate")) {
+        const error = new Error("mock model: simulated provider error (error_rate)");
+        if (params.error_status !== undefined) {
+            // Shaped like the SDKs' APIError, for the rate limiter's retries.
+            Object.assign(error, {
+                status: num(params, "error_status"),
+                headers: params.retry_after !== undefined ? { "retry-after": params.retry_after } : {},
+            });
+        }
+        throw error;
+    }
+    const cost = (prompt * num(params, "input_price") + completion * num(params, "output_price")) / 1_000_000;
+    return {
+        usage: {
+            prompt_tokens: prompt,
+            completion_tokens: completion,
+            total_tokens: prompt + completion,
+            cached_tokens: 0,
+            reasoning_tokens: 0,
+            cost,
+        },
+        firstTokenAt,
+    };
+}
+
+export async function generateMockCode(
+    // deno-lint-ignore no-explicit-any
+    messages: any[],
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    _llmKwargs?: Record<string, unknown> | null,
+    stream?: StreamOptions | null,
+): Promise<CodeReturn> {
+    const parsed = parseMockModel(model_name);
+    const step = stepIndex(messages);
+    const steps = is_leaf_agent && parsed.spec.leaf_steps?.length ? parsed.spec.leaf_steps : parsed.spec.steps;
+    const code = fillTemplate(steps[Math.min(step, steps.length - 1)], { ...parsed.params, step: String(step) });
+    const content = `Step ${step + 1} (${model_name}).\n\`\`\`repl\n${code}\n\`\`\``;
+
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const signal = stream?.signal ?? options?.signal;
+    const { usage, firstTokenAt } = await simulate(parsed, messages, system, content, "code", signal);
+    return {
+        code,
+        success: true,
+        message: { role: "assistant", content },
+        usage,
+        ...(stream ? { timing: { first_token_at: firstTokenAt, early_stop: false, budget_stop: false } } : {}),
+    };
+}
+
+// The compression guard always approves: a mock has no opinion on the split.
+export async function confirmMockDelegation(
+    // deno-lint-ignore no-explicit-any
+    baseMessages: any[],
+    confirmQuestion: string,
+    model_name: string,
+    is_leaf_agent: boolean,
+    options?: ApiRetryOptions,
+    promptOpts?: PromptOptions,
+    _llmKwargs?: Record<string, unknown> | null,
+): Promise<ConfirmResult> {
+    const parsed = parseMockModel(model_name);
+    const promptMessages = [...baseMessages, { role: "user", content: confirmQuestion }];
+    const system = buildSystemPrompt(is_leaf_agent, promptOpts ?? {});
+    const reason = "YES (mock model)";
+    const { usage } = await simulate(parsed, promptMessages, system, reason, "confirm", options?.signal);
+    return { approve: true, reason, usage };
+}
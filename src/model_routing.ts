@@ -0,0 +1,81 @@
+// Model routing (model_routing).
+//
+// An agent's model used to be primary_agent at depth 0 and sub_agent at every
+// other depth, so leaf map tasks over small chunks ran on the same model as
+// the planners above them. A routing policy picks the model per agent:
+//
+//   - by_context_chars: for sub-agents, the first rule whose max_chars the
+//     agent's context fits under wins (rules are checked smallest first).
+//   - by_depth: otherwise, a model per depth ("0" is the root).
+//   - otherwise primary_agent / sub_agent, as before.
+//
+// With a cascade, agents at min_depth and below first try the cascade's
+// models, cheapest first, before the routed model. An agent escalates to the
+// next model (a fresh agent on the same task) when its FINAL value fails
+// schema validation or it runs out of steps; the routed model, last, gets the
+// usual schema retries.
+
+export interface ContextSizeRoute {
+    // Contexts of at most this many characters (JSON for dict/list contexts).
+    max_chars: number;
+    model: string;
+}
+
+export interface ModelCascade {
+    // Models to try before the routed one, cheapest first.
+    models: string[];
+    // Shallowest depth that cascades (default 1: sub-agents only).
+    min_depth?: number | null;
+}
+
+export interface ModelRouting {
+    by_depth?: Record<string, string> | null;
+    by_context_chars?: ContextSizeRoute[] | null;
+    cascade?: ModelCascade | null;
+}
+
+/** Thrown by an agent to hand its task to the next model of its cascade. */
+export class CascadeEscalation extends Error {
+    constructor(readonly model: string, readonly reason: "schema" | "steps") {
+        super(`${model} ${reason === "schema" ? "returned a FINAL value that failed schema validation" : "ran out of steps"}`);
+        this.name = "CascadeEscalation";
+    }
+}
+
+export function contextChars(context: unknown): number {
+    return typeof context === "string" ? context.length : JSON.stringify(context ?? null).length;
+}
+
+/**
+ * The models an agent at `depth` with `context` tries, in order: its cascade
+ * (if any), then its routed model. Repeats are dropped.
+ */
+export function routeModels(
+    routing: ModelRouting | null,
+    depth: number,
+    context: unknown,
+    primaryAgent: string,
+    subAgent: string,
+): string[] {
+    let model = depth === 0 ? primaryAgent : subAgent;
+    if (routing) {
+        const chars = contextChars(context);
+        const bySize = depth === 0 ? undefined : [...(routing.by_context_chars ?? [])]
+            .sort((a, b) => a.max_chars - b.max_chars)
+            .find((r) => chars <= r.max_chars);
+        model = bySize?.model ?? routing.by_depth?.[String(depth)] ?? model;
+    }
+    const cascade = routing?.cascade;
+    const cascading = cascade?.models?.length && depth >= (cascade.min_depth ?? 1);
+    const models = cascading ? [...cascade!.models, model] : [model];
+    return models.filter((m, i) => models.indexOf(m) === i);
+}
+
+/** Every model a routing policy can pick (for connection prewarming). */
+export function routedModelNames(routing: ModelRouting | null, primaryAgent: string, subAgent: string): string[] {
+    const names = new Set([primaryAgent, subAgent]);
+    for (const m of Object.values(routing?.by_depth ?? {})) names.add(m);
+    for (const r of routing?.by_context_chars ?? []) names.add(r.model);
+    for (const m of routing?.cascade?.models ?? []) names.add(m);
+    return [...names];
+}
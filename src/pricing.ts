@@ -0,0 +1,105 @@
+// Model pricing (model_prices) for costs the provider doesn't report.
+//
+// max_money_spent used to bite only when the provider returned usage.cost,
+// which OpenRouter does and the native Anthropic API, Vertex and most
+// OpenAI-compatible servers don't. Calls on those backends cost "undefined",
+// and the cap never tripped. A bundled table of list prices, overridable per
+// model by model_prices, now fills in the cost of any call the provider left
+// unpriced (including streams cut off before their usage arrived, and hedges
+// cancelled before they reported), and prices the pre-flight budget checks.
+//
+// Prices are USD per 1M tokens, like the mock backend's input_price /
+// output_price. `cached_input` applies to prompt tokens read from the
+// provider's prompt cache (default: the input price).
+import type { Usage } from "./call_llm.ts";
+
+export interface ModelPrice {
+    input: number;
+    output: number;
+    cached_input?: number | null;
+}
+
+export type ModelPrices = Record<string, ModelPrice>;
+
+// List prices at the time of writing, for the models the docs use and their
+// neighbours. Keys match a model string with any provider prefix removed and
+// dots read as dashes, by longest prefix ("claude-sonnet-4-5-20250929" is
+// priced as "claude-sonnet-4-5"). Override or extend with model_prices.
+const BUNDLED_PRICES: ModelPrices = {
+    "claude-opus-4-6": { input: 5, output: 25, cached_input: 0.5 },
+    "claude-opus-4-5": { input: 5, output: 25, cached_input: 0.5 },
+    "claude-opus-4-1": { input: 15, output: 75, cached_input: 1.5 },
+    "claude-opus-4": { input: 15, output: 75, cached_input: 1.5 },
+    "claude-sonnet-4-6": { input: 3, output: 15, cached_input: 0.3 },
+    "claude-sonnet-4-5": { input: 3, output: 15, cached_input: 0.3 },
+    "claude-sonnet-4": { input: 3, output: 15, cached_input: 0.3 },
+    "claude-haiku-4-5": { input: 1, output: 5, cached_input: 0.1 },
+    "claude-3-5-haiku": { input: 0.8, output: 4, cached_input: 0.08 },
+    "gpt-5-2": { input: 1.75, output: 14, cached_input: 0.175 },
+    "gpt-5-1": { input: 1.25, output: 10, cached_input: 0.125 },
+    "gpt-5": { input: 1.25, output: 10, cached_input: 0.125 },
+    "gpt-5-mini": { input: 0.25, output: 2, cached_input: 0.025 },
+    "gpt-5-nano": { input: 0.05, output: 0.4, cached_input: 0.005 },
+    "gpt-4-1": { input: 2, output: 8, cached_input: 0.5 },
+    "gpt-4-1-mini": { input: 0.4, output: 1.6, cached_input: 0.1 },
+    "gpt-4-1-nano": { input: 0.1, output: 0.4, cached_input: 0.025 },
+    "gpt-4o": { input: 2.5, output: 10, cached_input: 1.25 },
+    "gpt-4o-mini": { input: 0.15, output: 0.6, cached_input: 0.075 },
+    "o3": { input: 2, output: 8, cached_input: 0.5 },
+    "o4-mini": { input: 1.1, output: 4.4, cached_input: 0.275 },
+    "gemini-2-5-pro": { input: 1.25, output: 10, cached_input: 0.125 },
+    "gemini-2-5-flash": { input: 0.3, output: 2.5, cached_input: 0.03 },
+    "gemini-2-5-flash-lite": { input: 0.1, output: 0.4, cached_input: 0.01 },
+    "deepseek-chat": { input: 0.28, output: 0.42, cached_input: 0.028 },
+    "deepseek-reasoner": { input: 0.28, output: 0.42, cached_input: 0.028 },
+};
+
+// Process-wide, like the rate limits: the latest run's model_prices win.
+let overrides: ModelPrices = {};
+
+export function configurePricing(prices: ModelPrices | null): void {
+    overrides = prices ?? {};
+}
+
+// "vertex/google/gemini-2.5-flash" -> "gemini-2-5-flash".
+function normalize(model: string): string {
+    return model.slice(model.lastIndexOf("/") + 1).toLowerCase().replace(/\./g, "-");
+}
+
+/** The price of `model`: model_prices by exact name, else longest-prefix match. */
+export function priceFor(model: string): ModelPrice | null {
+    if (overrides[model]) return overrides[model];
+    const name = normalize(model);
+    let best: string | null = null;
+    let bestPrice: ModelPrice | null = null;
+    for (const table of [BUNDLED_PRICES, overrides]) {
+        for (const [key, price] of Object.entries(table)) {
+            const k = normalize(key);
+            const matches = name === k || (name.startsWith(k) && name[k.length] === "-");
+            // Ties go to model_prices, scanned last.
+            if (matches && (best == null || k.length >= best.length)) {
+                best = k;
+                bestPrice = price;
+            }
+        }
+    }
+    return bestPrice;
+}
+
+/** What `usage` costs on `model` at table prices, or undefined if unpriced. */
+export function costOf(model: string, usage: Usage): number | undefined {
+    const price = priceFor(model);
+    if (!price) return undefined;
+    const cached = Math.min(usage.cached_tokens || 0, usage.prompt_tokens || 0);
+    const uncached = (usage.prompt_tokens || 0) - cached;
+    const cost = uncached * price.input + cached * (price.cached_input ?? price.input) +
+        (usage.completion_tokens || 0) * price.output;
+    return cost / 1_000_000;
+}
+
+/** `usage` with its cost filled in from the table when the provider left it out. */
+export function withCost(model: string, usage: Usage): Usage {
+    if (usage.cost != null) return usage;
+    const cost = costOf(model, usage);
+    return cost == null ? usage : { ...usage, cost };
+}
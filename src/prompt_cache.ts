@@ -0,0 +1,75 @@
+// Provider prompt-cache hints (prompt_caching).
+//
+// Every call an agent makes starts with the same system prompt and step-0
+// probe, and each step's request extends the previous one: the system prompt,
+// probe and history are only ever appended to (see history.ts), and the
+// compression-guard call (confirmDelegation) is the agent's own prefix plus
+// one question. Providers can serve that shared prefix from cache, but some
+// only do so when asked:
+//
+//   - Anthropic: explicit cache_control breakpoints, here on the system
+//     prompt, the probe and the newest turn (so the next step reads through it).
+//   - OpenRouter, Anthropic models: the same breakpoints as content parts.
+//   - OpenAI / OpenRouter: a prompt_cache_key that routes requests sharing a
+//     prefix to the same cache.
+//   - Vertex (Gemini) and others cache implicitly; nothing is sent.
+
+const EPHEMERAL = { type: "ephemeral" } as const;
+
+export interface TextBlock {
+    type: "text";
+    text: string;
+    cache_control?: typeof EPHEMERAL;
+}
+
+// FNV-1a, 32-bit: a short, stable id for a prefix. Not a security hash.
+function fnv1a(text: string): string {
+    let h = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        h ^= text.charCodeAt(i);
+        h = Math.imul(h, 0x01000193);
+    }
+    return (h >>> 0).toString(16).padStart(8, "0");
+}
+
+/** prompt_cache_key for an agent: the same for every call sharing its prefix. */
+export function promptCacheKey(model: string, system: string, probe: unknown): string {
+    const first = typeof probe === "string" ? probe : JSON.stringify(probe ?? "");
+    return `fast-rlm-${fnv1a(model)}${fnv1a(system)}${fnv1a(first)}`;
+}
+
+/** A text block, marked as a cache breakpoint when `cache` is set. */
+export function textBlock(text: string, cache = false): TextBlock {
+    // The Messages API rejects empty text blocks.
+    return { type: "text", text: text || "(empty)", ...(cache ? { cache_control: EPHEMERAL } : {}) };
+}
+
+function isCacheHost(baseURL: string, hosts: string[]): boolean {
+    try {
+        const host = new URL(baseURL).hostname;
+        return hosts.some((h) => host === h || host.endsWith("." + h));
+    } catch {
+        return false;
+    }
+}
+
+/**
+ * Add cache hints to an OpenAI-compatible chat.completions request in place.
+ * `createParams.messages` is [system, probe, ...]; `cacheLast` also marks the
+ * newest message (generate_code, not the one-off guard question).
+ */
+// deno-lint-ignore no-explicit-any
+export function addOpenAICacheHints(createParams: any, baseURL: string, model: string, cacheLast: boolean): void {
+    const messages = createParams.messages;
+    if (!Array.isArray(messages) || messages.length === 0) return;
+    const openrouter = isCacheHost(baseURL, ["openrouter.ai"]);
+    if (openrouter || isCacheHost(baseURL, ["openai.com"])) {
+        createParams.prompt_cache_key ??= promptCacheKey(model, String(messages[0].content), messages[1]?.content);
+    }
+    if (openrouter && model.startsWith("anthropic/")) {
+        const marks = new Set([0, 1, ...(cacheLast ? [messages.length - 1] : [])]);
+        createParams.messages = messages.map((m, i) =>
+            marks.has(i) && typeof m?.content === "string" ? { ...m, content: [textBlock(m.content, true)] } : m
+        );
+    }
+}
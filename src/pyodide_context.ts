@@ -0,0 +1,46 @@
+// Hand an agent's `context` to its Pyodide REPL.
+//
+// The naive route — splicing `context = <JSON literal>` into the setup source —
+// escapes the whole payload, makes Python's parser chew through a multi-hundred-MB
+// string literal, and for dict/list double-encodes it. Instead the payload is
+// UTF-8 encoded once and written into Pyodide's in-memory filesystem; the setup
+// code reads it back as a str (or json.load for dict/list) and deletes the file,
+// so after setup the only copy left inside the REPL is the Python object itself.
+import type { loadPyodide } from "pyodide";
+
+type PyodideInterface = Awaited<ReturnType<typeof loadPyodide>>;
+
+export const CONTEXT_PATH = "/tmp/__fast_rlm_context__";
+
+// A context ready to stage: its UTF-8 bytes and whether Python should
+// json.load them (dict/list) or read them as a str. A REPL worker receives
+// `bytes.buffer` transferred, not cloned (worker_repl.ts), so the encoded copy
+// is the only one from here to MEMFS.
+export interface EncodedContext {
+    bytes: Uint8Array;
+    json: boolean;
+}
+
+export function encodeContext(context: string | Record<string, unknown> | unknown[]): EncodedContext {
+    const json = typeof context !== "string";
+    return { bytes: new TextEncoder().encode(json ? JSON.stringify(context) : context as string), json };
+}
+
+/**
+ * Write an encoded context into the Pyodide FS and return the Python
+ * statements that bind it to the global `context` (and remove the file).
+ */
+export function stageContext(pyodide: PyodideInterface, context: EncodedContext): string {
+    // canOwn: MEMFS keeps this buffer as the file's contents instead of copying
+    // it.
+    pyodide.FS.writeFile(CONTEXT_PATH, context.bytes, { canOwn: true });
+    // newline="" keeps \r\n and lone \r exactly as sent.
+    const read = context.json
+        ? "__import__('json').load(__context_file__)"
+        : "__context_file__.read()";
+    return `with open(${JSON.stringify(CONTEXT_PATH)}, encoding="utf-8", newline="") as __context_file__:
+    context = ${read}
+del __context_file__
+__import__('os').remove(${JSON.stringify(CONTEXT_PATH)})
+`;
+}
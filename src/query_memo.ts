@@ -0,0 +1,64 @@
+// In-run deduplication of identical llm_query calls (dedupe_llm_queries).
+//
+// Models often ask the same sub-question twice: a step retried after an error,
+// a loop over overlapping chunks, sibling agents handed the same slice. Every
+// llm_query of a run is fingerprinted by what determines the child's run —
+// its context, schema, tools, MCP grant, instruction, depth and model — and
+// a call whose twin is still running waits on that child instead of starting
+// another, while one whose twin already finished gets its result back. Failed
+// children are forgotten, so a retry runs again. A running twin is joined only
+// if its deadline (deadline.ts) is no earlier than the caller's child's would
+// be: it could otherwise be cut off before a result the caller had time for.
+import { sha256Hex } from "./repl_snapshot.ts";
+import { stableStringify } from "./response_cache.ts";
+
+export type QueryMemoHit = "in_flight" | "memoized";
+
+interface MemoEntry {
+    result: Promise<unknown>;
+    settled: boolean;
+    // The child's deadline (epoch ms), or null when it has none.
+    deadline: number | null;
+}
+
+export class QueryMemo {
+    private entries = new Map<string, MemoEntry>();
+
+    /** Fingerprint of an llm_query: everything that shapes the child's run. */
+    async key(request: Record<string, unknown>): Promise<string> {
+        return await sha256Hex(stableStringify(request));
+    }
+
+    /**
+     * The result of the call fingerprinted `key`: a twin's (in flight or
+     * finished) if there is one, else `start()`'s. `hit` says which. A twin
+     * still running under an earlier deadline than `deadline` is not joined;
+     * the new child replaces it as the entry later calls find.
+     */
+    share(
+        key: string,
+        start: () => Promise<unknown>,
+        deadline: number | null = null,
+    ): { result: Promise<unknown>; hit: QueryMemoHit | null } {
+        const existing = this.entries.get(key);
+        if (existing && (existing.settled || !endsSooner(existing.deadline, deadline))) {
+            return { result: existing.result, hit: existing.settled ? "memoized" : "in_flight" };
+        }
+        const entry: MemoEntry = { result: start(), settled: false, deadline };
+        this.entries.set(key, entry);
+        entry.result.then(
+            () => {
+                entry.settled = true;
+            },
+            () => {
+                if (this.entries.get(key) === entry) this.entries.delete(key);
+            },
+        );
+        return { result: entry.result, hit: null };
+    }
+}
+
+// Whether deadline `a` comes before `b` (null: no deadline).
+function endsSooner(a: number | null, b: number | null): boolean {
+    return a != null && (b == null || a < b);
+}
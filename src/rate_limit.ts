@@ -0,0 +1,306 @@
+// Per-backend adaptive rate limiting (rate_limits).
+//
+// batch_llm_query starts all its children at once and each child calls the
+// provider as soon as it can, so a wide fan-out hits the provider in bursts.
+// With every SDK client retrying 429s on its own, a burst turned into a 429
+// storm: each call backed off and retried independently while its siblings
+// kept firing. Every provider call now goes through a limiter instead:
+//
+//   - Calls queue (FIFO) for a slot under the configured requests per minute,
+//     tokens per minute and requests in flight.
+//   - A 429 halves the limiter's in-flight cap (it then grows back by one per
+//     cap's worth of successes, as TCP does) and, when the provider sends
+//     Retry-After, pauses the whole limiter until then — not just the one call.
+//   - Retries (429, 408, 409, 5xx, connection errors) happen here, up to
+//     api_max_retries, with jittered exponential backoff; the SDK clients no
+//     longer retry by themselves.
+//
+// Limits are keyed by model string, then backend ("openai" for the
+// OpenAI-compatible endpoint, "anthropic", "vertex", "mock"), then "default".
+// A model rule gets its own limiter; a backend or default rule is shared by
+// every model on that backend, since providers meter per account.
+import chalk from "npm:chalk@5";
+import type { Usage } from "./call_llm.ts";
+
+export interface RateLimit {
+    // Requests per minute.
+    rpm?: number | null;
+    // Prompt + completion tokens per minute (prompt tokens are estimated when
+    // the request is queued and corrected to the reported total after it).
+    tpm?: number | null;
+    // Requests in flight at once.
+    max_in_flight?: number | null;
+}
+
+export type RateLimits = Record<string, RateLimit>;
+
+export type LimitedBackend = "openai" | "anthropic" | "vertex" | "mock";
+
+const WINDOW_MS = 60_000;
+const BASE_BACKOFF_MS = 500;
+const MAX_BACKOFF_MS = 30_000;
+
+interface WindowEntry {
+    at: number;
+    tokens: number;
+}
+
+interface Waiter {
+    tokens: number;
+    resolve: (entry: WindowEntry) => void;
+    reject: (reason: unknown) => void;
+}
+
+export interface LimiterStats {
+    name: string;
+    calls: number;
+    // Calls that had to wait for a slot, and their total wait.
+    queued: number;
+    queue_wait_ms: number;
+    // 429 responses seen, and the current adaptive in-flight cap (null: none).
+    rate_limited: number;
+    in_flight_cap: number | null;
+}
+
+class Limiter {
+    private inFlight = 0;
+    private window: WindowEntry[] = [];
+    private waiters: Waiter[] = [];
+    private pausedUntil = 0;
+    // Adaptive in-flight cap: Infinity until the first 429.
+    private adaptiveCap = Infinity;
+    private timer: number | null = null;
+    private stats = { calls: 0, queued: 0, queue_wait_ms: 0, rate_limited: 0 };
+
+    constructor(readonly name: string, public limits: RateLimit) {}
+
+    /** Wait for a slot for a call of about `tokens` tokens. */
+    acquire(tokens: number, signal?: AbortSignal | null): Promise<WindowEntry> {
+        const queuedAt = Date.now();
+        return new Promise<WindowEntry>((resolve, reject) => {
+            if (signal?.aborted) return reject(signal.reason);
+            const waiter: Waiter = {
+                tokens,
+                resolve: (entry) => {
+                    signal?.removeEventListener("abort", onAbort);
+                    const waited = Date.now() - queuedAt;
+                    this.stats.calls += 1;
+                    if (waited > 0) {
+                        this.stats.queued += 1;
+                        this.stats.queue_wait_ms += waited;
+                    }
+                    resolve(entry);
+                },
+                reject,
+            };
+            const onAbort = () => {
+                const i = this.waiters.indexOf(waiter);
+                if (i >= 0) this.waiters.splice(i, 1);
+                reject(signal!.reason);
+                this.pump();
+            };
+            signal?.addEventListener("abort", onAbort, { once: true });
+            this.waiters.push(waiter);
+            this.pump();
+        });
+    }
+
+    /** Give a slot back; `tokens` is the call's reported total, if known. */
+    release(entry: WindowEntry, outcome: "ok" | "rate_limited" | "error", tokens?: number): void {
+        this.inFlight -= 1;
+        if (tokens != null && tokens > 0) entry.tokens = tokens;
+        if (outcome === "rate_limited") {
+            this.stats.rate_limited += 1;
+            const cap = Math.min(this.adaptiveCap, this.inFlight + 1, this.configuredCap());
+            this.adaptiveCap = Math.max(1, Math.floor(cap / 2));
+        } else if (outcome === "ok" && Number.isFinite(this.adaptiveCap)) {
+            this.adaptiveCap += 1 / Math.floor(this.adaptiveCap);
+            if (this.adaptiveCap >= this.configuredCap()) this.adaptiveCap = Infinity;
+        }
+        this.pump();
+    }
+
+    /** Hold every queued call of this limiter for `ms` (Retry-After). */
+    pause(ms: number): void {
+        this.pausedUntil = Math.max(this.pausedUntil, Date.now() + ms);
+        this.pump();
+    }
+
+    getStats(): LimiterStats {
+        return {
+            name: this.name,
+            ...this.stats,
+            in_flight_cap: Number.isFinite(this.adaptiveCap) ? Math.floor(this.adaptiveCap) : null,
+        };
+    }
+
+    private configuredCap(): number {
+        return this.limits.max_in_flight ?? Infinity;
+    }
+
+    // ms until a call of `tokens` may start: 0 now, Infinity when it waits
+    // for an in-flight call to finish (release() pumps again).
+    private waitFor(tokens: number): number {
+        const now = Date.now();
+        if (now < this.pausedUntil) return this.pausedUntil - now;
+        const cap = Math.min(this.configuredCap(), Math.floor(this.adaptiveCap));
+        if (this.inFlight >= Math.max(1, cap)) return Infinity;
+        while (this.window.length && this.window[0].at <= now - WINDOW_MS) this.window.shift();
+        const { rpm, tpm } = this.limits;
+        let wait = 0;
+        if (rpm != null && this.window.length >= rpm) {
+            wait = this.window[this.window.length - rpm].at + WINDOW_MS - now;
+        }
+        if (tpm != null && this.window.length) {
+            // Oldest entries expire first; a call bigger than tpm runs alone.
+            let used = this.window.reduce((sum, e) => sum + e.tokens, 0);
+            for (const entry of this.window) {
+                if (used + tokens <= tpm) break;
+                used -= entry.tokens;
+                wait = Math.max(wait, entry.at + WINDOW_MS - now);
+            }
+        }
+        return Math.max(0, wait);
+    }
+
+    private pump(): void {
+        if (this.timer != null) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+        while (this.waiters.length) {
+            const wait = this.waitFor(this.waiters[0].tokens);
+            if (wait === Infinity) return;
+            if (wait > 0) {
+                this.timer = setTimeout(() => {
+                    this.timer = null;
+                    this.pump();
+                }, wait);
+                return;
+            }
+            const waiter = this.waiters.shift()!;
+            const entry = { at: Date.now(), tokens: waiter.tokens };
+            this.window.push(entry);
+            this.inFlight += 1;
+            waiter.resolve(entry);
+        }
+    }
+}
+
+// Process-wide: limits are per provider account, shared by every run of the
+// engine. Configured from each run's rate_limits (the latest run's win).
+const limiters = new Map<string, Limiter>();
+let rules: RateLimits = {};
+
+export function configureRateLimits(limits: RateLimits | null): void {
+    rules = limits ?? {};
+    for (const limiter of limiters.values()) {
+        limiter.limits = rules[limiter.name] ?? rules.default ?? {};
+    }
+}
+
+function limiterFor(backend: LimitedBackend, model: string): Limiter {
+    const name = model in rules ? model : backend;
+    let limiter = limiters.get(name);
+    if (!limiter) {
+        limiter = new Limiter(name, rules[name] ?? rules.default ?? {});
+        limiters.set(name, limiter);
+    }
+    return limiter;
+}
+
+export function rateLimiterStats(): LimiterStats[] {
+    return [...limiters.values()].map((l) => l.getStats());
+}
+
+// deno-lint-ignore no-explicit-any
+function header(error: any, name: string): string | null {
+    const headers = error?.headers;
+    if (!headers) return null;
+    const value = typeof headers.get === "function" ? headers.get(name) : headers[name];
+    return typeof value === "string" ? value : null;
+}
+
+// The wait a provider asked for, in ms (retry-after-ms, or retry-after as
+// seconds or an HTTP date).
+export function retryAfterMs(error: unknown): number | null {
+    const ms = Number(header(error, "retry-after-ms"));
+    if (header(error, "retry-after-ms") && Number.isFinite(ms)) return Math.max(0, ms);
+    const raw = header(error, "retry-after");
+    if (!raw) return null;
+    const seconds = Number(raw);
+    if (Number.isFinite(seconds)) return Math.max(0, seconds * 1000);
+    const date = Date.parse(raw);
+    return Number.isNaN(date) ? null : Math.max(0, date - Date.now());
+}
+
+// deno-lint-ignore no-explicit-any
+export function statusOf(error: any): number | null {
+    return typeof error?.status === "number" ? error.status : null;
+}
+
+export function isRetryable(error: unknown): boolean {
+    const status = statusOf(error);
+    if (status != null) return status === 408 || status === 409 || status === 429 || status >= 500;
+    const name = error instanceof Error ? error.constructor.name : "";
+    return name === "APIConnectionError" || name === "APIConnectionTimeoutError";
+}
+
+function sleep(ms: number, signal?: AbortSignal | null): Promise<void> {
+    return new Promise((resolve, reject) => {
+        if (signal?.aborted) return reject(signal.reason);
+        const timer = setTimeout(() => {
+            signal?.removeEventListener("abort", onAbort);
+            resolve();
+        }, ms);
+        const onAbort = () => {
+            clearTimeout(timer);
+            reject(signal!.reason);
+        };
+        signal?.addEventListener("abort", onAbort, { once: true });
+    });
+}
+
+/**
+ * Run one provider call under its backend's limiter, retrying retryable
+ * failures up to `maxRetries` times. `request_start` on the result is when
+ * the (last) attempt left the queue: llm_call_start → request_start is the
+ * call's queue wait and backoff.
+ */
+export async function rateLimited<T extends { usage: Usage }>(
+    backend: LimitedBackend,
+    model: string,
+    estimatedTokens: number,
+    maxRetries: number,
+    signal: AbortSignal | null | undefined,
+    call: () => Promise<T>,
+): Promise<T & { request_start: string }> {
+    const limiter = limiterFor(backend, model);
+    for (let attempt = 0;; attempt++) {
+        const slot = await limiter.acquire(estimatedTokens, signal);
+        const requestStart = new Date().toISOString();
+        let out: T;
+        try {
+            out = await call();
+        } catch (error) {
+            const rateLimitedNow = statusOf(error) === 429;
+            limiter.release(slot, rateLimitedNow ? "rate_limited" : "error");
+            if (!isRetryable(error) || attempt >= maxRetries || signal?.aborted) throw error;
+            const asked = retryAfterMs(error);
+            const backoff = Math.min(MAX_BACKOFF_MS, BASE_BACKOFF_MS * 2 ** attempt) * (0.5 + Math.random() / 2);
+            const delay = asked ?? backoff;
+            console.error(chalk.yellow(
+                `⚠ ${model}: ${statusOf(error) ?? "connection error"}, retrying in ${(delay / 1000).toFixed(1)}s ` +
+                `(attempt ${attempt + 1}/${maxRetries})`,
+            ));
+            if (rateLimitedNow) {
+                limiter.pause(delay);
+            } else {
+                await sleep(delay, signal);
+            }
+            continue;
+        }
+        limiter.release(slot, "ok", out.usage.total_tokens);
+        return { ...out, request_start: requestStart };
+    }
+}
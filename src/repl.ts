@@ -0,0 +1,220 @@
+// An agent's Python REPL, as subagents.ts sees it.
+//
+// Agents never touch Pyodide directly: they run code, read globals, stage their
+// context and expose async "bridges" (llm_query, batch confirm, MCP) through
+// this interface. LocalRepl runs Pyodide on the calling thread; WorkerRepl
+// (worker_repl.ts) runs the same LocalRepl inside a Web Worker and forwards
+// every call as a message, so CPU-heavy REPL code in one agent doesn't stall
+// the others. Values crossing the interface are plain JS (structured-clone
+// safe), never PyProxy objects.
+import { loadPyodide } from "pyodide";
+import { REPL_PRELUDE } from "./repl_prelude.ts";
+import { attachWheelStore, WHEELS_CODE, type WheelStore } from "./repl_packages.ts";
+import { type EncodedContext, stageContext } from "./pyodide_context.ts";
+
+type PyodideInterface = Awaited<ReturnType<typeof loadPyodide>>;
+
+// A host function callable from Python (`await __js_llm_query__(...)`). Its
+// arguments arrive converted to plain JS; its result goes back to Python.
+export type Bridge = (...args: unknown[]) => Promise<unknown>;
+
+export interface Repl {
+    // Where the interpreter's stdout lines go; each borrowing agent rebinds it.
+    onStdout: (text: string) => void;
+    /** Expose host functions to Python as globals of the same name. */
+    setBridges(bridges: Record<string, Bridge>): Promise<void>;
+    /** Stage a context; returns the Python that binds it to `context`. */
+    stageContext(context: EncodedContext): Promise<string>;
+    /** runPythonAsync; a Python exception rejects with an Error. */
+    run(code: string): Promise<void>;
+    /** A global's value converted to plain JS (dicts → objects). */
+    get(name: string): Promise<unknown>;
+    /** Restore the post-boot baseline (see BASELINE_CODE). */
+    reset(): Promise<void>;
+    /** Size of the interpreter's WebAssembly memory, in bytes. */
+    memoryBytes(): Promise<number>;
+    /** Free the interpreter (terminates a worker). */
+    close(): void;
+}
+
+// Boot step 1 (after loading micropip, which ships with Pyodide): the import
+// hook for the local wheel store (repl_packages.ts). requests/httpx and any
+// repl_packages are unpacked from it on first import, not installed up front.
+const PACKAGES_CODE = `
+import micropip
+${WHEELS_CODE}`;
+
+// Boot step 3 (after the prelude): record what a clean REPL looks like and
+// define the reset that restores it between agents. The reset rebinds every
+// baseline global to its boot-time value, undoes patches to the public
+// attributes of modules loaded at boot, drops modules imported since, restores
+// the import machinery, os.environ and the cwd, and cancels tasks the agent
+// left running (they would otherwise call the next agent's bridges). It raises
+// if a task survives cancellation; the pool then closes the REPL.
+const BASELINE_CODE = `
+import os as _os
+import sys as _sys
+
+__fast_rlm_baseline__ = {
+    "environ": dict(_os.environ),
+    "cwd": _os.getcwd(),
+    "modules": dict(_sys.modules),
+    # Public attributes of each module (__main__'s are the globals, below).
+    "module_attrs": {
+        n: {k: v for k, v in m.__dict__.items() if not k.startswith("_")}
+        for n, m in _sys.modules.items()
+        if n != "__main__" and isinstance(getattr(m, "__dict__", None), dict)
+    },
+    "meta_path": list(_sys.meta_path),
+    "path": list(_sys.path),
+    "path_hooks": list(_sys.path_hooks),
+}
+
+async def __fast_rlm_reset__():
+    import asyncio, os, sys
+    _b = __fast_rlm_baseline__
+
+    _current = asyncio.current_task()
+    _tasks = [t for t in asyncio.all_tasks() if t is not _current and not t.done()]
+    for _t in _tasks:
+        _t.cancel()
+    for _ in range(10):
+        if all(_t.done() for _t in _tasks):
+            break
+        await asyncio.sleep(0)
+    if not all(_t.done() for _t in _tasks):
+        raise RuntimeError("REPL tasks survived cancellation")
+
+    _g = globals()
+    for _k in [k for k in _g if k not in _b["globals"]]:
+        del _g[_k]
+    _g.update(_b["globals"])
+
+    _modules = _b["modules"]
+    for _name in [n for n in sys.modules if n not in _modules]:
+        del sys.modules[_name]
+    for _name, _module in _modules.items():
+        if sys.modules.get(_name) is not _module:
+            sys.modules[_name] = _module
+    _missing = object()
+    for _name, _attrs in _b["module_attrs"].items():
+        _d = _modules[_name].__dict__
+        for _k in [k for k in _d if not k.startswith("_") and k not in _attrs]:
+            del _d[_k]
+        for _k, _v in _attrs.items():
+            if _d.get(_k, _missing) is not _v:
+                _d[_k] = _v
+    sys.meta_path[:] = _b["meta_path"]
+    sys.path[:] = _b["path"]
+    sys.path_hooks[:] = _b["path_hooks"]
+    sys.path_importer_cache.clear()
+
+    os.environ.clear()
+    os.environ.update(_b["environ"])
+    os.chdir(_b["cwd"])
+
+del _os, _sys
+__fast_rlm_baseline__["globals"] = dict(globals())
+`;
+
+export const BOOT_CODE = [PACKAGES_CODE, REPL_PRELUDE, BASELINE_CODE];
+
+// Snapshot options are underscore-prefixed (experimental) in Pyodide's API.
+type LoadOptions = Parameters<typeof loadPyodide>[0] & {
+    _makeSnapshot?: boolean;
+    _loadSnapshot?: Uint8Array;
+};
+type Snapshotting = { makeMemorySnapshot(): Uint8Array };
+
+function toPlain(val: unknown): unknown {
+    if (val && typeof (val as { toJs?: unknown }).toJs === "function") {
+        const proxy = val as { toJs: (opts: unknown) => unknown; destroy?: () => void };
+        const plain = proxy.toJs({ dict_converter: Object.fromEntries });
+        proxy.destroy?.();
+        return plain;
+    }
+    return val;
+}
+
+export class LocalRepl implements Repl {
+    onStdout: (text: string) => void = () => {};
+    pyodide: PyodideInterface = null as unknown as PyodideInterface;
+
+    // `stderr` defaults to the console; workers forward it to the main thread.
+    constructor(private stderr: (text: string) => void = (text) => console.error(`[Python Stderr]: ${text}`)) {}
+
+    private options(): LoadOptions {
+        return {
+            stderr: (text: string) => this.stderr(text),
+            stdout: (text: string) => this.onStdout(text),
+        };
+    }
+
+    /**
+     * Boot from `snapshot` if given (throws if it is unusable), else from
+     * scratch; then attach the wheel store, if any.
+     */
+    async boot(snapshot: Uint8Array | null, wheels: WheelStore | null): Promise<void> {
+        if (snapshot) {
+            // Pyodide copies the snapshot into its own memory; it wants a plain buffer.
+            const plain = snapshot.buffer instanceof SharedArrayBuffer ? new Uint8Array(snapshot) : snapshot;
+            this.pyodide = await loadPyodide({ ...this.options(), _loadSnapshot: plain });
+            // Cheap sanity check that this really is a booted REPL.
+            this.pyodide.runPython("__fast_rlm_baseline__, FINAL, llm_query");
+        } else {
+            this.pyodide = await loadPyodide(this.options());
+            await runBootCode(this.pyodide);
+        }
+        if (wheels) attachWheelStore(this.pyodide, wheels);
+    }
+
+    setBridges(bridges: Record<string, Bridge>): Promise<void> {
+        for (const [name, fn] of Object.entries(bridges)) {
+            // Convert PyProxy args synchronously: Pyodide may destroy them once
+            // the call returns its promise.
+            this.pyodide.globals.set(name, (...args: unknown[]) => fn(...args.map(toPlain)));
+        }
+        return Promise.resolve();
+    }
+
+    stageContext(context: EncodedContext): Promise<string> {
+        return Promise.resolve(stageContext(this.pyodide, context));
+    }
+
+    async run(code: string): Promise<void> {
+        await this.pyodide.runPythonAsync(code);
+    }
+
+    get(name: string): Promise<unknown> {
+        return Promise.resolve(toPlain(this.pyodide.globals.get(name)));
+    }
+
+    async reset(): Promise<void> {
+        await this.pyodide.runPythonAsync("await __fast_rlm_reset__()");
+    }
+
+    memoryBytes(): Promise<number> {
+        // The Emscripten module's heap view tracks the wasm memory as it grows.
+        // deno-lint-ignore no-explicit-any
+        const heap = (this.pyodide as any)?._module?.HEAPU8 as Uint8Array | undefined;
+        return Promise.resolve(heap?.byteLength ?? 0);
+    }
+
+    close(): void {
+        // Dropped references are garbage-collected with the interpreter.
+    }
+}
+
+async function runBootCode(pyodide: PyodideInterface): Promise<void> {
+    await pyodide.loadPackage("micropip");
+    for (const code of BOOT_CODE) {
+        await pyodide.runPythonAsync(code);
+    }
+}
+
+/** Cold-boot a throwaway interpreter and snapshot it. */
+export async function buildSnapshot(): Promise<Uint8Array> {
+    const pyodide = await loadPyodide({ _makeSnapshot: true } as LoadOptions);
+    await runBootCode(pyodide);
+    return (pyodide as unknown as Snapshotting).makeMemorySnapshot();
+}
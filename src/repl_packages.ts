@@ -0,0 +1,220 @@
+// Local wheel store for the packages agent REPLs can import.
+//
+// REPLs used to `await micropip.install(["requests", "httpx"])` from PyPI on
+// every boot: network on the hot path, variable latency, and no way to run on
+// an air-gapped host. Instead the engine resolves the package set once (online,
+// through micropip), downloads the exact wheels into the local cache directory
+// and records them in a lockfile. REPLs then get the wheels written into their
+// in-memory filesystem and a sys.meta_path finder that unpacks a package (and
+// its dependencies) into site-packages on its first import — no network, and
+// no cost for agents that never import it.
+//
+// Air-gapped hosts: copy `<cache dir>/wheels/` from a machine that has run the
+// engine once with the same Pyodide version and package list.
+import { loadPyodide, version as pyodideVersion } from "pyodide";
+import { cacheDir, sha256Hex } from "./repl_snapshot.ts";
+
+type PyodideInterface = Awaited<ReturnType<typeof loadPyodide>>;
+
+// Always available to agents; `repl_packages` in the config adds more.
+export const DEFAULT_REPL_PACKAGES = ["requests", "httpx"];
+
+// Wheels from Pyodide's own distribution are referenced by bare file name.
+const PYODIDE_CDN = `https://cdn.jsdelivr.net/pyodide/v${pyodideVersion}/full/`;
+
+// Where REPLs see the wheels (MEMFS, written per interpreter).
+const WHEELS_MOUNT = "/tmp/__fast_rlm_wheels__";
+
+interface LockedWheel {
+    file: string;
+    version: string;
+    sha256?: string;
+    imports: string[];
+    depends: string[];
+}
+
+export interface WheelLock {
+    pyodide: string;
+    packages: string[];
+    wheels: Record<string, LockedWheel>;
+}
+
+// A lock plus the wheel bytes, ready to hand to REPLs.
+export interface WheelStore {
+    lock: WheelLock;
+    files: Map<string, Uint8Array>;
+}
+
+// Part of the REPL boot code: the finder that unpacks locked wheels on import.
+export const WHEELS_CODE = `
+import sys as _sys
+
+def __fast_rlm_norm__(name):
+    import re
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+class __FastRlmWheelFinder__:
+    """Unpacks a locked wheel (and its dependencies) into site-packages the
+    first time one of its top-level modules is imported."""
+
+    def __init__(self, mount, wheels):
+        self.mount = mount
+        self.wheels = wheels
+        self.by_import = {m: n for n, w in wheels.items() for m in w["imports"]}
+        self.installed = set()
+
+    def _install(self, name):
+        if name in self.installed or name not in self.wheels:
+            return
+        self.installed.add(name)
+        for dep in self.wheels[name]["depends"]:
+            self._install(__fast_rlm_norm__(dep))
+        import sysconfig, zipfile
+        with zipfile.ZipFile(self.mount + "/" + self.wheels[name]["file"]) as zf:
+            zf.extractall(sysconfig.get_paths()["purelib"])
+
+    def find_spec(self, fullname, path=None, target=None):
+        name = self.by_import.get(fullname.partition(".")[0])
+        if name is not None and name not in self.installed:
+            self._install(name)
+            import importlib
+            importlib.invalidate_caches()
+        return None
+
+def __fast_rlm_register_wheels__(lock_json):
+    import json
+    _wheels = {__fast_rlm_norm__(n): w for n, w in json.loads(lock_json)["wheels"].items()}
+    _finder = __FastRlmWheelFinder__(${JSON.stringify(WHEELS_MOUNT)}, _wheels)
+    _sys.meta_path.insert(0, _finder)
+    # Attached after boot: part of the baseline the REPL reset restores.
+    __fast_rlm_baseline__["meta_path"].insert(0, _finder)
+
+del _sys
+`;
+
+function normName(name: string): string {
+    return name.replace(/[-_.]+/g, "-").toLowerCase();
+}
+
+function baseName(file: string): string {
+    return file.slice(file.lastIndexOf("/") + 1).split("?")[0].split("#")[0];
+}
+
+function storeDir(): string {
+    return `${cacheDir()}/wheels`;
+}
+
+function lockPath(packages: string[]): string {
+    const key = packages.map(normName).sort().join(",").replace(/[^a-z0-9,=<>!~.-]/g, "_");
+    return `${storeDir()}/lock-pyodide-${pyodideVersion}-${key}.json`;
+}
+
+async function readStore(packages: string[]): Promise<WheelStore | null> {
+    let lock: WheelLock;
+    try {
+        lock = JSON.parse(await Deno.readTextFile(lockPath(packages)));
+    } catch {
+        return null;
+    }
+    const files = new Map<string, Uint8Array>();
+    try {
+        for (const wheel of Object.values(lock.wheels)) {
+            files.set(wheel.file, await Deno.readFile(`${storeDir()}/${wheel.file}`));
+        }
+    } catch {
+        return null;
+    }
+    return { lock, files };
+}
+
+/**
+ * Resolve `packages` with micropip in a throwaway REPL (needs network), then
+ * download the exact wheels of the dependency closure and write the lockfile.
+ */
+async function buildStore(packages: string[]): Promise<WheelStore> {
+    const pyodide = await loadPyodide();
+    await pyodide.loadPackage("micropip");
+    pyodide.globals.set("__fast_rlm_packages__", pyodide.toPy(packages));
+    const frozen = JSON.parse(await pyodide.runPythonAsync(`
+import micropip
+await micropip.install(list(__fast_rlm_packages__))
+micropip.freeze()
+`)) as { packages: Record<string, Record<string, unknown>> };
+    const all = new Map(Object.entries(frozen.packages).map(([n, p]) => [normName(n), p]));
+
+    const lock: WheelLock = { pyodide: pyodideVersion, packages, wheels: {} };
+    const files = new Map<string, Uint8Array>();
+    const visit = async (name: string): Promise<void> => {
+        const key = normName(name);
+        const pkg = all.get(key);
+        if (!pkg || key in lock.wheels) return;
+        const source = String(pkg.file_name);
+        const file = baseName(source);
+        if (!file.endsWith(".whl") || /emscripten|pyodide/.test(file)) {
+            // Compiled packages need Pyodide to load their shared libraries, so
+            // they aren't unpacked by hand; agents can still micropip them.
+            return;
+        }
+        const depends = ((pkg.depends as string[]) ?? []).map(normName);
+        const imports = pkg.imports as string[] | undefined;
+        lock.wheels[key] = {
+            file,
+            version: String(pkg.version),
+            sha256: pkg.sha256 ? String(pkg.sha256) : undefined,
+            imports: imports?.length ? imports : [key.replace(/-/g, "_")],
+            depends,
+        };
+        const url = /^https?:\/\//.test(source) ? source : PYODIDE_CDN + source;
+        const res = await fetch(url);
+        if (!res.ok) throw new Error(`fetching ${url}: HTTP ${res.status}`);
+        const data = new Uint8Array(await res.arrayBuffer());
+        const expected = lock.wheels[key].sha256;
+        if (expected && (await sha256Hex(data)) !== expected) {
+            throw new Error(`checksum mismatch for ${file}`);
+        }
+        files.set(file, data);
+        for (const dep of depends) await visit(dep);
+    };
+    for (const p of packages) {
+        await visit(p.split(/[<>=!~ ;[]/)[0]);
+    }
+
+    await Deno.mkdir(storeDir(), { recursive: true });
+    for (const [file, data] of files) {
+        await Deno.writeFile(`${storeDir()}/${file}`, data);
+    }
+    const path = lockPath(packages);
+    await Deno.writeTextFile(`${path}.${Deno.pid}.tmp`, JSON.stringify(lock, null, 2));
+    await Deno.rename(`${path}.${Deno.pid}.tmp`, path);
+    console.log(`✔ REPL wheel store: ${files.size} wheel(s) locked in ${path}`);
+    return { lock, files };
+}
+
+/** The wheel store for `packages`: from the cache, else resolved online once. */
+export async function loadWheelStore(packages: string[]): Promise<WheelStore | null> {
+    const cached = await readStore(packages);
+    if (cached) return cached;
+    try {
+        return await buildStore(packages);
+    } catch (err) {
+        console.error(
+            `⚠ REPL wheel store unavailable (${err instanceof Error ? err.message : err}); ` +
+            `${packages.join(", ")} will not be importable in the REPL`,
+        );
+        return null;
+    }
+}
+
+/** Give a booted REPL the store's wheels and its import hook. */
+export function attachWheelStore(pyodide: PyodideInterface, store: WheelStore): void {
+    pyodide.FS.mkdirTree(WHEELS_MOUNT);
+    for (const [file, data] of store.files) {
+        pyodide.FS.writeFile(`${WHEELS_MOUNT}/${file}`, data);
+    }
+    const register = pyodide.globals.get("__fast_rlm_register_wheels__");
+    try {
+        register(JSON.stringify(store.lock));
+    } finally {
+        register.destroy();
+    }
+}
@@ -0,0 +1,208 @@
+// Pool of pre-booted Pyodide interpreters for agent REPLs.
+//
+// Booting a REPL (loadPyodide + micropip + the REPL prelude) costs far more
+// than a shallow leaf agent's own work, and a batch_llm_query fan-out pays it
+// once per child. Instead each agent borrows an interpreter that is already booted,
+// and hands it back when it ends; the pool resets it to its post-boot state
+// (see BASELINE_CODE in repl.ts) and keeps up to `size` spares warm in the
+// background.
+// With snapshots on, boots restore a cached memory snapshot (repl_snapshot.ts)
+// instead of running the boot code. With workers on, each interpreter lives in
+// its own Web Worker (worker_repl.ts).
+import { BOOT_CODE, buildSnapshot, LocalRepl, type Repl } from "./repl.ts";
+import { DEFAULT_REPL_PACKAGES, loadWheelStore, type WheelStore } from "./repl_packages.ts";
+import { discardSnapshot, readSnapshot, snapshotPath, writeSnapshot } from "./repl_snapshot.ts";
+import { WorkerRepl } from "./worker_repl.ts";
+
+export type { Repl };
+
+export interface ReplPoolOptions {
+    size: number;
+    snapshots: boolean;
+    packages: string[];
+    workers: boolean;
+}
+
+function errorText(err: unknown): string {
+    return err instanceof Error ? err.message : String(err);
+}
+
+export class ReplPool {
+    private idle: Repl[] = [];
+    private warming = 0;
+    private snapshots = true;
+    // Resolves to the snapshot once loaded or built; null = none, boot cold.
+    private snapshot: Promise<Uint8Array | null> | null = null;
+    private packages: string[] = DEFAULT_REPL_PACKAGES;
+    private wheels: Promise<WheelStore | null> | null = null;
+    private workers = true;
+
+    constructor(private size: number) {}
+
+    /**
+     * Set how many spare interpreters to keep warm (0 disables pooling),
+     * whether to boot them from a memory snapshot, which extra packages
+     * (beyond requests/httpx) their wheel store holds, and whether each one
+     * runs in a Web Worker.
+     */
+    configure(opts: ReplPoolOptions): void {
+        this.size = Math.max(0, Math.floor(opts.size));
+        this.trim(this.size);
+        if (opts.snapshots !== this.snapshots) {
+            this.snapshots = opts.snapshots;
+            this.snapshot = null;
+        }
+        const packages = [...new Set([...DEFAULT_REPL_PACKAGES, ...opts.packages])];
+        if (packages.join("\0") !== this.packages.join("\0")) {
+            // Spares were booted with the old store; let them go.
+            this.packages = packages;
+            this.wheels = null;
+            this.trim(0);
+        }
+        if (opts.workers !== this.workers) {
+            this.workers = opts.workers;
+            this.trim(0);
+        }
+        this.refill();
+    }
+
+    private trim(size: number): void {
+        while (this.idle.length > size) this.idle.pop()!.close();
+    }
+
+    private loadWheels(): Promise<WheelStore | null> {
+        if (!this.wheels) this.wheels = loadWheelStore(this.packages);
+        return this.wheels;
+    }
+
+    /** The cached snapshot, building and storing it on first use. */
+    private loadSnapshot(): Promise<Uint8Array | null> {
+        if (!this.snapshot) {
+            this.snapshot = (async () => {
+                const path = await snapshotPath(BOOT_CODE);
+                const stored = await readSnapshot(path) ?? await (async () => {
+                    try {
+                        const built = await buildSnapshot();
+                        await writeSnapshot(path, built);
+                        console.log(`✔ REPL snapshot saved to ${path}`);
+                        return built;
+                    } catch (err) {
+                        console.error(`⚠ REPL snapshot unavailable, booting REPLs cold: ${errorText(err)}`);
+                        return null;
+                    }
+                })();
+                if (!stored) return null;
+                // Workers all restore from one shared copy instead of a clone each.
+                const shared = new Uint8Array(new SharedArrayBuffer(stored.byteLength));
+                shared.set(stored);
+                return shared;
+            })();
+        }
+        return this.snapshot;
+    }
+
+    private newRepl(): LocalRepl | WorkerRepl {
+        if (this.workers) {
+            try {
+                return new WorkerRepl();
+            } catch (err) {
+                console.error(`⚠ REPL workers unavailable, running REPLs on the main thread: ${errorText(err)}`);
+                this.workers = false;
+            }
+        }
+        return new LocalRepl();
+    }
+
+    private async boot(): Promise<Repl> {
+        const [snapshot, wheels] = await Promise.all([
+            this.snapshots ? this.loadSnapshot() : Promise.resolve(null),
+            this.loadWheels(),
+        ]);
+        if (snapshot) {
+            const repl = this.newRepl();
+            try {
+                await repl.boot(snapshot, wheels);
+                return repl;
+            } catch (err) {
+                // Corrupt or incompatible file: drop it; the next engine rebuilds it.
+                repl.close();
+                console.error(`⚠ REPL snapshot failed to restore: ${errorText(err)}`);
+                this.snapshot = Promise.resolve(null);
+                await discardSnapshot(await snapshotPath(BOOT_CODE));
+            }
+        }
+        const repl = this.newRepl();
+        try {
+            await repl.boot(null, wheels);
+            return repl;
+        } catch (err) {
+            repl.close();
+            if (!(repl instanceof WorkerRepl)) throw err;
+            console.error(`⚠ REPL worker failed to boot, running REPLs on the main thread: ${errorText(err)}`);
+            this.workers = false;
+            const local = new LocalRepl();
+            await local.boot(null, wheels);
+            return local;
+        }
+    }
+
+    /** A clean, booted interpreter: a warm spare if one is ready, else a fresh boot. */
+    async acquire(): Promise<Repl> {
+        const repl = this.idle.pop() ?? await this.boot();
+        this.refill();
+        return repl;
+    }
+
+    /**
+     * Give an interpreter back. `clean` is false when its agent died mid-run
+     * (pending tasks, half-run code): such interpreters are dropped, not reused.
+     */
+    async release(repl: Repl, clean = true): Promise<void> {
+        repl.onStdout = () => {};
+        if (!clean || this.idle.length >= this.size) {
+            repl.close();
+            return;
+        }
+        try {
+            await repl.reset();
+        } catch {
+            repl.close();
+            return;
+        }
+        if (this.idle.length < this.size) this.idle.push(repl);
+        else repl.close();
+    }
+
+    /** Boot spares in the background, one at a time, up to `size`. */
+    private refill(): void {
+        if (this.warming > 0 || this.idle.length >= this.size) return;
+        this.warming += 1;
+        this.boot()
+            .then((repl) => {
+                this.warming -= 1;
+                if (this.idle.length < this.size) this.idle.push(repl);
+                else repl.close();
+                this.refill();
+            })
+            .catch((err) => {
+                // Don't retry in a loop; the next acquire() tries again.
+                this.warming -= 1;
+                console.error(`⚠ REPL pool: warm-up boot failed: ${errorText(err)}`);
+            });
+    }
+
+    /** Boot spares now and wait for at least one (serve-mode warm-up). */
+    async warm(): Promise<void> {
+        if (this.size === 0) {
+            (await this.boot()).close();
+            return;
+        }
+        if (this.idle.length === 0) this.idle.push(await this.boot());
+        this.refill();
+    }
+}
+
+// Process-wide pool shared by every agent of every run in this engine process.
+// Configured from the run's repl_pool_size / repl_snapshot / repl_packages /
+// repl_workers (see subagents.ts).
+export const replPool = new ReplPool(0);
@@ -0,0 +1,178 @@
+// Python definitions every agent REPL starts with: FINAL, the print override,
+// tool registration, llm_query / batch_llm_query. They don't depend on the
+// agent (its context, tools and per-agent state are set up in subagents.ts), so
+// the REPL pool runs them once per interpreter at boot, and they are part of
+// the memory snapshot (repl_snapshot.ts).
+//
+// Globals these refer to but don't define — context, __final_result__,
+// __tools__, __js_llm_query__, __js_batch_confirm__ — are bound per agent.
+export const REPL_PRELUDE = `
+def FINAL(x):
+    global __final_result__, __final_result_set__
+    __final_result__ = x
+    __final_result_set__ = True
+
+# Pretty-print Pydantic models, JsProxy objects, and nested dicts/lists as
+# JSON. Plain strings/numbers/etc. fall through to the original print.
+import builtins as __builtins__
+__real_print__ = __builtins__.print
+
+def __coerce_for_print__(o, _seen=None):
+    if _seen is None:
+        _seen = set()
+    _oid = id(o)
+    if _oid in _seen:
+        return o
+    try:
+        from pydantic import BaseModel as __BaseModel
+        if isinstance(o, __BaseModel):
+            return o.model_dump(mode="json")
+    except ImportError:
+        pass
+    if hasattr(o, "to_py") and not isinstance(o, (str, bytes)):
+        try:
+            o = o.to_py()
+        except Exception:
+            return o
+    if isinstance(o, dict):
+        _seen.add(_oid)
+        return {k: __coerce_for_print__(v, _seen) for k, v in o.items()}
+    if isinstance(o, (list, tuple, set)):
+        _seen.add(_oid)
+        return [__coerce_for_print__(x, _seen) for x in o]
+    return o
+
+def print(*args, **kwargs):
+    import json as __json
+    _out = []
+    for _a in args:
+        _c = __coerce_for_print__(_a)
+        if _c is _a or isinstance(_a, (str, bytes, int, float, bool)) or _a is None:
+            _out.append(_a)
+            continue
+        try:
+            _out.append(__json.dumps(_c, indent=2, default=str, ensure_ascii=False))
+        except Exception:
+            _out.append(_a)
+    __real_print__(*_out, **kwargs)
+
+__builtins__.print = print
+
+def __register_tool__(src):
+    _ns = {}
+    exec(src, globals(), _ns)
+    _fn = next((v for v in _ns.values() if callable(v)), None)
+    if _fn is None:
+        raise ValueError("Tool source defined no callable: " + src[:200])
+    try:
+        _fn.__fast_rlm_source__ = src
+    except (AttributeError, TypeError):
+        pass
+    globals()[_fn.__name__] = _fn
+    __tools__.append(_fn)
+
+class _LazyQuery:
+    """Awaitable handle for a sub-agent query.
+
+    Awaiting it runs the call normally (with the per-call compression guard).
+    batch_llm_query reads its .context up front (one batch judge) and runs it
+    with the guard suppressed.
+    """
+    __slots__ = ("context", "schema", "tools", "mcp", "instruction", "budget", "deadline_s")
+
+    def __init__(self, context, schema, tools, mcp, instruction, budget, deadline_s):
+        self.context = context
+        self.schema = schema
+        self.tools = tools
+        self.mcp = mcp
+        self.instruction = instruction
+        self.budget = budget
+        self.deadline_s = deadline_s
+
+    def __await__(self):
+        return self._run(False).__await__()
+
+    async def _run(self, suppress, share=1):
+        _tool_sources = None
+        if self.tools:
+            import inspect as _inspect
+            _tool_sources = []
+            for _t in self.tools:
+                _stashed = getattr(_t, "__fast_rlm_source__", None)
+                if _stashed is not None:
+                    _tool_sources.append(_stashed)
+                else:
+                    _tool_sources.append(_inspect.getsource(_t))
+        _mcp = list(self.mcp) if self.mcp else None
+        _result = await __js_llm_query__(self.context, self.schema, _tool_sources, _mcp, self.instruction, suppress,
+                                       self.budget, share, self.deadline_s)
+        if hasattr(_result, "to_py"):
+            return _result.to_py()
+        return _result
+
+
+def llm_query(context, schema=None, *, tools=None, mcp=None, instruction=None, budget=None,
+              deadline_s=None):
+    """Recursively query a sub-agent. Use 'await llm_query(...)'.
+
+    Args:
+        context: str or dict — the task/context for the sub-agent.
+        schema: optional JSON Schema (as a dict) the sub-agent's FINAL must satisfy.
+        tools: optional list of Python functions to expose in the sub-agent's REPL.
+            By default the sub-agent does NOT inherit your tools; pass them
+            explicitly here if you want the child to have access.
+        mcp: optional list of MCP server-name strings to grant the sub-agent.
+            By default the sub-agent inherits NO MCP servers; name the ones it
+            may use (e.g. mcp=["fsio"]) and it gets that server's tools/resources.
+        instruction: optional string directive shown ONLY to this sub-agent
+            (appended to its system prompt). It is not inherited by the child's
+            own sub-agents and does not carry over from you — pass it again on
+            each llm_query call where you want it to apply.
+        budget: optional cap on the sub-agent's budget: a number (USD) or a dict
+            with any of "money", "prompt_tokens", "completion_tokens". By default
+            it gets what you have left (an even share of it in a batch), and
+            whatever it doesn't spend comes back to you when it ends.
+        deadline_s: optional time limit for the sub-agent, in seconds. It can
+            only shorten the time it inherits from you. If it runs out, the
+            call raises an error that includes the sub-agent's partial output.
+    """
+    return _LazyQuery(context, schema, tools, mcp, instruction, budget, deadline_s)
+
+
+async def batch_llm_query(*queries):
+    """Run several sub-agent queries in PARALLEL — a drop-in for
+    asyncio.gather(*[llm_query(...), llm_query(...), ...]).
+
+    Unlike asyncio.gather, the whole batch is checked for compression ONCE (a
+    single reviewer call decides whether to approve the entire fan-out), instead
+    of each call being checked separately. Prefer this over asyncio.gather when
+    you delegate to many sub-agents at once. Returns results in order.
+
+        results = await batch_llm_query(llm_query(c1), llm_query(c2), llm_query(c3))
+    """
+    import asyncio as _asyncio
+    import json as _json
+    qs = list(queries)
+    if len(qs) == 1 and isinstance(qs[0], (list, tuple)):
+        qs = list(qs[0])
+    if not all(isinstance(q, _LazyQuery) for q in qs):
+        raise TypeError("batch_llm_query expects llm_query(...) calls, e.g. "
+                        "batch_llm_query(llm_query(a), llm_query(b))")
+
+    def _meta(ctx):
+        s = ctx if isinstance(ctx, str) else _json.dumps(ctx)
+        return {"childChars": len(s), "preview": s[:160]}
+
+    _parent = context if isinstance(context, str) else _json.dumps(context)
+    _payload = {"parentChars": len(_parent), "items": [_meta(q.context) for q in qs]}
+    _approved = await __js_batch_confirm__(_json.dumps(_payload))
+    if not _approved:
+        raise RuntimeError(
+            "BATCH_DELEGATION_REJECTED: this parallel batch was declined as "
+            "under-compressed. Slice/filter/summarize each context in your OWN "
+            "REPL first, then delegate only the reduced results."
+        )
+    # Each child's default budget is an even share of what is left when it
+    # starts: the i-th gets 1/(n - i) of it.
+    return await _asyncio.gather(*[q._run(True, len(qs) - i) for i, q in enumerate(qs)])
+`;
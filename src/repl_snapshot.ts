@@ -0,0 +1,60 @@
+// Pyodide memory snapshots of a booted agent REPL.
+//
+// Booting a REPL means starting Pyodide, installing micropip + requests/httpx
+// and running the REPL prelude. A memory snapshot taken right after that boot
+// restores to the same state in a fraction of the time, so the engine builds
+// one once, stores it in the local cache directory, and restores every later
+// REPL from it (see repl_pool.ts).
+//
+// The file name carries a hash of the Pyodide version and all the code the
+// boot runs, so changing either makes the engine build a fresh snapshot; stale
+// files are left for the user to clear.
+import { version as pyodideVersion } from "pyodide";
+
+/** `$FAST_RLM_CACHE_DIR`, else `~/.cache/fast-rlm`. */
+export function cacheDir(): string {
+    const explicit = Deno.env.get("FAST_RLM_CACHE_DIR");
+    if (explicit) return explicit;
+    const home = Deno.env.get("HOME") ?? Deno.env.get("USERPROFILE") ?? ".";
+    return `${home}/.cache/fast-rlm`;
+}
+
+/** Hex SHA-256 of a string (as UTF-8) or of raw bytes. */
+export async function sha256Hex(data: string | Uint8Array): Promise<string> {
+    const bytes = typeof data === "string" ? new TextEncoder().encode(data) : data;
+    const digest = await crypto.subtle.digest("SHA-256", bytes);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+/** Where the snapshot for this Pyodide version + boot code lives. */
+export async function snapshotPath(bootCode: string[]): Promise<string> {
+    const key = (await sha256Hex([pyodideVersion, ...bootCode].join("\0"))).slice(0, 16);
+    return `${cacheDir()}/snapshots/pyodide-${pyodideVersion}-${key}.bin`;
+}
+
+/** The stored snapshot, or null if there is none (or it can't be read). */
+export async function readSnapshot(path: string): Promise<Uint8Array | null> {
+    try {
+        return await Deno.readFile(path);
+    } catch {
+        return null;
+    }
+}
+
+/** Store a snapshot atomically (concurrent engines may build the same one). */
+export async function writeSnapshot(path: string, snapshot: Uint8Array): Promise<void> {
+    const dir = path.slice(0, path.lastIndexOf("/"));
+    await Deno.mkdir(dir, { recursive: true });
+    const tmp = `${path}.${Deno.pid}.tmp`;
+    await Deno.writeFile(tmp, snapshot);
+    await Deno.rename(tmp, path);
+}
+
+/** Drop a snapshot that failed to restore, so the next boot rebuilds it. */
+export async function discardSnapshot(path: string): Promise<void> {
+    try {
+        await Deno.remove(path);
+    } catch {
+        // Already gone.
+    }
+}
@@ -0,0 +1,73 @@
+// Web Worker entry for WorkerRepl (worker_repl.ts): hosts one LocalRepl and
+// serves its interface over postMessage. Bridge calls from Python go back to
+// the main thread as {op: "call"} messages and resolve on the matching reply.
+import { LocalRepl } from "./repl.ts";
+
+// Typed view of the worker global scope (this file is type-checked as a module).
+const scope = self as unknown as {
+    postMessage(msg: unknown): void;
+    onmessage: ((e: MessageEvent) => void) | null;
+};
+
+const repl = new LocalRepl((text) => scope.postMessage({ op: "stderr", text }));
+repl.onStdout = (text) => scope.postMessage({ op: "stdout", text });
+
+let nextCall = 0;
+const calls = new Map<number, { resolve: (v: unknown) => void; reject: (e: Error) => void }>();
+
+function callHost(name: string, args: unknown[]): Promise<unknown> {
+    const call = nextCall++;
+    return new Promise((resolve, reject) => {
+        calls.set(call, { resolve, reject });
+        try {
+            scope.postMessage({ op: "call", call, name, args });
+        } catch (err) {
+            calls.delete(call);
+            reject(err instanceof Error ? err : new Error(String(err)));
+        }
+    });
+}
+
+scope.onmessage = async (e: MessageEvent) => {
+    const msg = e.data;
+    if (msg.op === "reply") {
+        const pending = calls.get(msg.call);
+        calls.delete(msg.call);
+        if (msg.error !== undefined) pending?.reject(new Error(msg.error));
+        else pending?.resolve(msg.value);
+        return;
+    }
+    try {
+        let value: unknown = undefined;
+        switch (msg.op) {
+            case "boot":
+                await repl.boot(msg.snapshot ?? null, msg.wheels ?? null);
+                break;
+            case "bridges":
+                await repl.setBridges(Object.fromEntries(
+                    (msg.names as string[]).map((name) => [name, (...args: unknown[]) => callHost(name, args)]),
+                ));
+                break;
+            case "stage":
+                value = await repl.stageContext(msg.context);
+                break;
+            case "run":
+                await repl.run(msg.code);
+                break;
+            case "get":
+                value = await repl.get(msg.name);
+                break;
+            case "reset":
+                await repl.reset();
+                break;
+            case "memory":
+                value = await repl.memoryBytes();
+                break;
+            default:
+                throw new Error(`unknown REPL worker op: ${msg.op}`);
+        }
+        scope.postMessage({ op: "done", id: msg.id, value });
+    } catch (err) {
+        scope.postMessage({ op: "done", id: msg.id, error: err instanceof Error ? err.message : String(err) });
+    }
+};
@@ -0,0 +1,141 @@
+// Disk cache of LLM responses, keyed by request fingerprint (response_cache).
+//
+// Re-running a benchmark or retrying a crashed batch repeats many requests
+// byte-for-byte: same model, system prompt, messages and llm_kwargs. With the
+// cache on, generate_code() and confirmDelegation() (every backend) look the
+// request up first and only call the provider on a miss. Entries are JSON
+// files named by the SHA-256 of the request, sharded by the first two hex
+// digits; file mtimes record last use, and the least recently used entries are
+// evicted once the store grows past its size cap.
+//
+// Only deterministic requests (temperature 0, a fixed seed) are worth caching;
+// anything else would replay one sample forever. That's why it's opt-in.
+import { cacheDir, sha256Hex } from "./repl_snapshot.ts";
+
+export interface ResponseCacheOptions {
+    enabled: boolean;
+    // null → <cache dir>/responses (see repl_snapshot.ts cacheDir()).
+    dir: string | null;
+    maxBytes: number;
+}
+
+interface IndexEntry {
+    size: number;
+    used: number; // ms since epoch
+}
+
+// JSON with object keys sorted, so equal requests hash equally.
+export function stableStringify(value: unknown): string {
+    return JSON.stringify(value, (_k, v) =>
+        v && typeof v === "object" && !Array.isArray(v)
+            ? Object.fromEntries(Object.keys(v).sort().map((k) => [k, v[k]]))
+            : v);
+}
+
+export class ResponseCache {
+    private enabled = false;
+    private dir = "";
+    private maxBytes = 0;
+    // Loaded from disk on first use: path → size and last use.
+    private index: Promise<Map<string, IndexEntry>> | null = null;
+    private totalBytes = 0;
+
+    configure(opts: ResponseCacheOptions): void {
+        const dir = opts.dir ?? `${cacheDir()}/responses`;
+        if (dir !== this.dir) this.index = null;
+        this.enabled = opts.enabled;
+        this.dir = dir;
+        this.maxBytes = Math.max(0, opts.maxBytes);
+    }
+
+    get active(): boolean {
+        return this.enabled;
+    }
+
+    /** Fingerprint of a request: everything that can change the response. */
+    async key(request: Record<string, unknown>): Promise<string> {
+        return await sha256Hex(stableStringify(request));
+    }
+
+    private path(key: string): string {
+        return `${this.dir}/${key.slice(0, 2)}/${key}.json`;
+    }
+
+    private loadIndex(): Promise<Map<string, IndexEntry>> {
+        if (!this.index) {
+            this.index = (async () => {
+                const index = new Map<string, IndexEntry>();
+                this.totalBytes = 0;
+                try {
+                    for await (const shard of Deno.readDir(this.dir)) {
+                        if (!shard.isDirectory) continue;
+                        for await (const file of Deno.readDir(`${this.dir}/${shard.name}`)) {
+                            if (!file.isFile || !file.name.endsWith(".json")) continue;
+                            const path = `${this.dir}/${shard.name}/${file.name}`;
+                            const info = await Deno.stat(path);
+                            index.set(path, { size: info.size, used: info.mtime?.getTime() ?? 0 });
+                            this.totalBytes += info.size;
+                        }
+                    }
+                } catch {
+                    // No store yet.
+                }
+                return index;
+            })();
+        }
+        return this.index;
+    }
+
+    /** The stored response for `key`, or null on a miss. */
+    async get<T>(key: string): Promise<T | null> {
+        const path = this.path(key);
+        let text: string;
+        try {
+            text = await Deno.readTextFile(path);
+        } catch {
+            return null;
+        }
+        const index = await this.loadIndex();
+        const now = new Date();
+        const entry = index.get(path);
+        if (entry) entry.used = now.getTime();
+        // Record the use on disk too, for other engine processes' eviction.
+        Deno.utime(path, now, now).catch(() => {});
+        try {
+            return JSON.parse(text) as T;
+        } catch {
+            return null;
+        }
+    }
+
+    /** Store a response, then evict least recently used entries over the cap. */
+    async put(key: string, value: unknown): Promise<void> {
+        const path = this.path(key);
+        const data = new TextEncoder().encode(JSON.stringify(value));
+        const index = await this.loadIndex();
+        try {
+            await Deno.mkdir(path.slice(0, path.lastIndexOf("/")), { recursive: true });
+            const tmp = `${path}.${Deno.pid}.tmp`;
+            await Deno.writeFile(tmp, data);
+            await Deno.rename(tmp, path);
+        } catch {
+            return; // Caching is best-effort.
+        }
+        this.totalBytes -= index.get(path)?.size ?? 0;
+        index.set(path, { size: data.byteLength, used: Date.now() });
+        this.totalBytes += data.byteLength;
+        if (this.totalBytes <= this.maxBytes) return;
+        const oldest = [...index.entries()].sort((a, b) => a[1].used - b[1].used);
+        for (const [victim, entry] of oldest) {
+            if (this.totalBytes <= this.maxBytes) break;
+            if (victim === path) continue;
+            index.delete(victim);
+            this.totalBytes -= entry.size;
+            await Deno.remove(victim).catch(() => {});
+        }
+    }
+}
+
+// Process-wide; configured from each run's response_cache settings (the
+// latest run's settings win, as for the REPL pool).
+export const responseCache = new ResponseCache();
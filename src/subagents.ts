@@ -1,4 +1,3 @@
-import { loadPyodide } from "pyodide";
 // ajv ships as CJS; Deno's npm interop wraps the default export in a namespace
 // whose `.default` property is the actual constructor.
 // deno-lint-ignore no-explicit-any
@@ -14,8 +13,19 @@ interface ValidateFunction {
     (data: unknown): boolean;
     errors?: AjvError[] | null;
 }
-import { confirmDelegation, generate_code, Usage } from "./call_llm.ts";
-import { loadConfig } from "./config.ts";
+import { confirmDelegation, generate_code, prewarmModelConnections, Usage } from "./call_llm.ts";
+import { clientStats } from "./llm_clients.ts";
+import { configureRateLimits, type RateLimits, rateLimiterStats } from "./rate_limit.ts";
+import { estimatePromptTokens, type StreamOptions } from "./llm_stream.ts";
+import { buildSystemPrompt } from "./prompt.ts";
+import { configurePricing, costOf, type ModelPrices } from "./pricing.ts";
+import { type CompactionPolicy, compactHistory } from "./history.ts";
+import { responseCache } from "./response_cache.ts";
+import { Cassette } from "./cassette.ts";
+import { QueryMemo } from "./query_memo.ts";
+import { BudgetNode, parseBudgetRequest } from "./budget.ts";
+import { childDeadline, DeadlineExceeded, deadlineNudge, parseDeadline, shouldNudge } from "./deadline.ts";
+import { loadConfig, setActiveConfig, type RlmConfig } from "./config.ts";
 import { isAcpModel } from "./acp.ts";
 // MCP is optional: only the *types* are imported statically (erased at compile,
 // so they pull in nothing at runtime). The implementation in ./mcp.ts — and its
@@ -23,9 +33,21 @@ import { isAcpModel } from "./acp.ts";
 // import() below, only when the run actually configures MCP servers. Runs without
 // MCP never fetch or load the SDK.
 import type { McpHandle, McpServersConfig } from "./mcp.ts";
-import { Logger, setLogDir, setLogPrefix, getLogFile } from "./logging.ts";
+import { Logger, setLogDir, setLogPrefix, getLogFile, closeLogFile, type EventSink } from "./logging.ts";
 import { startSpinner, showGlobalUsage, printStep } from "./ui.ts";
-import { trackUsage, getTotalUsage, resetUsage, trackCall, getTotalCalls } from "./usage.ts";
+import { encodeContext } from "./pyodide_context.ts";
+import type { Bridge } from "./repl.ts";
+import { type Repl, replPool } from "./repl_pool.ts";
+import { agentScheduler, type AgentSlot } from "./agent_scheduler.ts";
+import type { HedgePolicy } from "./hedging.ts";
+import { CascadeEscalation, type ModelRouting, routedModelNames, routeModels } from "./model_routing.ts";
+import {
+    configureEndpointPools,
+    type EndpointPools,
+    endpointPoolStats,
+    type EndpointRouting,
+} from "./endpoint_pool.ts";
+import { defaultUsageTracker, emptyUsage, type ModelUsage, UsageTracker } from "./usage.ts";
 import chalk from "npm:chalk@5";
 
 const _ajv = new Ajv({ strict: false, allErrors: true });
@@ -55,47 +77,254 @@ function formatValidationErrors(validate: ValidateFunction): string {
         .join("\n");
 }
 
-const _config = loadConfig();
-const MAX_CALLS = _config.max_calls_per_subagent ?? 20;
-const MAX_DEPTH = _config.max_depth ?? 3;
-const TRUNCATE_LEN = _config.truncate_len ?? 5000;
-// primary_agent is required (no default). sub_agent falls back to primary_agent.
-function requirePrimaryAgent(): string {
-    const p = _config.primary_agent;
-    if (!p) {
+// Per-run engine settings, resolved from an RlmConfig. The CLI path resolves
+// one from --config; serve mode (--serve) resolves one per request, so a warm
+// engine can run queries with different configs back to back.
+export interface RunSettings {
+    maxCalls: number;
+    maxDepth: number;
+    truncateLen: number;
+    primaryAgent: string;
+    subAgent: string;
+    maxMoneySpent: number;
+    maxCompletionTokens: number;
+    maxPromptTokens: number;
+    maxGlobalCalls: number;
+    apiMaxRetries: number;
+    apiTimeoutMs: number;
+    enableTools: boolean;
+    enableStructuredIo: boolean;
+    enableCompressionGuard: boolean;
+    compressionMinChars: number;
+    compressionRatio: number;
+    // run(instruction=...) — applies to the ROOT agent only. Sub-agents are NOT
+    // given this; they receive an instruction only when their parent passes one
+    // explicitly via llm_query(instruction=...). There is intentionally no
+    // global instruction.
+    rootInstruction: string | null;
+    // Spare Pyodide interpreters the engine keeps booted for new agents. The
+    // pool is per engine process, so the latest run's value wins.
+    replPoolSize: number;
+    // Boot REPLs from a cached Pyodide memory snapshot (repl_snapshot.ts).
+    replSnapshot: boolean;
+    // Extra packages importable in every REPL, from the local wheel store
+    // (repl_packages.ts); requests and httpx are always included.
+    replPackages: string[];
+    // Run each REPL in its own Web Worker (worker_repl.ts) so agents' Python
+    // executes in parallel; falls back to the main thread if workers fail.
+    replWorkers: boolean;
+    // Open connections to the model endpoints when a run starts, before the
+    // first LLM call (llm_clients.ts).
+    prewarmConnections: boolean;
+    // Stream completions and stop each one after its first repl block
+    // (llm_stream.ts).
+    streamCompletions: boolean;
+    // History compaction (history.ts): steps resent verbatim (null = all) and
+    // whether provider reasoning is stripped from resent replies.
+    historyKeepSteps: number | null;
+    historyDropReasoning: boolean;
+    // Send provider prompt-cache hints (prompt_cache.ts).
+    promptCaching: boolean;
+    // Disk cache of LLM responses (response_cache.ts); off by default.
+    responseCache: boolean;
+    responseCacheDir: string | null;
+    responseCacheMaxMb: number;
+    // Share one child run between identical llm_query calls (query_memo.ts).
+    dedupeLlmQueries: boolean;
+    // Per-model/backend request, token and concurrency limits (rate_limit.ts).
+    rateLimits: RateLimits | null;
+    // Agent admission caps (agent_scheduler.ts); null = none.
+    maxLiveAgents: number | null;
+    maxReplMemoryMb: number | null;
+    // Duplicate slow generate_code calls (hedging.ts); null = off.
+    hedgeRequests: HedgePolicy | null;
+    // Endpoint pools for the OpenAI-compatible backend (endpoint_pool.ts).
+    endpoints: EndpointPools | null;
+    endpointRouting: EndpointRouting;
+    // Per-depth / per-context-size models and the model cascade
+    // (model_routing.ts); null = primary_agent at the root, sub_agent below.
+    modelRouting: ModelRouting | null;
+    // Per-model prices over the bundled table (pricing.ts).
+    modelPrices: ModelPrices | null;
+    // Carve each sub-agent's budget out of its parent's (budget.ts).
+    budgetReservations: boolean;
+    // Wall-clock limit on the run, in seconds (deadline.ts); null = none.
+    deadlineS: number | null;
+}
+
+export function resolveRunSettings(config: RlmConfig): RunSettings {
+    // primary_agent is required (no default). sub_agent falls back to primary_agent.
+    const primaryAgent = config.primary_agent;
+    if (!primaryAgent) {
         throw new Error(
             "primary_agent is required and has no default — set it in the config " +
             "(e.g. rlm_config.yaml or RLMConfig(primary_agent=...)).",
         );
     }
-    return p;
+    const subAgent = config.sub_agent ?? primaryAgent;
+    // ACP runs have no working token/cost budget (usage is always zero), so they
+    // get a default global call ceiling of 50 unless overridden. Other backends
+    // stay unlimited by default and rely on the token/cost budgets.
+    const modelRouting = config.model_routing ?? null;
+    const acpRun = routedModelNames(modelRouting, primaryAgent, subAgent).some(isAcpModel);
+    return {
+        maxCalls: config.max_calls_per_subagent ?? 20,
+        maxDepth: config.max_depth ?? 3,
+        truncateLen: config.truncate_len ?? 5000,
+        primaryAgent,
+        subAgent,
+        maxMoneySpent: config.max_money_spent ?? Infinity,
+        maxCompletionTokens: config.max_completion_tokens ?? 50000,
+        maxPromptTokens: config.max_prompt_tokens ?? 200000,
+        maxGlobalCalls: config.max_global_calls ?? (acpRun ? 50 : Infinity),
+        apiMaxRetries: config.api_max_retries ?? 3,
+        apiTimeoutMs: config.api_timeout_ms ?? 600000,
+        enableTools: config.enable_tools ?? true,
+        enableStructuredIo: config.enable_structured_io ?? true,
+        enableCompressionGuard: config.enable_compression_guard ?? true,
+        compressionMinChars: config.compression_min_chars ?? 5000,
+        compressionRatio: config.compression_ratio ?? 0.6,
+        rootInstruction: config.instruction ?? null,
+        replPoolSize: config.repl_pool_size ?? 2,
+        replSnapshot: config.repl_snapshot ?? true,
+        replPackages: config.repl_packages ?? [],
+        replWorkers: config.repl_workers ?? true,
+        prewarmConnections: config.prewarm_connections ?? false,
+        streamCompletions: config.stream_completions ?? true,
+        historyKeepSteps: config.history_keep_steps ?? null,
+        historyDropReasoning: config.history_drop_reasoning ?? true,
+        promptCaching: config.prompt_caching ?? true,
+        responseCache: config.response_cache ?? false,
+        responseCacheDir: config.response_cache_dir ?? null,
+        responseCacheMaxMb: config.response_cache_max_mb ?? 1024,
+        dedupeLlmQueries: config.dedupe_llm_queries ?? true,
+        rateLimits: config.rate_limits ?? null,
+        maxLiveAgents: config.max_live_agents ?? null,
+        maxReplMemoryMb: config.max_repl_memory_mb ?? null,
+        hedgeRequests: config.hedge_requests ?? null,
+        endpoints: config.endpoints ?? null,
+        endpointRouting: config.endpoint_routing ?? "least_outstanding",
+        modelRouting,
+        modelPrices: config.model_prices ?? null,
+        budgetReservations: config.budget_reservations ?? true,
+        deadlineS: config.deadline_s ?? null,
+    };
+}
+
+// State shared by every agent of one root run (root + all its sub-agents).
+export interface RunState {
+    settings: RunSettings;
+    // Usage/call totals for this root run only; budgets are checked against it.
+    usage: UsageTracker;
+    // Live event consumer (fast_rlm.stream / run(on_event=...)), if any.
+    onEvent?: EventSink | null;
+    // Aborted when the client cancels the run; agents stop before their next call.
+    signal?: AbortSignal | null;
+    // Budgets that already emitted a budget_warning event.
+    budgetWarnings: Set<string>;
+    // run(record=...) / run(replay=...): external calls go through it.
+    cassette?: Cassette | null;
+    // Identical llm_query calls of this run (dedupe_llm_queries).
+    queryMemo: QueryMemo;
+    // The root agent's budget node; sub-agents get grants carved from it.
+    budget: BudgetNode;
+    // When the root agent must finish (epoch ms; deadline_s), or null.
+    deadline: number | null;
 }
-const PRIMARY_AGENT: string = requirePrimaryAgent();
-const SUB_AGENT: string = _config.sub_agent ?? PRIMARY_AGENT;
-const MAX_MONEY_SPENT = _config.max_money_spent ?? Infinity;
-const MAX_COMPLETION_TOKENS = _config.max_completion_tokens ?? 50000;
-const MAX_PROMPT_TOKENS = _config.max_prompt_tokens ?? 200000;
-// ACP runs have no working token/cost budget (usage is always zero), so they get
-// a default global call ceiling of 50 unless overridden. Other backends stay
-// unlimited by default and rely on the token/cost budgets.
-const _acpRun = isAcpModel(PRIMARY_AGENT) || isAcpModel(SUB_AGENT);
-const MAX_GLOBAL_CALLS = _config.max_global_calls ?? (_acpRun ? 50 : Infinity);
-const API_MAX_RETRIES = _config.api_max_retries ?? 3;
-const API_TIMEOUT_MS = _config.api_timeout_ms ?? 600000;
-const ENABLE_TOOLS = _config.enable_tools ?? true;
-const ENABLE_STRUCTURED_IO = _config.enable_structured_io ?? true;
-const ENABLE_COMPRESSION_GUARD = _config.enable_compression_guard ?? true;
-const COMPRESSION_MIN_CHARS = _config.compression_min_chars ?? 5000;
-const COMPRESSION_RATIO = _config.compression_ratio ?? 0.6;
-// run(instruction=...) — applies to the ROOT agent only. Sub-agents are NOT given
-// this; they receive an instruction only when their parent passes one explicitly
-// via llm_query(instruction=...). There is intentionally no global instruction.
-const ROOT_INSTRUCTION = _config.instruction ?? null;
-
-function truncateText(text: string): string {
+
+export function newRunState(
+    settings: RunSettings,
+    opts: {
+        usage?: UsageTracker;
+        onEvent?: EventSink | null;
+        signal?: AbortSignal | null;
+        cassette?: Cassette | null;
+    } = {},
+): RunState {
+    return {
+        settings,
+        usage: opts.usage ?? new UsageTracker(),
+        onEvent: opts.onEvent ?? null,
+        signal: opts.signal ?? null,
+        budgetWarnings: new Set(),
+        cassette: opts.cassette ?? null,
+        queryMemo: new QueryMemo(),
+        budget: new BudgetNode(settings.budgetReservations
+            ? {
+                money: settings.maxMoneySpent,
+                prompt_tokens: settings.maxPromptTokens,
+                completion_tokens: settings.maxCompletionTokens,
+            }
+            : { money: Infinity, prompt_tokens: Infinity, completion_tokens: Infinity }),
+        deadline: settings.deadlineS != null ? Date.now() + settings.deadlineS * 1000 : null,
+    };
+}
+
+// A budget_warning event fires once per budget when usage crosses this
+// fraction of the cap.
+const BUDGET_WARNING_FRACTION = 0.8;
+
+function warnOnBudgets(run: RunState, logger: Logger): void {
+    const s = run.settings;
+    const u = run.usage.getTotalUsage();
+    const budgets: [string, number, number][] = [
+        ["max_money_spent", u.cost ?? 0, s.maxMoneySpent],
+        ["max_prompt_tokens", u.prompt_tokens, s.maxPromptTokens],
+        ["max_completion_tokens", u.completion_tokens, s.maxCompletionTokens],
+        ["max_global_calls", run.usage.getTotalCalls(), s.maxGlobalCalls],
+    ];
+    for (const [budget, used, limit] of budgets) {
+        if (!Number.isFinite(limit) || run.budgetWarnings.has(budget)) continue;
+        if (used >= BUDGET_WARNING_FRACTION * limit) {
+            run.budgetWarnings.add(budget);
+            logger.logBudgetWarning(budget, used, limit);
+        }
+    }
+}
+
+// Process-wide resources a run's settings control: the REPL pool, the
+// response cache and, if asked, warm connections to the model endpoints
+// (fire-and-forget).
+function configureEngine(settings: RunSettings): void {
+    responseCache.configure({
+        enabled: settings.responseCache,
+        dir: settings.responseCacheDir,
+        maxBytes: settings.responseCacheMaxMb * 1024 * 1024,
+    });
+    configureRateLimits(settings.rateLimits);
+    configureEndpointPools(settings.endpoints, settings.endpointRouting);
+    configurePricing(settings.modelPrices);
+    agentScheduler.configure({
+        maxLiveAgents: settings.maxLiveAgents,
+        maxMemoryBytes: settings.maxReplMemoryMb != null ? settings.maxReplMemoryMb * 1024 * 1024 : null,
+    });
+    replPool.configure({
+        size: settings.replPoolSize,
+        snapshots: settings.replSnapshot,
+        packages: settings.replPackages,
+        workers: settings.replWorkers,
+    });
+    if (settings.prewarmConnections) {
+        prewarmModelConnections(routedModelNames(settings.modelRouting, settings.primaryAgent, settings.subAgent));
+    }
+}
+
+let _defaultRun: RunState | null = null;
+
+// subagent() called without a RunState (e.g. from a script) uses the config
+// from --config / the bundled rlm_config.yaml.
+function defaultRun(): RunState {
+    if (!_defaultRun) {
+        _defaultRun = newRunState(resolveRunSettings(loadConfig()), { usage: defaultUsageTracker() });
+        configureEngine(_defaultRun.settings);
+    }
+    return _defaultRun;
+}
+
+function truncateText(text: string, truncateLen: number): string {
     let truncatedOutput = "";
-    if (text.length > TRUNCATE_LEN) {
-        truncatedOutput = `[TRUNCATED: Last ${TRUNCATE_LEN} chars shown].. ` + text.slice(-TRUNCATE_LEN);
+    if (text.length > truncateLen) {
+        truncatedOutput = `[TRUNCATED: Last ${truncateLen} chars shown].. ` + text.slice(-truncateLen);
     } else {
         if (text.length == 0) {
             truncatedOutput = "[EMPTY OUTPUT]";
@@ -128,7 +357,45 @@ function budgetBanner(stepJustFinished: number, maxCalls: number): string {
 type Context = string | Record<string, unknown> | unknown[];
 type JsonSchema = Record<string, unknown>;
 
-export async function subagent(
+// Each agent first waits for a slot from the scheduler (agent_scheduler.ts),
+// then borrows a pre-booted interpreter from the REPL pool for its whole
+// lifetime and hands both back however it ends (see repl_pool.ts). An agent
+// that escalates along its model cascade (model_routing.ts) is started over
+// on the next model, in a fresh interpreter but the same slot.
+export async function subagent(...args: AgentArgs): Promise<unknown> {
+    const [, depth = 0] = args;
+    const slot = await agentScheduler.admit(depth);
+    try {
+        for (let level = 0;; level++) {
+            const repl = await replPool.acquire();
+            let clean = false;
+            try {
+                const result = await runAgent(repl, slot, level, ...args);
+                clean = true;
+                return result;
+            } catch (error) {
+                // Past its deadline, an agent may leave its REPL code running.
+                if (error instanceof DeadlineExceeded) clean = !error.interrupted;
+                if (!(error instanceof CascadeEscalation)) throw error;
+                clean = true;
+                console.log(chalk.yellow(`↳ ${error.message}; escalating to the next model`));
+            } finally {
+                await replPool.release(repl, clean);
+            }
+        }
+    } finally {
+        slot.release();
+    }
+}
+
+type AgentArgs = Parameters<typeof runAgent> extends [Repl, AgentSlot, number, ...infer Rest] ? Rest : never;
+
+async function runAgent(
+    repl: Repl,
+    // This agent's scheduler slot: marked blocked while it waits on children.
+    slot: AgentSlot,
+    // Position in the agent's model cascade (model_routing.ts); 0 = first.
+    cascadeLevel: number,
     context: Context,
     subagent_depth = 0,
     parent_run_id?: string,
@@ -150,7 +417,53 @@ export async function subagent(
     // llm_query(instruction=...) for a child. Never inherited — a child sees only
     // what its parent explicitly passed, with no carry-on from ancestors.
     instruction?: string | null,
+    // Run-wide state (settings, ...) shared with every sub-agent of this run.
+    runState?: RunState | null,
+    // This agent's place in the run's agent tree: "0" for the root, then
+    // "<parent>.<n>" for the parent's n-th llm_query. Cassettes key on it.
+    agentPath = "0",
+    // This agent's budget, granted by its parent (budget.ts); the run's
+    // root budget when unset.
+    budget?: BudgetNode | null,
+    // When this agent must finish (epoch ms; deadline.ts); the run's deadline
+    // when unset.
+    deadline?: number | null,
 ) {
+    // An escalated agent (model cascade) records under its own path: its
+    // calls and children are not the first attempt's.
+    if (cascadeLevel > 0) agentPath = `${agentPath}@${cascadeLevel}`;
+    const run = runState ?? defaultRun();
+    const agentBudget = budget ?? run.budget;
+    const agentDeadline = deadline ?? run.deadline;
+    const agentStarted = Date.now();
+    // Aborts this agent's LLM calls at its deadline, as well as when the
+    // client cancels the run.
+    const deadlineSignal = agentDeadline != null ? AbortSignal.timeout(Math.max(0, agentDeadline - agentStarted)) : null;
+    const agentSignal = deadlineSignal && run.signal
+        ? AbortSignal.any([run.signal, deadlineSignal])
+        : (deadlineSignal ?? run.signal);
+    // External calls (LLM, MCP) go through the run's cassette, if any.
+    const tape = <T>(kind: string, call: () => Promise<T>): Promise<T> =>
+        run.cassette ? run.cassette.through(agentPath, kind, call) : call();
+    let childCount = 0;
+    const {
+        maxCalls: MAX_CALLS,
+        maxDepth: MAX_DEPTH,
+        truncateLen: TRUNCATE_LEN,
+        primaryAgent: PRIMARY_AGENT,
+        subAgent: SUB_AGENT,
+        maxMoneySpent: MAX_MONEY_SPENT,
+        maxCompletionTokens: MAX_COMPLETION_TOKENS,
+        maxPromptTokens: MAX_PROMPT_TOKENS,
+        maxGlobalCalls: MAX_GLOBAL_CALLS,
+        apiMaxRetries: API_MAX_RETRIES,
+        apiTimeoutMs: API_TIMEOUT_MS,
+        enableTools: ENABLE_TOOLS,
+        enableStructuredIo: ENABLE_STRUCTURED_IO,
+        enableCompressionGuard: ENABLE_COMPRESSION_GUARD,
+        compressionMinChars: COMPRESSION_MIN_CHARS,
+        compressionRatio: COMPRESSION_RATIO,
+    } = run.settings;
     // Structured I/O ablation: when disabled, ignore any requested output schema
     // (no validation, no schema preamble) and present dict/list contexts as plain
     // strings instead of running the structured flat-schema probe.
@@ -159,42 +472,96 @@ export async function subagent(
         ? JSON.stringify(context)
         : context;
     const validate = compileSchema(effectiveSchema);
-    const logger = new Logger(subagent_depth, MAX_CALLS, parent_run_id);
-    logger.logAgentStart();
+    const models = routeModels(run.settings.modelRouting, subagent_depth, context, PRIMARY_AGENT, SUB_AGENT);
+    const model_name = models[cascadeLevel];
+    // Whether this agent hands its task to the next model instead of failing.
+    const canEscalate = cascadeLevel < models.length - 1;
+    const logger = new Logger(subagent_depth, MAX_CALLS, parent_run_id, run.usage, run.onEvent);
+    logger.logAgentStart(slot.queueWaitMs, model_name, budget ? budget.finiteLimits() : null);
+    run.usage.trackModelAgent(model_name);
+    // Interpreter size for the scheduler's memory cap; best-effort.
+    const measureMemory = () => {
+        repl.memoryBytes().then((bytes) => slot.setMemory(bytes)).catch(() => {});
+    };
+    // Every LLM call's usage goes through here: run total, per-model total,
+    // live usage event, budget warnings, response-cache hit/miss (when the
+    // cache is on). `ms` is the call's duration, for generate_code calls.
+    const recordUsage = (u: Usage, cacheHit?: boolean, ms?: number) => {
+        run.usage.trackUsage(u);
+        run.usage.trackModelCall(model_name, u, ms);
+        agentBudget.charge(u);
+        if (cacheHit !== undefined) run.usage.trackResponseCache(cacheHit);
+        logger.logUsage(u, run.usage.getTotalUsage());
+        warnOnBudgets(run, logger);
+    };
 
-    const model_name = subagent_depth == 0 ? PRIMARY_AGENT : SUB_AGENT;
     const is_leaf_agent = subagent_depth == MAX_DEPTH;
     let stdoutBuffer = "";
 
-    const pyodide = await loadPyodide({
-        stderr: (text: string) => console.error(`[Python Stderr]: ${text}`),
-        stdout: (text: string) => {
-            stdoutBuffer += text + "\n";
-        },
-    });
+    repl.onStdout = (text: string) => {
+        stdoutBuffer += text + "\n";
+    };
     console.log("✔ Python Ready");
 
-    // Make `requests` work inside the WASM REPL:
-    //   1. loadPackage("micropip") — bundled with Pyodide, no network needed.
-    //   2. micropip.install("requests", "pyodide-http") — pure-Python wheels.
-    //   3. pyodide_http.patch_all() — routes requests/urllib through host fetch.
-    // After this, any tool can `import requests; requests.get(...)` as normal.
-    const envSetupStart = Date.now();
-    await pyodide.loadPackage("micropip");
-    await pyodide.runPythonAsync(`
-import micropip
-await micropip.install(["requests", "httpx"])
-`);
-    const envSetupMs = Date.now() - envSetupStart;
-    console.log(`✔ requests + httpx ready (env setup took ${envSetupMs}ms)`);
-
-    const pyProxyToJs = (val: unknown): unknown => {
-        if (val && typeof (val as { toJs?: unknown }).toJs === "function") {
-            return (val as { toJs: (opts: unknown) => unknown }).toJs({
-                dict_converter: Object.fromEntries,
-            });
+    const promptOpts = {
+        enableTools: ENABLE_TOOLS,
+        enableStructuredIo: ENABLE_STRUCTURED_IO,
+        enableCompressionGuard: ENABLE_COMPRESSION_GUARD,
+        instruction: instruction ?? null,
+    };
+    const apiOpts = {
+        maxRetries: API_MAX_RETRIES,
+        timeout: API_TIMEOUT_MS,
+        promptCaching: run.settings.promptCaching,
+        hedge: run.settings.hedgeRequests,
+        signal: agentSignal,
+    };
+    const historyPolicy: CompactionPolicy = {
+        dropReasoning: run.settings.historyDropReasoning,
+        keepSteps: run.settings.historyKeepSteps,
+    };
+    // Pre-flight budget check (llm_stream.ts estimator, pricing.ts): refuse a
+    // call whose prompt alone would breach max_prompt_tokens or, priced as
+    // uncached input, max_money_spent, before it is sent and paid for. The
+    // same goes for what is left of this agent's own budget (budget.ts).
+    const systemPrompt = buildSystemPrompt(is_leaf_agent, promptOpts);
+    // The estimated prompt of the call being made, for the stream's cutoff.
+    let callPromptTokens = 0;
+    // deno-lint-ignore no-explicit-any
+    const preflight = (promptMessages: any[]) => {
+        const prompt = estimatePromptTokens(systemPrompt, promptMessages);
+        callPromptTokens = prompt;
+        const total = run.usage.getTotalUsage();
+        if (total.prompt_tokens + prompt > MAX_PROMPT_TOKENS) {
+            throw new Error(
+                `Prompt token budget exceeded: the next call's prompt is ~${prompt.toLocaleString()} tokens with ` +
+                `${total.prompt_tokens.toLocaleString()} already used, limit is ${MAX_PROMPT_TOKENS.toLocaleString()} ` +
+                `(refused before sending)`,
+            );
+        }
+        const cost = costOf(model_name, { ...emptyUsage(), prompt_tokens: prompt, total_tokens: prompt });
+        if (cost != null && (total.cost ?? 0) + cost > MAX_MONEY_SPENT) {
+            throw new Error(
+                `Budget exceeded: the next call's prompt costs ~$${cost.toFixed(4)} with ` +
+                `$${(total.cost ?? 0).toFixed(4)} already spent, limit is $${MAX_MONEY_SPENT} (refused before sending)`,
+            );
+        }
+        const left = agentBudget.available();
+        if (prompt > left.prompt_tokens) {
+            throw new Error(
+                `Prompt token budget exceeded: the next call's prompt is ~${prompt.toLocaleString()} tokens with ` +
+                `${Math.max(0, left.prompt_tokens).toLocaleString()} left in this agent's budget (refused before sending)`,
+            );
+        }
+        if (left.completion_tokens <= 0) {
+            throw new Error(`Completion token budget exceeded: none left in this agent's budget (refused before sending)`);
+        }
+        if (cost != null && cost > left.money) {
+            throw new Error(
+                `Budget exceeded: the next call's prompt costs ~$${cost.toFixed(4)} with ` +
+                `$${Math.max(0, left.money).toFixed(4)} left in this agent's budget (refused before sending)`,
+            );
         }
-        return val;
     };
 
     const js_llm_query = async (
@@ -207,13 +574,23 @@ await micropip.install(["requests", "httpx"])
         // Set by batch_llm_query: the batch was already judged once, so skip the
         // per-call compression guard for these children.
         suppress_guard?: unknown,
+        // llm_query(budget=...): a cap on the child's budget.
+        child_budget?: unknown,
+        // Children of the same batch still to start, this one included; the
+        // child's default grant is an even share of what is left.
+        share?: unknown,
+        // llm_query(deadline_s=...): the child's own time limit, in seconds.
+        child_deadline_s?: unknown,
     ) => {
         if (subagent_depth >= MAX_DEPTH) {
             stdoutBuffer += "\nError: MAXIMUM DEPTH REACHED. You must solve this task on your own without calling llm_query.\n";
             throw new Error("MAXIMUM DEPTH REACHED. You must solve this task on your own without calling llm_query.");
         }
-        // Dict/list contexts arrive as PyProxy from Python; same for schema and tools.
-        const plain = pyProxyToJs(context) as Context;
+        // Numbered when the call is made, before any await: call order is
+        // deterministic, completion order is not.
+        const childPath = `${agentPath}.${++childCount}`;
+        // Bridge arguments arrive as plain JS (dicts → objects); see repl.ts.
+        const plain = context as Context;
         if (typeof plain !== "string" && (typeof plain !== "object" || plain === null)) {
             throw new Error(
                 `llm_query expects a string or dict/list context, got ${typeof plain}`
@@ -221,7 +598,7 @@ await micropip.install(["requests", "httpx"])
         }
         let childSchema: JsonSchema | null = null;
         if (child_schema != null && ENABLE_STRUCTURED_IO) {
-            const s = pyProxyToJs(child_schema);
+            const s = child_schema;
             if (typeof s !== "object" || s === null || Array.isArray(s)) {
                 throw new Error(
                     `llm_query output_schema must be a JSON Schema dict, got ${typeof s}`
@@ -231,7 +608,7 @@ await micropip.install(["requests", "httpx"])
         }
         let childTools: string[] | null = null;
         if (child_tool_sources != null && ENABLE_TOOLS) {
-            const t = pyProxyToJs(child_tool_sources);
+            const t = child_tool_sources;
             if (!Array.isArray(t) || !t.every((x) => typeof x === "string")) {
                 throw new Error(
                     `llm_query tools must be a list of Python functions (received non-string sources)`
@@ -243,7 +620,7 @@ await micropip.install(["requests", "httpx"])
         // name (server-level). Default → [] (none).
         let childMcpServers: string[] = [];
         if (child_mcp_servers != null) {
-            const m = pyProxyToJs(child_mcp_servers);
+            const m = child_mcp_servers;
             if (!Array.isArray(m) || !m.every((x) => typeof x === "string")) {
                 throw new Error(
                     `llm_query mcp must be a list of server-name strings, got ${typeof m}`
@@ -254,7 +631,7 @@ await micropip.install(["requests", "httpx"])
         // Instruction for the child only — never inherited from this agent.
         let childInstruction: string | null = null;
         if (child_instruction != null) {
-            const ci = pyProxyToJs(child_instruction);
+            const ci = child_instruction;
             if (typeof ci !== "string") {
                 throw new Error(
                     `llm_query instruction must be a string, got ${typeof ci}`
@@ -262,6 +639,13 @@ await micropip.install(["requests", "httpx"])
             }
             childInstruction = ci;
         }
+        const budgetCap = parseBudgetRequest(child_budget);
+        const childDeadlineAt = childDeadline(agentDeadline, parseDeadline(child_deadline_s));
+        if (childDeadlineAt != null && childDeadlineAt <= Date.now()) {
+            throw new Error(
+                "Deadline: no time left to start a sub-agent. Call FINAL with the best answer you have.",
+            );
+        }
         console.log("↳ llm_query called");
 
         // Compression guard: if this delegation ships a large, barely-compressed
@@ -278,22 +662,57 @@ await micropip.install(["requests", "httpx"])
             }
         }
 
-        const output = await subagent(
-            plain,
-            subagent_depth + 1,
-            logger.run_id,
-            childSchema,
-            childTools,
-            envVars ?? null,
-            mcp ?? null,
-            childMcpServers,
-            llmKwargs ?? null,
-            confirmInfo,
-            childInstruction,
-        );
-        return output;
+        // The grant is carved when the child actually starts (a deduplicated
+        // call never does) and flows back, less its spend, when it ends.
+        const spawn = () => {
+            const grant = agentBudget.grant(budgetCap, typeof share === "number" ? share : 1);
+            return subagent(
+                plain,
+                subagent_depth + 1,
+                logger.run_id,
+                childSchema,
+                childTools,
+                envVars ?? null,
+                mcp ?? null,
+                childMcpServers,
+                llmKwargs ?? null,
+                confirmInfo,
+                childInstruction,
+                run,
+                childPath,
+                grant,
+                childDeadlineAt,
+            ).finally(() => grant.close());
+        };
+        // Waiting on the child: this agent can't finish until it does, so the
+        // scheduler must not count it as able to make progress.
+        slot.block();
+        try {
+            if (!run.settings.dedupeLlmQueries) return await spawn();
+
+            // Identical calls share one child run (query_memo.ts). Depth is part of
+            // the key: it picks the child's model and whether it is a leaf.
+            const key = await run.queryMemo.key({
+                context: plain,
+                schema: childSchema,
+                tools: childTools,
+                mcp: [...childMcpServers].sort(),
+                instruction: childInstruction,
+                depth: subagent_depth + 1,
+                models: routeModels(run.settings.modelRouting, subagent_depth + 1, plain, PRIMARY_AGENT, SUB_AGENT),
+                guarded: confirmInfo != null,
+                budget: budgetCap,
+            });
+            // The deadline is not part of the key (it differs for every call);
+            // share() only declines a running twin that would stop sooner.
+            const { result, hit } = run.queryMemo.share(key, spawn, childDeadlineAt);
+            run.usage.trackQueryDedup(hit);
+            if (hit) console.log(`↳ llm_query deduplicated (${hit === "in_flight" ? "joined a running twin" : "memoized"})`);
+            return await result;
+        } finally {
+            slot.unblock();
+        }
     };
-    pyodide.globals.set("__js_llm_query__", js_llm_query);
 
     // ---- Batch compression guard -------------------------------------------
     // batch_llm_query (a drop-in for asyncio.gather over llm_query calls) routes
@@ -324,21 +743,17 @@ await micropip.install(["requests", "httpx"])
             `barely-compressed slice of your context. RLM works best when you slice/filter/` +
             `summarize in your OWN repl first and delegate only the reduced result.\n` +
             `Approve the WHOLE batch? Reply YES or NO on the first line, then a one-line reason.`;
-        const verdict = await confirmDelegation(
-            messages, q, model_name, is_leaf_agent,
-            { maxRetries: API_MAX_RETRIES, timeout: API_TIMEOUT_MS },
-            {
-                enableTools: ENABLE_TOOLS,
-                enableStructuredIo: ENABLE_STRUCTURED_IO,
-                enableCompressionGuard: ENABLE_COMPRESSION_GUARD,
-            },
-            llmKwargs ?? null,
-        );
-        trackCall();
-        trackUsage(verdict.usage);
+        // Same system prompt and history view as this agent's own steps, so
+        // the guard call reads the agent's cached prefix.
+        const history = compactHistory(messages, historyPolicy);
+        preflight([...history, { role: "user", content: q }]);
+        const verdict = await tape("confirm", () => confirmDelegation(
+            history, q, model_name, is_leaf_agent, apiOpts, promptOpts, llmKwargs ?? null,
+        ));
+        run.usage.trackCall();
+        recordUsage(verdict.usage, verdict.cache_hit);
         return verdict.approve;
     };
-    pyodide.globals.set("__js_batch_confirm__", js_batch_confirm);
 
     // ---- MCP bridge --------------------------------------------------------
     // Which servers this agent may see: null → all (root), else the granted set.
@@ -360,189 +775,37 @@ await micropip.install(["requests", "httpx"])
     };
     const mcpEnabled = mcp != null && (allowedServers.length > 0 || mcpData.allowedServers === null);
 
+    // Host functions Python awaits. With REPL workers these are message-passing
+    // RPCs (worker_repl.ts); either way arguments arrive as plain JS.
+    const bridges: Record<string, Bridge> = {
+        __js_llm_query__: js_llm_query,
+        __js_batch_confirm__: js_batch_confirm,
+    };
     if (mcpEnabled) {
-        pyodide.globals.set("__js_mcp_call__", async (server: unknown, tool: unknown, args: unknown) => {
-            const a = (pyProxyToJs(args) ?? {}) as Record<string, unknown>;
-            return await mcp!.callTool(String(server), String(tool), a);
-        });
-        pyodide.globals.set("__js_mcp_read_resource__", async (server: unknown, uri: unknown) => {
-            return await mcp!.readResource(String(server), String(uri));
-        });
+        bridges.__js_mcp_call__ = async (server: unknown, tool: unknown, args: unknown) => {
+            const a = (args ?? {}) as Record<string, unknown>;
+            return await tape("mcp_call", () => mcp!.callTool(String(server), String(tool), a));
+        };
+        bridges.__js_mcp_read_resource__ = async (server: unknown, uri: unknown) => {
+            return await tape("mcp_read", () => mcp!.readResource(String(server), String(uri)));
+        };
     }
+    await repl.setBridges(bridges);
 
-    // Initialize context. Strings are embedded as Python string literals;
-    // dicts/lists are passed through json.loads so the agent gets a real
-    // Python dict/list (not a JsProxy).
-    const contextLiteral = typeof effectiveContext === "string"
-        ? JSON.stringify(effectiveContext)
-        : `__import__('json').loads(${JSON.stringify(JSON.stringify(effectiveContext))})`;
+    // Initialize context. It goes through Pyodide's FS rather than the setup
+    // source (see pyodide_context.ts); dicts/lists come back as real Python
+    // dicts/lists (not a JsProxy). A worker REPL gets the encoded buffer
+    // transferred rather than a structured-clone copy.
+    const contextInit = await repl.stageContext(encodeContext(effectiveContext));
     const envInjection = envVars && Object.keys(envVars).length
         ? `import os, json as _json
 os.environ.update(_json.loads(${JSON.stringify(JSON.stringify(envVars))}))
 `
         : "";
     const setup_code = `
-${envInjection}context = ${contextLiteral}
-__final_result__ = None
+${envInjection}${contextInit}__final_result__ = None
 __final_result_set__ = False
-
-def FINAL(x):
-    global __final_result__, __final_result_set__
-    __final_result__ = x
-    __final_result_set__ = True
-
 __tools__ = []
-
-# Pretty-print Pydantic models, JsProxy objects, and nested dicts/lists as
-# JSON. Plain strings/numbers/etc. fall through to the original print.
-import builtins as __builtins__
-__real_print__ = __builtins__.print
-
-def __coerce_for_print__(o, _seen=None):
-    if _seen is None:
-        _seen = set()
-    _oid = id(o)
-    if _oid in _seen:
-        return o
-    try:
-        from pydantic import BaseModel as __BaseModel
-        if isinstance(o, __BaseModel):
-            return o.model_dump(mode="json")
-    except ImportError:
-        pass
-    if hasattr(o, "to_py") and not isinstance(o, (str, bytes)):
-        try:
-            o = o.to_py()
-        except Exception:
-            return o
-    if isinstance(o, dict):
-        _seen.add(_oid)
-        return {k: __coerce_for_print__(v, _seen) for k, v in o.items()}
-    if isinstance(o, (list, tuple, set)):
-        _seen.add(_oid)
-        return [__coerce_for_print__(x, _seen) for x in o]
-    return o
-
-def print(*args, **kwargs):
-    import json as __json
-    _out = []
-    for _a in args:
-        _c = __coerce_for_print__(_a)
-        if _c is _a or isinstance(_a, (str, bytes, int, float, bool)) or _a is None:
-            _out.append(_a)
-            continue
-        try:
-            _out.append(__json.dumps(_c, indent=2, default=str, ensure_ascii=False))
-        except Exception:
-            _out.append(_a)
-    __real_print__(*_out, **kwargs)
-
-__builtins__.print = print
-
-def __register_tool__(src):
-    _ns = {}
-    exec(src, globals(), _ns)
-    _fn = next((v for v in _ns.values() if callable(v)), None)
-    if _fn is None:
-        raise ValueError("Tool source defined no callable: " + src[:200])
-    try:
-        _fn.__fast_rlm_source__ = src
-    except (AttributeError, TypeError):
-        pass
-    globals()[_fn.__name__] = _fn
-    __tools__.append(_fn)
-
-class _LazyQuery:
-    """Awaitable handle for a sub-agent query.
-
-    Awaiting it runs the call normally (with the per-call compression guard).
-    batch_llm_query reads its .context up front (one batch judge) and runs it
-    with the guard suppressed.
-    """
-    __slots__ = ("context", "schema", "tools", "mcp", "instruction")
-
-    def __init__(self, context, schema, tools, mcp, instruction):
-        self.context = context
-        self.schema = schema
-        self.tools = tools
-        self.mcp = mcp
-        self.instruction = instruction
-
-    def __await__(self):
-        return self._run(False).__await__()
-
-    async def _run(self, suppress):
-        _tool_sources = None
-        if self.tools:
-            import inspect as _inspect
-            _tool_sources = []
-            for _t in self.tools:
-                _stashed = getattr(_t, "__fast_rlm_source__", None)
-                if _stashed is not None:
-                    _tool_sources.append(_stashed)
-                else:
-                    _tool_sources.append(_inspect.getsource(_t))
-        _mcp = list(self.mcp) if self.mcp else None
-        _result = await __js_llm_query__(self.context, self.schema, _tool_sources, _mcp, self.instruction, suppress)
-        if hasattr(_result, "to_py"):
-            return _result.to_py()
-        return _result
-
-
-def llm_query(context, schema=None, *, tools=None, mcp=None, instruction=None):
-    """Recursively query a sub-agent. Use 'await llm_query(...)'.
-
-    Args:
-        context: str or dict — the task/context for the sub-agent.
-        schema: optional JSON Schema (as a dict) the sub-agent's FINAL must satisfy.
-        tools: optional list of Python functions to expose in the sub-agent's REPL.
-            By default the sub-agent does NOT inherit your tools; pass them
-            explicitly here if you want the child to have access.
-        mcp: optional list of MCP server-name strings to grant the sub-agent.
-            By default the sub-agent inherits NO MCP servers; name the ones it
-            may use (e.g. mcp=["fsio"]) and it gets that server's tools/resources.
-        instruction: optional string directive shown ONLY to this sub-agent
-            (appended to its system prompt). It is not inherited by the child's
-            own sub-agents and does not carry over from you — pass it again on
-            each llm_query call where you want it to apply.
-    """
-    return _LazyQuery(context, schema, tools, mcp, instruction)
-
-
-async def batch_llm_query(*queries):
-    """Run several sub-agent queries in PARALLEL — a drop-in for
-    asyncio.gather(*[llm_query(...), llm_query(...), ...]).
-
-    Unlike asyncio.gather, the whole batch is checked for compression ONCE (a
-    single reviewer call decides whether to approve the entire fan-out), instead
-    of each call being checked separately. Prefer this over asyncio.gather when
-    you delegate to many sub-agents at once. Returns results in order.
-
-        results = await batch_llm_query(llm_query(c1), llm_query(c2), llm_query(c3))
-    """
-    import asyncio as _asyncio
-    import json as _json
-    qs = list(queries)
-    if len(qs) == 1 and isinstance(qs[0], (list, tuple)):
-        qs = list(qs[0])
-    if not all(isinstance(q, _LazyQuery) for q in qs):
-        raise TypeError("batch_llm_query expects llm_query(...) calls, e.g. "
-                        "batch_llm_query(llm_query(a), llm_query(b))")
-
-    def _meta(ctx):
-        s = ctx if isinstance(ctx, str) else _json.dumps(ctx)
-        return {"childChars": len(s), "preview": s[:160]}
-
-    _parent = context if isinstance(context, str) else _json.dumps(context)
-    _payload = {"parentChars": len(_parent), "items": [_meta(q.context) for q in qs]}
-    _approved = await __js_batch_confirm__(_json.dumps(_payload))
-    if not _approved:
-        raise RuntimeError(
-            "BATCH_DELEGATION_REJECTED: this parallel batch was declined as "
-            "under-compressed. Slice/filter/summarize each context in your OWN "
-            "REPL first, then delegate only the reduced results."
-        )
-    return await _asyncio.gather(*[q._run(True) for q in qs])
 ${ENABLE_COMPRESSION_GUARD ? `
 # Failsafe: block llm_query() handles passed into asyncio.gather, steering the
 # model to batch_llm_query (which does one compression check for the whole batch).
@@ -558,13 +821,13 @@ def _guarded_gather(*aws, **kw):
     return _real_gather(*aws, **kw)
 _aio_guard.gather = _guarded_gather
 ` : ""}`;
-    await pyodide.runPythonAsync(setup_code);
+    await repl.run(setup_code);
 
     // Register tools (if any) into the REPL globals + __tools__ list.
     // Skipped entirely when the tools capability is disabled (ablation).
     if (ENABLE_TOOLS && toolSources && toolSources.length) {
         for (const src of toolSources) {
-            await pyodide.runPythonAsync(
+            await repl.run(
                 `__register_tool__(${JSON.stringify(src)})`
             );
         }
@@ -572,7 +835,7 @@ _aio_guard.gather = _guarded_gather
 
     // Inject MCP proxy functions (scoped to this agent's allowed servers).
     if (mcpEnabled) {
-        await pyodide.runPythonAsync(`
+        await repl.run(`
 import json as _json
 __mcp_data__ = _json.loads(${JSON.stringify(JSON.stringify(mcpData))})
 __mcp_allowed_servers__ = __mcp_data__["allowedServers"]
@@ -722,8 +985,9 @@ else:
 ${toolsProbeCode}${mcpProbeCode}`
     stdoutBuffer = "";
     const step0ExecStart = now();
-    await pyodide.runPythonAsync(initial_code);
+    await repl.run(initial_code);
     const step0ExecEnd = now();
+    measureMemory();
     let messages = [
         {
             "role": "user", "content": `
@@ -756,13 +1020,56 @@ Output:\n${stdoutBuffer.trim()}
         }
     });
 
-    const promptOpts = {
-        enableTools: ENABLE_TOOLS,
-        enableStructuredIo: ENABLE_STRUCTURED_IO,
-        enableCompressionGuard: ENABLE_COMPRESSION_GUARD,
-        instruction: instruction ?? null,
+    // Streamed completions stop after the first repl block, and mid-generation
+    // once this call would push the run past max_completion_tokens, or run
+    // past what is left of this agent's budget.
+    const overAgentBudget = (tokens: number) => {
+        const left = agentBudget.available();
+        if (tokens > left.completion_tokens) return true;
+        const cost = costOf(model_name, {
+            ...emptyUsage(),
+            prompt_tokens: callPromptTokens,
+            completion_tokens: tokens,
+            total_tokens: callPromptTokens + tokens,
+        });
+        return cost != null && cost > left.money;
+    };
+    const streamOpts: StreamOptions | null = run.settings.streamCompletions
+        ? {
+            overBudget: (tokens) =>
+                run.usage.getTotalUsage().completion_tokens + tokens > MAX_COMPLETION_TOKENS || overAgentBudget(tokens),
+            signal: agentSignal,
+        }
+        : null;
+
+    // Step messages open with the step budget banner and, near the deadline,
+    // the nudge to finish.
+    const banners = (step: number) => {
+        const text = budgetBanner(step, MAX_CALLS);
+        if (agentDeadline == null) return text;
+        const remaining = agentDeadline - Date.now();
+        const avgStepMs = (Date.now() - agentStarted) / (step + 1);
+        return shouldNudge(remaining, agentDeadline - agentStarted, avgStepMs) ? deadlineNudge(remaining) + text : text;
+    };
+    // Raw output of the last step: the partial result if the deadline passes.
+    let lastOutput: string | null = null;
+    const expire = (interrupted: boolean) => {
+        const current = interrupted ? stdoutBuffer.trim() : "";
+        const partial = current || lastOutput;
+        console.log(chalk.yellow(`⏱ Deadline reached at depth ${subagent_depth}; ending with a partial result`));
+        logger.logAgentEnd();
+        return new DeadlineExceeded(partial ? partial.slice(-TRUNCATE_LEN) : null, interrupted);
+    };
+    // REPL code is no longer waited on once the deadline passes.
+    const untilDeadline = (work: Promise<void>): Promise<void> => {
+        if (!deadlineSignal) return work;
+        return new Promise((resolve, reject) => {
+            const onDeadline = () => reject(expire(true));
+            work.then(resolve, reject).finally(() => deadlineSignal.removeEventListener("abort", onDeadline));
+            if (deadlineSignal.aborted) onDeadline();
+            else deadlineSignal.addEventListener("abort", onDeadline, { once: true });
+        });
     };
-    const apiOpts = { maxRetries: API_MAX_RETRIES, timeout: API_TIMEOUT_MS };
 
     // Compression guard: the parent flagged this delegation as barely-compressed.
     // Self-confirm (same model, same system prompt, same probe → cache reuse)
@@ -784,12 +1091,20 @@ Output:\n${stdoutBuffer.trim()}
             `summarizing into a smaller variable) before delegating the reduced result. The probe ` +
             `above shows the context shape and the task — make the code specific to them. Do NOT ` +
             `tell them to simply call llm_query again with the full context.`;
+        preflight([...messages, { role: "user", content: confirmQuestion }]);
         const confirmSpinner = startSpinner("Confirming delegation...");
-        const verdict = await confirmDelegation(
-            messages, confirmQuestion, model_name, is_leaf_agent, apiOpts, promptOpts, llmKwargs ?? null,
-        );
-        trackCall();
-        trackUsage(verdict.usage);
+        let verdict;
+        try {
+            verdict = await tape("confirm", () => confirmDelegation(
+                messages, confirmQuestion, model_name, is_leaf_agent, apiOpts, promptOpts, llmKwargs ?? null,
+            ));
+        } catch (err) {
+            if (run.signal?.aborted) throw new Error("Run cancelled by the client");
+            if (deadlineSignal?.aborted) throw expire(false);
+            throw err;
+        }
+        run.usage.trackCall();
+        recordUsage(verdict.usage, verdict.cache_hit);
         if (!verdict.approve) {
             confirmSpinner.success("Delegation rejected");
             logger.logAgentEnd();
@@ -805,27 +1120,48 @@ Output:\n${stdoutBuffer.trim()}
     }
 
     for (let i = 0; i < MAX_CALLS; i++) {
+        if (run.signal?.aborted) {
+            throw new Error("Run cancelled by the client");
+        }
+        if (deadlineSignal?.aborted) throw expire(false);
         // Global call budget: stop before making a new call once the run-wide
         // total is reached. Counts calls (not tokens), so it's the one stop gap
         // that works universally — including ACP, where usage is always zero.
-        if (getTotalCalls() >= MAX_GLOBAL_CALLS) {
-            throw new Error(`Global call budget exceeded: ${getTotalCalls()} call(s) made, limit is ${MAX_GLOBAL_CALLS}`);
+        if (run.usage.getTotalCalls() >= MAX_GLOBAL_CALLS) {
+            throw new Error(`Global call budget exceeded: ${run.usage.getTotalCalls()} call(s) made, limit is ${MAX_GLOBAL_CALLS}`);
         }
         // Reserve this call's slot synchronously, BEFORE the await below.
         // Concurrent sub-agents (batch_llm_query → gather) would otherwise all
         // pass the check above before any of them incremented past the await.
-        trackCall();
+        run.usage.trackCall();
 
+        const history = compactHistory(messages, historyPolicy);
+        preflight(history);
         const llmCallStart = now();
         const llmSpinner = startSpinner("Generating code...");
-        const { code, success, message, usage } = await generate_code(
-            messages, model_name, is_leaf_agent, apiOpts, promptOpts, llmKwargs ?? null);
+        let generated;
+        try {
+            generated = await tape("llm", () => generate_code(
+                history, model_name, is_leaf_agent, apiOpts, promptOpts, llmKwargs ?? null, streamOpts));
+        } catch (err) {
+            if (run.signal?.aborted) throw new Error("Run cancelled by the client");
+            if (deadlineSignal?.aborted) throw expire(false);
+            throw err;
+        }
+        const { code, success, message, usage, timing, cache_hit, request_start, hedge } = generated;
         const llmCallEnd = now();
+        const llmTimestamps = {
+            llm_call_start: llmCallStart,
+            ...(request_start ? { llm_request_start: request_start } : {}),
+            ...(timing?.first_token_at ? { llm_first_token: timing.first_token_at } : {}),
+            llm_call_end: llmCallEnd,
+        };
         messages.push(message);
 
         // Track usage globally
-        trackUsage(usage);
-        const totalUsage = getTotalUsage();
+        recordUsage(usage, cache_hit, Date.parse(llmCallEnd) - Date.parse(llmCallStart));
+        run.usage.trackHedge(hedge);
+        const totalUsage = run.usage.getTotalUsage();
         if (totalUsage.cost != null && totalUsage.cost > MAX_MONEY_SPENT) {
             throw new Error(`Budget exceeded: $${totalUsage.cost.toFixed(4)} spent, limit is $${MAX_MONEY_SPENT}`);
         }
@@ -842,18 +1178,18 @@ Output:\n${stdoutBuffer.trim()}
         if (!success) {
             logger.logStep({
                 step: i + 1, code, reasoning: message.reasoning, usage,
-                timestamps: { llm_call_start: llmCallStart, llm_call_end: llmCallEnd },
+                timestamps: llmTimestamps,
             });
             printStep({
                 run_id: logger.run_id, parent_run_id, depth: subagent_depth,
                 step: i + 1, maxSteps: MAX_CALLS, code, reasoning: message.reasoning,
-                usage, totalUsage: getTotalUsage(),
-                timestamps: { llm_call_start: llmCallStart, llm_call_end: llmCallEnd },
+                usage, totalUsage: run.usage.getTotalUsage(),
+                timestamps: llmTimestamps,
             });
 
             messages.push({
                 "role": "user",
-                "content": `${budgetBanner(i, MAX_CALLS)}Error: We could not extract code because you may not have used repl block!`
+                "content": `${banners(i)}Error: We could not extract code because you may not have used repl block!`
 
             });
             continue
@@ -863,8 +1199,9 @@ Output:\n${stdoutBuffer.trim()}
 
         const execStart = now();
         try {
-            await pyodide.runPythonAsync(code);
+            await untilDeadline(repl.run(code));
         } catch (error) {
+            if (error instanceof DeadlineExceeded) throw error;
             if (error instanceof Error) {
                 stdoutBuffer += `\nError: ${error.message} `;
             } else {
@@ -872,21 +1209,19 @@ Output:\n${stdoutBuffer.trim()}
             }
         }
         const execEnd = now();
-        let truncatedText = truncateText(stdoutBuffer);
+        measureMemory();
+        if (stdoutBuffer.trim()) lastOutput = stdoutBuffer.trim();
+        let truncatedText = truncateText(stdoutBuffer, TRUNCATE_LEN);
 
         const stepTimestamps = {
-            llm_call_start: llmCallStart,
-            llm_call_end: llmCallEnd,
+            ...llmTimestamps,
             execution_start: execStart,
             execution_end: execEnd,
         };
 
-        const finalResultSet = pyodide.globals.get("__final_result_set__");
+        const finalResultSet = await repl.get("__final_result_set__");
         if (finalResultSet) {
-            let result = pyodide.globals.get("__final_result__");
-            if (result && typeof result.toJs === "function") {
-                result = result.toJs({ dict_converter: Object.fromEntries });
-            }
+            const result = await repl.get("__final_result__");
 
             if (validate && !validate(result)) {
                 const errText = formatValidationErrors(validate);
@@ -897,11 +1232,11 @@ Output:\n${stdoutBuffer.trim()}
                     `Validation errors:\n${errText}\n\n` +
                     `Fix the value and call FINAL again. The agent state is preserved; you do not need to recompute everything.`;
                 // Reset Python flags so the loop continues.
-                await pyodide.runPythonAsync(
+                await repl.run(
                     "__final_result__ = None\n__final_result_set__ = False\n"
                 );
                 stdoutBuffer += `\n${feedback}\n`;
-                const truncatedErr = truncateText(stdoutBuffer);
+                const truncatedErr = truncateText(stdoutBuffer, TRUNCATE_LEN);
                 logger.logStep({
                     step: i + 1,
                     code,
@@ -915,11 +1250,16 @@ Output:\n${stdoutBuffer.trim()}
                     run_id: logger.run_id, parent_run_id, depth: subagent_depth,
                     step: i + 1, maxSteps: MAX_CALLS, code, output: truncatedErr,
                     hasError: true, reasoning: message.reasoning,
-                    usage, totalUsage: getTotalUsage(), timestamps: stepTimestamps,
+                    usage, totalUsage: run.usage.getTotalUsage(), timestamps: stepTimestamps,
                 });
+                if (canEscalate) {
+                    logger.logAgentEnd();
+                    run.usage.trackModelAgent(model_name, true);
+                    throw new CascadeEscalation(model_name, "schema");
+                }
                 messages.push({
                     "role": "user",
-                    "content": `${budgetBanner(i, MAX_CALLS)}Output: \n${truncatedErr}`,
+                    "content": `${banners(i)}Output: \n${truncatedErr}`,
                 });
                 continue;
             }
@@ -929,8 +1269,12 @@ Output:\n${stdoutBuffer.trim()}
                 run_id: logger.run_id, parent_run_id, depth: subagent_depth,
                 step: i + 1, maxSteps: MAX_CALLS, code, output: truncatedText,
                 reasoning: message.reasoning,
-                usage, totalUsage: getTotalUsage(), timestamps: stepTimestamps,
+                usage, totalUsage: run.usage.getTotalUsage(), timestamps: stepTimestamps,
             });
+            if (subagent_depth === 0) {
+                logger.logClientStats(clientStats(), rateLimiterStats(), endpointPoolStats());
+                logger.logSchedulerStats(agentScheduler.stats());
+            }
             logger.logFinalResult(result);
             logger.logAgentEnd();
             return result;
@@ -950,164 +1294,498 @@ Output:\n${stdoutBuffer.trim()}
             run_id: logger.run_id, parent_run_id, depth: subagent_depth,
             step: i + 1, maxSteps: MAX_CALLS, code, output: truncatedText,
             hasError, reasoning: message.reasoning,
-            usage, totalUsage: getTotalUsage(), timestamps: stepTimestamps,
+            usage, totalUsage: run.usage.getTotalUsage(), timestamps: stepTimestamps,
         });
 
         messages.push({
             "role": "user",
-            "content": `${budgetBanner(i, MAX_CALLS)}Output: \n${truncatedText}`
+            "content": `${banners(i)}Output: \n${truncatedText}`
         });
     }
 
+    if (canEscalate) {
+        logger.logAgentEnd();
+        run.usage.trackModelAgent(model_name, true);
+        throw new CascadeEscalation(model_name, "steps");
+    }
+    if (subagent_depth === 0) {
+        logger.logClientStats(clientStats(), rateLimiterStats(), endpointPoolStats());
+        logger.logSchedulerStats(agentScheduler.stats());
+    }
     logger.logAgentEnd();
     throw new Error("Did not finish the function stack before subagent died");
 }
 
-if (import.meta.main) {
-    resetUsage(); // Start fresh
+// ---- Run execution (CLI + serve mode) ---------------------------------------
+
+// One root run, read either from CLI flags + stdin or from a serve-mode request.
+interface RunRequest {
+    query: Context;
+    settings: RunSettings;
+    outputSchema: JsonSchema | null;
+    tools: string[] | null;
+    env: Record<string, string> | null;
+    mcpServers: McpServersConfig | null;
+    llmKwargs: Record<string, unknown> | null;
+    // Cassette paths (cassette.ts): at most one is set.
+    record?: string | null;
+    replay?: string | null;
+}
 
-    // Parse --prefix flag
-    const prefixIdx = Deno.args.indexOf("--prefix");
-    if (prefixIdx !== -1 && Deno.args[prefixIdx + 1]) {
-        setLogPrefix(Deno.args[prefixIdx + 1]);
-    }
+// The run's usage as returned to the client; `response_cache` only when the
+// response cache served or missed at least one call.
+type UsageSummary = Usage & {
+    response_cache?: { hits: number; misses: number };
+    llm_query_dedup?: { in_flight_hits: number; memo_hits: number; misses: number };
+    hedging?: { hedged: number; hedge_wins: number };
+    by_model?: Record<string, ModelUsage>;
+};
+
+interface RunOutput {
+    results: unknown;
+    log_file: string | null;
+    usage: UsageSummary;
+    // deadline_s passed: `results` is the root's last step output.
+    partial?: boolean;
+    error?: string;
+}
 
-    // Parse --log-dir flag
-    const logDirIdx = Deno.args.indexOf("--log-dir");
-    if (logDirIdx !== -1 && Deno.args[logDirIdx + 1]) {
-        setLogDir(Deno.args[logDirIdx + 1]);
-    }
+function usageSummary(tracker: UsageTracker): UsageSummary {
+    const u = tracker.getTotalUsage();
+    const cache = tracker.getResponseCacheStats();
+    const dedup = tracker.getQueryDedupStats();
+    const hedging = tracker.getHedgeStats();
+    const byModel = tracker.getModelStats();
+    return {
+        prompt_tokens: u.prompt_tokens,
+        completion_tokens: u.completion_tokens,
+        total_tokens: u.total_tokens,
+        cached_tokens: u.cached_tokens,
+        reasoning_tokens: u.reasoning_tokens,
+        cost: u.cost,
+        ...(cache.hits + cache.misses > 0 ? { response_cache: cache } : {}),
+        ...(dedup.in_flight_hits + dedup.memo_hits > 0 ? { llm_query_dedup: dedup } : {}),
+        ...(hedging.hedged > 0 ? { hedging } : {}),
+        ...(Object.keys(byModel).length > 1 ? { by_model: byModel } : {}),
+    };
+}
 
-    // Parse --output flag
-    const outputIdx = Deno.args.indexOf("--output");
-    const outputFile = outputIdx !== -1 ? Deno.args[outputIdx + 1] : null;
+function asQuery(v: unknown, what: string): Context {
+    if (typeof v !== "string" && (typeof v !== "object" || v === null)) {
+        throw new Error(`${what} must decode to a string or dict/list, got ${typeof v}`);
+    }
+    return v as Context;
+}
 
-    let out: unknown;
-    let fatalError: string | null = null;
-    let mcpHandle: McpHandle | null = null;
-    try {
-        const raw_stdin = await new Response(Deno.stdin.readable).text();
-        const inputIsJson = Deno.args.includes("--input-json");
-        let query_context: Context;
-        if (inputIsJson) {
-            const parsed = JSON.parse(raw_stdin);
-            if (typeof parsed !== "string" && (typeof parsed !== "object" || parsed === null)) {
-                throw new Error(
-                    `--input-json payload must decode to a string or dict/list, got ${typeof parsed}`
-                );
-            }
-            query_context = parsed as Context;
-        } else {
-            query_context = raw_stdin;
-        }
+function asToolSources(v: unknown, what: string): string[] {
+    if (!Array.isArray(v) || !v.every((x) => typeof x === "string")) {
+        throw new Error(`${what} must decode to a list of source strings`);
+    }
+    return v as string[];
+}
 
-        const schemaIdx = Deno.args.indexOf("--output-schema-file");
-        let rootSchema: JsonSchema | null = null;
-        if (schemaIdx !== -1 && Deno.args[schemaIdx + 1]) {
-            const schemaRaw = await Deno.readTextFile(Deno.args[schemaIdx + 1]);
-            rootSchema = JSON.parse(schemaRaw) as JsonSchema;
-        }
+function asEnv(v: unknown, what: string): Record<string, string> {
+    if (
+        typeof v !== "object" || v === null || Array.isArray(v) ||
+        !Object.entries(v).every(([k, val]) => typeof k === "string" && typeof val === "string")
+    ) {
+        throw new Error(`${what} must decode to an object of string → string`);
+    }
+    return v as Record<string, string>;
+}
 
-        const toolsIdx = Deno.args.indexOf("--tools-file");
-        let rootTools: string[] | null = null;
-        if (toolsIdx !== -1 && Deno.args[toolsIdx + 1]) {
-            const toolsRaw = await Deno.readTextFile(Deno.args[toolsIdx + 1]);
-            const parsedTools = JSON.parse(toolsRaw);
-            if (!Array.isArray(parsedTools) || !parsedTools.every((x) => typeof x === "string")) {
-                throw new Error("--tools-file must decode to a list of source strings");
-            }
-            rootTools = parsedTools as string[];
-        }
+function asMcpServers(v: unknown, what: string): McpServersConfig {
+    if (typeof v !== "object" || v === null || Array.isArray(v)) {
+        throw new Error(`${what} must decode to an object of server-name → config`);
+    }
+    return v as McpServersConfig;
+}
 
-        const envIdx = Deno.args.indexOf("--env-file");
-        let rootEnv: Record<string, string> | null = null;
-        if (envIdx !== -1 && Deno.args[envIdx + 1]) {
-            const envRaw = await Deno.readTextFile(Deno.args[envIdx + 1]);
-            const parsedEnv = JSON.parse(envRaw);
-            if (
-                typeof parsedEnv !== "object" || parsedEnv === null || Array.isArray(parsedEnv) ||
-                !Object.entries(parsedEnv).every(([k, v]) => typeof k === "string" && typeof v === "string")
-            ) {
-                throw new Error("--env-file must decode to an object of string → string");
-            }
-            rootEnv = parsedEnv as Record<string, string>;
-        }
+function asJsonObject(v: unknown, what: string): Record<string, unknown> {
+    if (typeof v !== "object" || v === null || Array.isArray(v)) {
+        throw new Error(`${what} must decode to a JSON object`);
+    }
+    return v as Record<string, unknown>;
+}
 
-        const mcpIdx = Deno.args.indexOf("--mcp-file");
-        if (mcpIdx !== -1 && Deno.args[mcpIdx + 1]) {
-            const mcpRaw = await Deno.readTextFile(Deno.args[mcpIdx + 1]);
-            const parsedMcp = JSON.parse(mcpRaw) as McpServersConfig;
-            if (typeof parsedMcp !== "object" || parsedMcp === null || Array.isArray(parsedMcp)) {
-                throw new Error("--mcp-file must decode to an object of server-name → config");
-            }
+// Run root agents over `queries`, at most `concurrency` at a time, sharing one
+// set of MCP connections. Each root gets its own RunState, so budgets and usage
+// are per query. Never throws: a failure is reported in that query's `error`,
+// alongside whatever usage was spent before it.
+async function executeRuns(
+    request: RunRequest,
+    queries: Context[],
+    concurrency: number,
+    onResult: (index: number, output: RunOutput) => Promise<void> | void,
+    // Live events per query (serve mode with events on) and a cancel signal.
+    hooks: { onEvent?: (index: number, event: Record<string, unknown>) => void; signal?: AbortSignal | null } = {},
+): Promise<void> {
+    configureEngine(request.settings);
+    let mcpHandle: McpHandle | null = null;
+    let setupError: string | null = null;
+    let cassette: Cassette | null = null;
+    try {
+        if (request.record && request.replay) throw new Error("Pass either record or replay, not both.");
+        if (request.record) cassette = Cassette.recorder(request.record);
+        if (request.replay) cassette = await Cassette.load(request.replay);
+    } catch (err) {
+        setupError = err instanceof Error ? err.message : String(err);
+        console.error(chalk.red(`\nFatal error: ${setupError}`));
+    }
+    if (cassette?.mode === "replay") {
+        // Replays never contact MCP servers; the recorded listing stands in.
+        mcpHandle = cassette.replayMcp();
+    } else if (request.mcpServers && !setupError) {
+        try {
             // Lazy import: pulls in @modelcontextprotocol/sdk only now, when MCP is used.
             const { connectMcpServers } = await import("./mcp.ts");
-            mcpHandle = await connectMcpServers(parsedMcp);
+            mcpHandle = await connectMcpServers(request.mcpServers);
+            cassette?.recordMcp(mcpHandle);
             console.log(
                 `✔ MCP connected: ${mcpHandle.tools.length} tool(s), ` +
                 `${mcpHandle.resources.length} resource(s) across [${mcpHandle.serverNames.join(", ")}]`
             );
+        } catch (err) {
+            setupError = err instanceof Error ? err.message : String(err);
+            console.error(chalk.red(`\nFatal error: ${setupError}`));
         }
+    }
 
-        const llmKwargsIdx = Deno.args.indexOf("--llm-kwargs-file");
-        let rootLlmKwargs: Record<string, unknown> | null = null;
-        if (llmKwargsIdx !== -1 && Deno.args[llmKwargsIdx + 1]) {
-            const raw = await Deno.readTextFile(Deno.args[llmKwargsIdx + 1]);
-            const parsed = JSON.parse(raw);
-            if (typeof parsed !== "object" || parsed === null || Array.isArray(parsed)) {
-                throw new Error("--llm-kwargs-file must decode to a JSON object");
+    const runOne = async (query: Context, index: number): Promise<RunOutput> => {
+        const onEvent = hooks.onEvent;
+        const run = newRunState(request.settings, {
+            onEvent: onEvent ? (event) => onEvent(index, event) : null,
+            signal: hooks.signal,
+            cassette,
+        });
+        let out: unknown;
+        let fatalError = setupError;
+        // Set when deadline_s passed: `out` is the root's partial result.
+        let partial = false;
+        if (!fatalError) {
+            try {
+                // Root agent: mcpAllowedServers = null → sees all configured servers.
+                // rootInstruction (from run(instruction=...)) applies to the root only.
+                out = await subagent(
+                    query, 0, undefined, request.outputSchema, request.tools, request.env,
+                    mcpHandle, null, request.llmKwargs, undefined, request.settings.rootInstruction, run,
+                    String(index),
+                );
+                // Final result is already logged inside subagent()
+                // Show usage across all agents of this run
+                showGlobalUsage(run.usage.getTotalUsage());
+            } catch (err) {
+                if (err instanceof DeadlineExceeded) {
+                    out = err.partial;
+                    partial = true;
+                    showGlobalUsage(run.usage.getTotalUsage());
+                } else {
+                    fatalError = err instanceof Error ? err.message : String(err);
+                    console.error(chalk.red(`\nFatal error: ${fatalError}`));
+                }
             }
-            rootLlmKwargs = parsed as Record<string, unknown>;
         }
+        // Flush logs so the file is complete when the caller reads it.
+        await Logger.flush();
+        return {
+            results: out ?? null,
+            log_file: getLogFile() ?? null,
+            usage: usageSummary(run.usage),
+            ...(partial ? { partial: true } : {}),
+            ...(fatalError ? { error: fatalError } : {}),
+        };
+    };
 
-        // Root agent: mcpAllowedServers = null → sees all configured servers.
-        // ROOT_INSTRUCTION (from run(instruction=...)) applies to the root only.
-        out = await subagent(query_context, 0, undefined, rootSchema, rootTools, rootEnv, mcpHandle, null, rootLlmKwargs, undefined, ROOT_INSTRUCTION);
-
-        // Final result is already logged inside subagent()
-        // Show global usage across all runs
-        showGlobalUsage(getTotalUsage());
-        console.log("JSON_RESULT:" + JSON.stringify({ results: out }));
-    } catch (err) {
-        fatalError = err instanceof Error ? err.message : String(err);
-        console.error(chalk.red(`\nFatal error: ${fatalError}`));
-        // Removed throw err - error is already handled
+    try {
+        let next = 0;
+        const worker = async () => {
+            while (next < queries.length) {
+                const index = next++;
+                await onResult(index, await runOne(queries[index], index));
+            }
+        };
+        const width = Math.max(1, Math.min(concurrency, queries.length));
+        await Promise.all(Array.from({ length: width }, worker));
     } finally {
-        // Close MCP connections (and any stdio subprocesses) before exit.
+        // Close MCP connections (and any stdio subprocesses) before returning.
         if (mcpHandle) {
             try { await mcpHandle.closeAll(); } catch { /* ignore */ }
         }
+        if (cassette?.mode === "record") {
+            await cassette.save();
+            console.log(chalk.green(`✔ Cassette recorded to ${cassette.path}`));
+        }
+    }
 
-        // Flush logs before exit
-        await Logger.flush();
+    // Reprint the log file path for easy access
+    const logFile = getLogFile();
+    if (logFile) {
+        console.log(chalk.green(`\n📝 Log saved to: ${logFile}`));
+        console.log(chalk.dim(`   View with: fast-rlm-log ${logFile} --tui`));
+    }
+}
+
+// Run one root agent to completion (see executeRuns).
+async function executeRun(
+    request: RunRequest,
+    hooks: { onEvent?: EventSink | null; signal?: AbortSignal | null } = {},
+): Promise<RunOutput> {
+    const outputs: RunOutput[] = [];
+    const onEvent = hooks.onEvent;
+    await executeRuns(request, [request.query], 1, (_index, o) => { outputs.push(o); }, {
+        onEvent: onEvent ? (_index, event) => onEvent(event) : undefined,
+        signal: hooks.signal,
+    });
+    return outputs[0];
+}
+
+function flagValue(name: string): string | null {
+    const idx = Deno.args.indexOf(name);
+    return idx !== -1 && Deno.args[idx + 1] ? Deno.args[idx + 1] : null;
+}
 
-        // Reprint the log file path for easy access
-        const logFile = getLogFile();
-        if (logFile) {
-            console.log(chalk.green(`\n📝 Log saved to: ${logFile}`));
-            console.log(chalk.dim(`   View with: fast-rlm-log ${logFile} --tui`));
+async function readJsonFlag(name: string): Promise<unknown | null> {
+    const path = flagValue(name);
+    return path ? JSON.parse(await Deno.readTextFile(path)) : null;
+}
+
+// Build the RunRequest for a one-shot CLI run: query on stdin, everything else
+// in the --*-file flags written by fast_rlm.run().
+async function readCliRequest(): Promise<RunRequest> {
+    const raw_stdin = await new Response(Deno.stdin.readable).text();
+    const query = Deno.args.includes("--input-json")
+        ? asQuery(JSON.parse(raw_stdin), "--input-json payload")
+        : raw_stdin;
+
+    const schema = await readJsonFlag("--output-schema-file");
+    const tools = await readJsonFlag("--tools-file");
+    const env = await readJsonFlag("--env-file");
+    const mcpServers = await readJsonFlag("--mcp-file");
+    const llmKwargs = await readJsonFlag("--llm-kwargs-file");
+    return {
+        query,
+        settings: defaultRun().settings,
+        outputSchema: schema as JsonSchema | null,
+        tools: tools != null ? asToolSources(tools, "--tools-file") : null,
+        env: env != null ? asEnv(env, "--env-file") : null,
+        mcpServers: mcpServers != null ? asMcpServers(mcpServers, "--mcp-file") : null,
+        llmKwargs: llmKwargs != null ? asJsonObject(llmKwargs, "--llm-kwargs-file") : null,
+        record: flagValue("--record"),
+        replay: flagValue("--replay"),
+    };
+}
+
+async function cliMain(): Promise<never> {
+    const prefix = flagValue("--prefix");
+    if (prefix) setLogPrefix(prefix);
+    const logDir = flagValue("--log-dir");
+    if (logDir) setLogDir(logDir);
+    const outputFile = flagValue("--output");
+
+    let output: RunOutput;
+    try {
+        output = await executeRun(await readCliRequest());
+    } catch (err) {
+        // Bad flags / unreadable input files: report like any other run failure.
+        const msg = err instanceof Error ? err.message : String(err);
+        console.error(chalk.red(`\nFatal error: ${msg}`));
+        output = { results: null, log_file: getLogFile(), usage: emptyUsage(), error: msg };
+    }
+
+    if (!output.error) {
+        console.log("JSON_RESULT:" + JSON.stringify({ results: output.results }));
+    }
+    if (outputFile) {
+        await Deno.writeTextFile(outputFile, JSON.stringify(output));
+    }
+
+    // Explicit exit: Deno can keep the event loop alive due to unclosed
+    // async resources (OpenAI client, Pyodide workers). Always exit so
+    // the process never hangs.
+    Deno.exit(output.error ? 1 : 0);
+}
+
+// ---- Serve mode --------------------------------------------------------------
+//
+// `subagents.ts --serve` keeps one engine process warm for many runs (see
+// fast_rlm/_pool.py). Requests arrive as JSON lines on stdin; replies go to
+// stdout as JSON lines prefixed with SERVE_PREFIX. stdout is reserved for the
+// protocol, so all human-readable output is redirected to stderr.
+
+const SERVE_PREFIX = "@@fast-rlm@@ ";
+
+// deno-lint-ignore no-explicit-any
+type ServeMessage = Record<string, any>;
+
+const _encoder = new TextEncoder();
+let _sendChain: Promise<void> = Promise.resolve();
+
+function send(msg: ServeMessage): Promise<void> {
+    const bytes = _encoder.encode(SERVE_PREFIX + JSON.stringify(msg) + "\n");
+    _sendChain = _sendChain.then(async () => {
+        let written = 0;
+        while (written < bytes.length) {
+            written += await Deno.stdout.write(bytes.subarray(written));
         }
+    });
+    return _sendChain;
+}
+
+async function* readLines(stream: ReadableStream<Uint8Array>): AsyncGenerator<string> {
+    const decoder = new TextDecoder();
+    let buf = "";
+    for await (const chunk of stream) {
+        buf += decoder.decode(chunk, { stream: true });
+        let nl: number;
+        while ((nl = buf.indexOf("\n")) !== -1) {
+            yield buf.slice(0, nl);
+            buf = buf.slice(nl + 1);
+        }
+    }
+    buf += decoder.decode();
+    if (buf.trim()) yield buf;
+}
+
+function readServeRequest(msg: ServeMessage, query: Context): RunRequest {
+    const config = asJsonObject(msg.config, "config") as RlmConfig;
+    return {
+        query,
+        settings: resolveRunSettings(config),
+        outputSchema: (msg.output_schema ?? null) as JsonSchema | null,
+        tools: msg.tools != null ? asToolSources(msg.tools, "tools") : null,
+        env: msg.env != null ? asEnv(msg.env, "env") : null,
+        mcpServers: msg.mcp_servers != null ? asMcpServers(msg.mcp_servers, "mcp_servers") : null,
+        llmKwargs: msg.llm_kwargs != null ? asJsonObject(msg.llm_kwargs, "llm_kwargs") : null,
+        record: typeof msg.record === "string" ? msg.record : null,
+        replay: typeof msg.replay === "string" ? msg.replay : null,
+    };
+}
+
+// Per-request setup shared by "run" and "run_many": each request gets its own
+// log file. ACP agents resolve against this request's config while it runs.
+async function beginServeRequest(msg: ServeMessage): Promise<void> {
+    setActiveConfig(asJsonObject(msg.config, "config") as RlmConfig);
+    await closeLogFile();
+    setLogDir(msg.log_dir ?? "./logs");
+    setLogPrefix(msg.prefix ?? null);
+}
+
+// {"type": "run"}: one root run → one {"type": "result"} reply. With
+// "events": true, every Logger record is also sent as {"type": "event"}.
+async function serveRun(msg: ServeMessage, signal: AbortSignal): Promise<void> {
+    let output: RunOutput;
+    try {
+        await beginServeRequest(msg);
+        output = await executeRun(readServeRequest(msg, asQuery(msg.query, "query")), {
+            onEvent: msg.events ? (event) => { send({ type: "event", id: msg.id, event }); } : null,
+            signal,
+        });
+    } catch (err) {
+        const error = err instanceof Error ? err.message : String(err);
+        output = { results: null, log_file: getLogFile(), usage: emptyUsage(), error };
+    } finally {
+        setActiveConfig(null);
+    }
+    await send({ type: "result", id: msg.id, ...output });
+}
+
+// {"type": "run_many", "queries": [...], "concurrency": k}: many root runs with
+// one config/tools/MCP setup, up to k at once in this process. Replies with one
+// {"type": "result", "index": i} per query as it completes, then {"type": "done"}.
+async function serveRunMany(msg: ServeMessage, signal: AbortSignal): Promise<void> {
+    let error: string | null = null;
+    try {
+        await beginServeRequest(msg);
+        if (!Array.isArray(msg.queries)) throw new Error("queries must be a list");
+        const queries = (msg.queries as unknown[]).map((q, i) => asQuery(q, `queries[${i}]`));
+        const request = readServeRequest(msg, "");
+        await executeRuns(request, queries, Number(msg.concurrency) || 1,
+            (index, output) => send({ type: "result", id: msg.id, index, ...output }),
+            {
+                onEvent: msg.events
+                    ? (index, event) => { send({ type: "event", id: msg.id, index, event }); }
+                    : undefined,
+                signal,
+            });
+    } catch (err) {
+        error = err instanceof Error ? err.message : String(err);
+    } finally {
+        setActiveConfig(null);
+    }
+    await send({ type: "done", id: msg.id, ...(error ? { error } : {}) });
+}
 
-        if (outputFile) {
-            const totalUsage = getTotalUsage();
-            await Deno.writeTextFile(outputFile, JSON.stringify({
-                results: out ?? null,
-                log_file: logFile ?? null,
-                usage: {
-                    prompt_tokens: totalUsage.prompt_tokens,
-                    completion_tokens: totalUsage.completion_tokens,
-                    total_tokens: totalUsage.total_tokens,
-                    cached_tokens: totalUsage.cached_tokens,
-                    reasoning_tokens: totalUsage.reasoning_tokens,
-                    cost: totalUsage.cost,
-                },
-                ...(fatalError ? { error: fatalError } : {}),
-            }));
+async function serveMain(): Promise<never> {
+    const writeErr = console.error.bind(console);
+    let quiet = false;
+    // Protocol owns stdout; step panels etc. go to stderr unless the current
+    // request asked for verbose=False.
+    console.log = (...args: unknown[]) => { if (!quiet) writeErr(...args); };
+    console.error = (...args: unknown[]) => { if (!quiet) writeErr(...args); };
+
+    // Warm-up: boot a REPL (Pyodide + packages) before the first request
+    // arrives, so the first agent gets a ready interpreter.
+    try {
+        const config = loadConfig();
+        replPool.configure({
+            size: config.repl_pool_size ?? 2,
+            snapshots: config.repl_snapshot ?? true,
+            packages: config.repl_packages ?? [],
+            workers: config.repl_workers ?? true,
+        });
+        const models = [config.primary_agent, config.sub_agent].filter((m): m is string => !!m);
+        await Promise.all([
+            replPool.warm(),
+            config.prewarm_connections ? prewarmModelConnections(models) : Promise.resolve(),
+        ]);
+    } catch (err) {
+        writeErr(chalk.yellow(`⚠ Pyodide warm-up failed: ${err instanceof Error ? err.message : err}`));
+    }
+    await send({ type: "ready" });
+
+    // Requests run one at a time, in arrival order; the reader keeps going so a
+    // {"type": "cancel", "id": ...} can abort the request that is running.
+    let queue: Promise<void> = Promise.resolve();
+    const inFlight = new Map<unknown, AbortController>();
+    for await (const line of readLines(Deno.stdin.readable)) {
+        if (!line.trim()) continue;
+        let msg: ServeMessage;
+        try {
+            msg = JSON.parse(line);
+        } catch {
+            writeErr(chalk.red(`✖ serve: ignoring malformed request line`));
+            continue;
         }
+        if (msg.type === "cancel") {
+            inFlight.get(msg.id)?.abort();
+            continue;
+        }
+        if (msg.type !== "run" && msg.type !== "run_many") continue;
+        const controller = new AbortController();
+        inFlight.set(msg.id, controller);
+        queue = queue.then(async () => {
+            quiet = msg.verbose === false;
+            try {
+                if (msg.type === "run") {
+                    await serveRun(msg, controller.signal);
+                } else {
+                    await serveRunMany(msg, controller.signal);
+                }
+            } finally {
+                quiet = false;
+                inFlight.delete(msg.id);
+            }
+        });
+    }
+    await queue;
+    await closeLogFile();
+    Deno.exit(0);
+}
 
-        // Explicit exit: Deno can keep the event loop alive due to unclosed
-        // async resources (OpenAI client, Pyodide workers). Always exit so
-        // the process never hangs.
-        Deno.exit(fatalError ? 1 : 0);
+if (import.meta.main) {
+    if (Deno.args.includes("--serve")) {
+        await serveMain();
+    } else {
+        await cliMain();
     }
 }
@@ -28,6 +28,11 @@ function boxWidth(depth: number): number {
 
 export interface StepTimestamps {
     llm_call_start?: string;
+    // Streamed completions only: when the first token arrived (TTFT).
+    llm_first_token?: string;
+    // When the request left the rate limiter's queue; from llm_call_start,
+    // the time spent queued and backing off (rate_limit.ts).
+    llm_request_start?: string;
     llm_call_end?: string;
     execution_start?: string;
     execution_end?: string;
@@ -116,7 +121,12 @@ export function printStep(data: StepData): void {
         if (usage.reasoning_tokens > 0) {
             stepParts.push(`${fmt(usage.reasoning_tokens, chalk.magenta)} reasoning`);
         }
-        const stepLine = `${chalk.bold("Step:")}  ${stepParts.join(", ")} | Cost: ${fmtCost(usage.cost)}`;
+        const ts = data.timestamps;
+        const queuedMs = ts?.llm_call_start && ts.llm_request_start
+            ? Date.parse(ts.llm_request_start) - Date.parse(ts.llm_call_start)
+            : 0;
+        const queued = queuedMs >= 100 ? ` | Queued: ${chalk.yellow((queuedMs / 1000).toFixed(1) + "s")}` : "";
+        const stepLine = `${chalk.bold("Step:")}  ${stepParts.join(", ")} | Cost: ${fmtCost(usage.cost)}${queued}`;
 
         // Total line
         let totalLine = "";
@@ -1,54 +1,176 @@
 /**
- * Global usage tracker across all subagents
+ * Usage tracking across all subagents of a run
  */
 
 import type { Usage } from "./call_llm.ts";
 
-let globalUsage: Usage = {
-    prompt_tokens: 0,
-    completion_tokens: 0,
-    total_tokens: 0,
-    cached_tokens: 0,
-    reasoning_tokens: 0,
-    cost: undefined,
-};
+export function emptyUsage(): Usage {
+    return {
+        prompt_tokens: 0,
+        completion_tokens: 0,
+        total_tokens: 0,
+        cached_tokens: 0,
+        reasoning_tokens: 0,
+        cost: undefined,
+    };
+}
+
+// One model's share of a run (model_routing): the agents it ran, how many of
+// them escalated to the next model of their cascade, and its LLM calls.
+export interface ModelUsage {
+    agents: number;
+    escalated: number;
+    calls: number;
+    prompt_tokens: number;
+    completion_tokens: number;
+    cost: number | undefined;
+    // Total time spent in its generate_code calls.
+    llm_ms: number;
+}
+
+// Usage + call totals for one root run (root agent + every sub-agent). Several
+// root runs can share one engine process (serve mode, run_many), so each gets
+// its own tracker through its RunState.
+export class UsageTracker {
+    private usage: Usage = emptyUsage();
+    // Running count of LLM calls across ALL agents (root + every sub-agent) and
+    // every backend (openai/vertex/acp). Backs the max_global_calls budget — the
+    // stop gap that works for ACP, where token/cost usage is always zero.
+    private calls = 0;
+    // Calls answered from / missed in the response cache (response_cache.ts).
+    private cacheHits = 0;
+    private cacheMisses = 0;
+    // llm_query calls served by an identical in-flight or finished child, and
+    // those that started their own (query_memo.ts).
+    private dedupInFlight = 0;
+    private dedupMemoized = 0;
+    private dedupMisses = 0;
+    // generate_code calls that were hedged, and those the duplicate won
+    // (hedging.ts).
+    private hedged = 0;
+    private hedgeWins = 0;
+    private byModel = new Map<string, ModelUsage>();
+
+    trackCall(): void {
+        this.calls += 1;
+    }
+
+    getTotalCalls(): number {
+        return this.calls;
+    }
+
+    trackUsage(usage: Usage): void {
+        this.usage.prompt_tokens += usage.prompt_tokens || 0;
+        this.usage.completion_tokens += usage.completion_tokens || 0;
+        this.usage.total_tokens += usage.total_tokens || 0;
+        this.usage.cached_tokens += usage.cached_tokens || 0;
+        this.usage.reasoning_tokens += usage.reasoning_tokens || 0;
+        if (usage.cost != null) {
+            this.usage.cost = (this.usage.cost ?? 0) + usage.cost;
+        }
+    }
+
+    getTotalUsage(): Usage {
+        return { ...this.usage };
+    }
+
+    trackResponseCache(hit: boolean): void {
+        if (hit) this.cacheHits += 1;
+        else this.cacheMisses += 1;
+    }
+
+    getResponseCacheStats(): { hits: number; misses: number } {
+        return { hits: this.cacheHits, misses: this.cacheMisses };
+    }
+
+    trackQueryDedup(hit: "in_flight" | "memoized" | null): void {
+        if (hit === "in_flight") this.dedupInFlight += 1;
+        else if (hit === "memoized") this.dedupMemoized += 1;
+        else this.dedupMisses += 1;
+    }
+
+    getQueryDedupStats(): { in_flight_hits: number; memo_hits: number; misses: number } {
+        return { in_flight_hits: this.dedupInFlight, memo_hits: this.dedupMemoized, misses: this.dedupMisses };
+    }
+
+    trackHedge(outcome: "primary" | "hedge" | undefined): void {
+        if (!outcome) return;
+        this.hedged += 1;
+        if (outcome === "hedge") this.hedgeWins += 1;
+    }
+
+    getHedgeStats(): { hedged: number; hedge_wins: number } {
+        return { hedged: this.hedged, hedge_wins: this.hedgeWins };
+    }
+
+    private modelEntry(model: string): ModelUsage {
+        let entry = this.byModel.get(model);
+        if (!entry) {
+            entry = { agents: 0, escalated: 0, calls: 0, prompt_tokens: 0, completion_tokens: 0, cost: undefined, llm_ms: 0 };
+            this.byModel.set(model, entry);
+        }
+        return entry;
+    }
+
+    /** An agent started on `model`, or (escalated) handed its task on. */
+    trackModelAgent(model: string, escalated = false): void {
+        const entry = this.modelEntry(model);
+        if (escalated) entry.escalated += 1;
+        else entry.agents += 1;
+    }
+
+    /** One LLM call on `model`; `ms` for generate_code calls. */
+    trackModelCall(model: string, usage: Usage, ms = 0): void {
+        const entry = this.modelEntry(model);
+        entry.calls += 1;
+        entry.prompt_tokens += usage.prompt_tokens || 0;
+        entry.completion_tokens += usage.completion_tokens || 0;
+        if (usage.cost != null) entry.cost = (entry.cost ?? 0) + usage.cost;
+        entry.llm_ms += ms;
+    }
+
+    getModelStats(): Record<string, ModelUsage> {
+        return Object.fromEntries([...this.byModel].map(([model, entry]) => [model, { ...entry }]));
+    }
 
-// Running count of LLM calls across ALL agents (root + every sub-agent) and
-// every backend (openai/vertex/acp). Backs the max_global_calls budget — the
-// stop gap that works for ACP, where token/cost usage is always zero.
-let globalCalls = 0;
+    reset(): void {
+        this.usage = emptyUsage();
+        this.calls = 0;
+        this.cacheHits = 0;
+        this.cacheMisses = 0;
+        this.dedupInFlight = 0;
+        this.dedupMemoized = 0;
+        this.dedupMisses = 0;
+        this.hedged = 0;
+        this.hedgeWins = 0;
+        this.byModel.clear();
+    }
+}
+
+// Process-wide tracker, used by subagent() calls made without a RunState
+// (e.g. test_counting_r.ts) and by the module-level helpers below.
+const defaultTracker = new UsageTracker();
+
+export function defaultUsageTracker(): UsageTracker {
+    return defaultTracker;
+}
 
 export function trackCall(): void {
-    globalCalls += 1;
+    defaultTracker.trackCall();
 }
 
 export function getTotalCalls(): number {
-    return globalCalls;
+    return defaultTracker.getTotalCalls();
 }
 
 export function trackUsage(usage: Usage): void {
-    globalUsage.prompt_tokens += usage.prompt_tokens || 0;
-    globalUsage.completion_tokens += usage.completion_tokens || 0;
-    globalUsage.total_tokens += usage.total_tokens || 0;
-    globalUsage.cached_tokens += usage.cached_tokens || 0;
-    globalUsage.reasoning_tokens += usage.reasoning_tokens || 0;
-    if (usage.cost != null) {
-        globalUsage.cost = (globalUsage.cost ?? 0) + usage.cost;
-    }
+    defaultTracker.trackUsage(usage);
 }
 
 export function getTotalUsage(): Usage {
-    return { ...globalUsage };
+    return defaultTracker.getTotalUsage();
 }
 
 export function resetUsage(): void {
-    globalUsage = {
-        prompt_tokens: 0,
-        completion_tokens: 0,
-        total_tokens: 0,
-        cached_tokens: 0,
-        reasoning_tokens: 0,
-        cost: undefined,
-    };
-    globalCalls = 0;
+    defaultTracker.reset();
 }
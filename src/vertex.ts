@@ -1,4 +1,5 @@
 import { OpenAI } from "openai";
+import { sharedClient } from "./llm_clients.ts";
 
 const TOKEN_REFRESH_MARGIN_MS = 60_000;
 
@@ -93,7 +94,7 @@ function pemToArrayBuffer(pem: string): ArrayBuffer {
     return buf.buffer;
 }
 
-function getVertexEndpoint(): string {
+export function getVertexEndpoint(): string {
     const project = Deno.env.get("GOOGLE_CLOUD_PROJECT") ||
         Deno.env.get("CLOUDSDK_CORE_PROJECT");
     const location = Deno.env.get("GOOGLE_CLOUD_LOCATION") || "us-central1";
@@ -108,27 +109,27 @@ function getVertexEndpoint(): string {
     return `https://${location}-aiplatform.googleapis.com/v1beta1/projects/${project}/locations/${location}/endpoints/openapi`;
 }
 
-export async function createVertexClient(options?: {
+// The shared Vertex client for the current access token. getAccessToken() is
+// cached, so this is a map lookup until the token nears expiry; a refreshed
+// token yields a new client (see llm_clients.ts).
+export async function getVertexClient(options?: {
     maxRetries?: number;
     timeout?: number;
 }): Promise<OpenAI> {
-    const token = await getAccessToken();
-    return new OpenAI({
-        apiKey: token,
+    const key = {
+        backend: "vertex" as const,
         baseURL: getVertexEndpoint(),
+        apiKey: await getAccessToken(),
         maxRetries: options?.maxRetries ?? 3,
         timeout: options?.timeout ?? 600000,
-    });
-}
-
-export async function refreshVertexClient(client: OpenAI, options?: {
-    maxRetries?: number;
-    timeout?: number;
-}): Promise<OpenAI> {
-    if (Date.now() < tokenExpiresAt - TOKEN_REFRESH_MARGIN_MS) {
-        return client;
-    }
-    return createVertexClient(options);
+    };
+    return sharedClient(key, (fetch) => new OpenAI({
+        apiKey: key.apiKey,
+        baseURL: key.baseURL,
+        maxRetries: key.maxRetries,
+        timeout: key.timeout,
+        fetch,
+    }));
 }
 
 export function isVertexModel(model: string): boolean {
@@ -0,0 +1,119 @@
+// A Repl whose Pyodide runs in its own Web Worker (see repl.ts for the
+// interface, repl_worker.ts for the worker side). Every agent in a fan-out
+// then executes Python on its own thread; bridges (llm_query, batch confirm,
+// MCP) run here on the main thread and are reached by message-passing RPC.
+import type { Bridge, Repl } from "./repl.ts";
+import type { EncodedContext } from "./pyodide_context.ts";
+import type { WheelStore } from "./repl_packages.ts";
+
+export class WorkerRepl implements Repl {
+    onStdout: (text: string) => void = () => {};
+    private worker: Worker;
+    private nextId = 0;
+    private pending = new Map<number, { resolve: (v: unknown) => void; reject: (e: Error) => void }>();
+    private bridges: Record<string, Bridge> = {};
+    private closed = false;
+
+    constructor() {
+        this.worker = new Worker(new URL("./repl_worker.ts", import.meta.url).href, { type: "module" });
+        this.worker.onmessage = (e: MessageEvent) => this.onMessage(e.data);
+        this.worker.onerror = (e: ErrorEvent) => {
+            e.preventDefault();
+            this.failAll(new Error(`REPL worker crashed: ${e.message}`));
+        };
+    }
+
+    // `transfer`: buffers moved to the worker instead of cloned (detached here).
+    private request(msg: Record<string, unknown>, transfer: Transferable[] = []): Promise<unknown> {
+        if (this.closed) return Promise.reject(new Error("REPL worker is closed"));
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            this.worker.postMessage({ ...msg, id }, transfer);
+        });
+    }
+
+    private onMessage(msg: Record<string, any>): void {
+        switch (msg.op) {
+            case "stdout":
+                this.onStdout(msg.text);
+                break;
+            case "stderr":
+                console.error(`[Python Stderr]: ${msg.text}`);
+                break;
+            case "done": {
+                const p = this.pending.get(msg.id);
+                this.pending.delete(msg.id);
+                if (msg.error !== undefined) p?.reject(new Error(msg.error));
+                else p?.resolve(msg.value);
+                break;
+            }
+            case "call":
+                this.answer(msg.call, msg.name, msg.args);
+                break;
+        }
+    }
+
+    private async answer(call: number, name: string, args: unknown[]): Promise<void> {
+        let reply: Record<string, unknown>;
+        try {
+            const bridge = this.bridges[name];
+            if (!bridge) throw new Error(`no bridge named ${name}`);
+            reply = { op: "reply", call, value: await bridge(...args) };
+        } catch (err) {
+            reply = { op: "reply", call, error: err instanceof Error ? err.message : String(err) };
+        }
+        if (this.closed) return;
+        try {
+            this.worker.postMessage(reply);
+        } catch (err) {
+            // The value didn't survive structured cloning.
+            this.worker.postMessage({ op: "reply", call, error: err instanceof Error ? err.message : String(err) });
+        }
+    }
+
+    private failAll(err: Error): void {
+        for (const p of this.pending.values()) p.reject(err);
+        this.pending.clear();
+    }
+
+    /** Boot the worker's interpreter (snapshot may live in a SharedArrayBuffer). */
+    async boot(snapshot: Uint8Array | null, wheels: WheelStore | null): Promise<void> {
+        await this.request({ op: "boot", snapshot, wheels });
+    }
+
+    async setBridges(bridges: Record<string, Bridge>): Promise<void> {
+        this.bridges = { ...this.bridges, ...bridges };
+        await this.request({ op: "bridges", names: Object.keys(bridges) });
+    }
+
+    // The context's buffer is transferred: the worker's MEMFS file owns the
+    // one encoded copy, and the caller must not reuse `context`.
+    async stageContext(context: EncodedContext): Promise<string> {
+        return await this.request({ op: "stage", context }, [context.bytes.buffer]) as string;
+    }
+
+    async run(code: string): Promise<void> {
+        await this.request({ op: "run", code });
+    }
+
+    async get(name: string): Promise<unknown> {
+        return await this.request({ op: "get", name });
+    }
+
+    async reset(): Promise<void> {
+        this.bridges = {};
+        await this.request({ op: "reset" });
+    }
+
+    async memoryBytes(): Promise<number> {
+        return await this.request({ op: "memory" }) as number;
+    }
+
+    close(): void {
+        if (this.closed) return;
+        this.closed = true;
+        this.worker.terminate();
+        this.failAll(new Error("REPL worker is closed"));
+    }
+}
@@ -0,0 +1,80 @@
+// Unit test: agent admission control (agent_scheduler.ts) — the live-agent
+// cap, deepest-first admission, and the rule that keeps a tree of blocked
+// parents from deadlocking — no network.
+//
+// Run:  deno test tests/agent_scheduler_test.ts
+import { assertEquals } from "jsr:@std/assert@^1.0.0";
+import { AgentScheduler, type AgentSlot } from "../src/agent_scheduler.ts";
+
+const tick = () => new Promise((r) => setTimeout(r, 0));
+
+// Queue an admission at `depth`; `admitted` collects labels in admission order.
+function request(scheduler: AgentScheduler, depth: number, label: string, admitted: string[]) {
+    return scheduler.admit(depth).then((slot) => {
+        admitted.push(label);
+        return slot;
+    });
+}
+
+Deno.test("runnable agents at max_live_agents make the rest wait", async () => {
+    const scheduler = new AgentScheduler();
+    scheduler.configure({ maxLiveAgents: 2, maxMemoryBytes: null });
+    const admitted: string[] = [];
+    const root = await request(scheduler, 0, "root", admitted);
+    const a = await request(scheduler, 1, "a", admitted);
+    request(scheduler, 1, "b", admitted);
+    request(scheduler, 2, "c", admitted);
+    await tick();
+    assertEquals(admitted, ["root", "a"]);
+    assertEquals(scheduler.stats().queued, 2);
+
+    // A freed slot goes to the deepest waiter, not the oldest.
+    a.release();
+    await tick();
+    assertEquals(admitted, ["root", "a", "c"]);
+    assertEquals(scheduler.stats().forced, 0);
+    root.release();
+    await tick();
+    assertEquals(admitted, ["root", "a", "c", "b"]);
+});
+
+Deno.test("when every live agent is blocked, the deepest waiter is admitted over the cap", async () => {
+    const scheduler = new AgentScheduler();
+    scheduler.configure({ maxLiveAgents: 2, maxMemoryBytes: null });
+    const admitted: string[] = [];
+    const parents: AgentSlot[] = [
+        await request(scheduler, 0, "root", admitted),
+        await request(scheduler, 1, "parent", admitted),
+    ];
+    request(scheduler, 1, "shallow", admitted);
+    const deep = request(scheduler, 2, "deep", admitted);
+    request(scheduler, 2, "deep-later", admitted);
+    await tick();
+    assertEquals(admitted, ["root", "parent"]);
+
+    // The first parent to block still leaves a runnable one: nothing moves.
+    parents[0].block();
+    await tick();
+    assertEquals(admitted, ["root", "parent"]);
+
+    // Both blocked on children: without a new agent nothing can finish.
+    parents[1].block();
+    await tick();
+    assertEquals(admitted, ["root", "parent", "deep"]);
+    const stats = scheduler.stats();
+    assertEquals(stats.live, 3);
+    assertEquals(stats.blocked, 2);
+    assertEquals(stats.queued, 2);
+    assertEquals(stats.forced, 1);
+
+    // Only one: the admitted child is runnable, so the caps hold again.
+    const child = await deep;
+    assertEquals(child.depth, 2);
+    assertEquals(child.waitingOn, 0);
+
+    // It blocks in turn: the next deepest (first come within a depth) goes.
+    child.block();
+    await tick();
+    assertEquals(admitted, ["root", "parent", "deep", "deep-later"]);
+    assertEquals(scheduler.stats().forced, 2);
+});
@@ -0,0 +1,42 @@
+// Unit test: hierarchical budget reservations (budget.ts) — grants carved
+// from a parent's remaining budget and returned when the child ends.
+//
+// Run:  deno test tests/budget_test.ts
+import { assertAlmostEquals, assertEquals, assertThrows } from "jsr:@std/assert@^1.0.0";
+import { BudgetNode, parseBudgetRequest } from "../src/budget.ts";
+import { emptyUsage } from "../src/usage.ts";
+
+const spend = (cost: number, prompt = 0, completion = 0) =>
+    ({ ...emptyUsage(), cost, prompt_tokens: prompt, completion_tokens: completion });
+
+Deno.test("a batch splits the parent's spendable budget evenly", () => {
+    const root = new BudgetNode({ money: 1, prompt_tokens: 1000, completion_tokens: Infinity });
+    const children = [4, 3, 2, 1].map((share) => root.grant(null, share));
+    for (const child of children) {
+        assertAlmostEquals(child.limit.money, 0.225);
+        assertEquals(child.limit.prompt_tokens, 225);
+        assertEquals(child.limit.completion_tokens, Infinity);
+    }
+    // Only the parent's holdback is left.
+    assertAlmostEquals(root.available().money, 0.1);
+    assertThrows(() => root.grant(null), Error, "Budget exhausted");
+});
+
+Deno.test("unused budget flows back and the child's spend is charged", () => {
+    const root = new BudgetNode({ money: 1, prompt_tokens: Infinity, completion_tokens: Infinity });
+    const child = root.grant({ money: 0.3 });
+    assertAlmostEquals(root.available().money, 0.7);
+    child.charge(spend(0.05));
+    child.grant(null).close();
+    child.close();
+    child.close();
+    assertAlmostEquals(root.available().money, 0.95);
+});
+
+Deno.test("llm_query budget accepts USD or a dict of amounts", () => {
+    assertEquals(parseBudgetRequest(null), null);
+    assertEquals(parseBudgetRequest(0.5), { money: 0.5 });
+    assertEquals(parseBudgetRequest({ completion_tokens: 100 }), { completion_tokens: 100 });
+    assertThrows(() => parseBudgetRequest({ dollars: 1 }), Error, "not valid");
+    assertThrows(() => parseBudgetRequest("1"), Error, "must be a number");
+});
@@ -0,0 +1,33 @@
+// Unit test: wall-clock deadlines (deadline.ts) — what a child inherits and
+// when an agent is nudged to finish.
+//
+// Run:  deno test tests/deadline_test.ts
+import { assert, assertEquals, assertThrows } from "jsr:@std/assert@^1.0.0";
+import { childDeadline, parseDeadline, shouldNudge } from "../src/deadline.ts";
+
+Deno.test("children inherit the parent's deadline less a margin", () => {
+    const now = 1_000_000;
+    assertEquals(childDeadline(null, null, now), null);
+    // 15% of the 100 s left.
+    assertEquals(childDeadline(now + 100_000, null, now), now + 85_000);
+    // At least 2 s.
+    assertEquals(childDeadline(now + 5_000, null, now), now + 3_000);
+    // llm_query(deadline_s=...) can only make it sooner.
+    assertEquals(childDeadline(now + 100_000, 10, now), now + 10_000);
+    assertEquals(childDeadline(now + 100_000, 500, now), now + 85_000);
+    assertEquals(childDeadline(null, 10, now), now + 10_000);
+});
+
+Deno.test("the nudge starts near the end of the agent's window", () => {
+    assert(!shouldNudge(50_000, 100_000, 5_000));
+    assert(shouldNudge(20_000, 100_000, 5_000));
+    // Slow steps: two of them no longer fit.
+    assert(shouldNudge(50_000, 100_000, 30_000));
+});
+
+Deno.test("llm_query deadline_s must be a positive number", () => {
+    assertEquals(parseDeadline(null), null);
+    assertEquals(parseDeadline(2.5), 2.5);
+    assertThrows(() => parseDeadline(0), Error, "positive");
+    assertThrows(() => parseDeadline("5"), Error, "positive");
+});
@@ -0,0 +1,64 @@
+// Unit test: endpoint pools (endpoint_pool.ts) balance calls across endpoints,
+// respect per-endpoint caps, fail over on retryable errors and eject failing
+// endpoints — no network.
+//
+// Run:  deno test --allow-env tests/endpoint_pool_test.ts
+import { assert, assertEquals, assertRejects } from "jsr:@std/assert@^1.0.0";
+import { EndpointPool } from "../src/endpoint_pool.ts";
+
+function httpError(status: number): Error {
+    return Object.assign(new Error(`HTTP ${status}`), { status });
+}
+
+Deno.test("least_outstanding spreads concurrent calls and honours max_in_flight", async () => {
+    const pool = new EndpointPool("test", [
+        { base_url: "http://a", max_in_flight: 1 },
+        { base_url: "http://b", max_in_flight: 1 },
+    ], "least_outstanding");
+    const seen: string[] = [];
+    let live = 0;
+    let peak = 0;
+    await Promise.all(Array.from({ length: 6 }, () => pool.run(null, async ({ spec }) => {
+        seen.push(spec.base_url);
+        peak = Math.max(peak, ++live);
+        await new Promise((r) => setTimeout(r, 5));
+        live--;
+    })));
+    assertEquals(peak, 2);
+    assertEquals(seen.filter((u) => u === "http://a").length, 3);
+    assertEquals(seen.filter((u) => u === "http://b").length, 3);
+});
+
+Deno.test("retryable errors fail over; other errors don't", async () => {
+    const pool = new EndpointPool("test", [{ base_url: "http://a" }, { base_url: "http://b" }], "least_outstanding");
+    const calls: string[] = [];
+    const out = await pool.run(null, async ({ spec }) => {
+        calls.push(spec.base_url);
+        if (calls.length === 1) throw httpError(503);
+        return spec.base_url;
+    });
+    assertEquals(calls.length, 2);
+    assertEquals(out, calls[1]);
+    assert(calls[0] !== calls[1]);
+
+    await assertRejects(() => pool.run(null, () => Promise.reject(httpError(400))), Error, "HTTP 400");
+    await assertRejects(() => pool.run(null, () => Promise.reject(httpError(500))), Error, "HTTP 500");
+});
+
+Deno.test("a failing endpoint is ejected, then gets traffic only when all are out", async () => {
+    // The heavy weight makes "bad" the first pick until it is ejected.
+    const pool = new EndpointPool("test", [
+        { base_url: "http://bad", weight: 1000 },
+        { base_url: "http://good" },
+    ], "least_outstanding");
+    for (let i = 0; i < 10; i++) {
+        await pool.run(null, async ({ spec }) => {
+            if (spec.base_url === "http://bad") throw httpError(502);
+        });
+    }
+    const bad = pool.stats().find((s) => s.base_url === "http://bad")!;
+    assertEquals(bad.healthy, false);
+    assertEquals(bad.ejections, 1);
+    assertEquals(bad.calls, 3);
+    assertEquals(pool.stats().find((s) => s.base_url === "http://good")!.calls, 10);
+});
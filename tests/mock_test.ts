@@ -0,0 +1,62 @@
+// Unit test: the mock model backend (mock.ts) scripts repl blocks by step and
+// leaf-ness, fills templates, prices tokens and draws latencies — no network.
+//
+// Run:  deno test --allow-read --allow-env tests/mock_test.ts
+import { assert, assertEquals, assertRejects, assertStringIncludes } from "jsr:@std/assert@^1.0.0";
+import { setActiveConfig } from "../src/config.ts";
+import { confirmMockDelegation, generateMockCode, sampleLatency } from "../src/mock.ts";
+
+const probe = { role: "user", content: "context probe" };
+
+Deno.test("fanout delegates at the root and slices at a leaf", async () => {
+    const root = await generateMockCode([probe], "mock:fanout?n=8", false);
+    assert(root.success);
+    assertStringIncludes(root.code, "batch_llm_query");
+    assertStringIncludes(root.code, "// 8)");
+    const leaf = await generateMockCode([probe], "mock:fanout?slice=50", true);
+    assert(!leaf.code.includes("llm_query"));
+    assertStringIncludes(leaf.code, "FINAL(_text[:50])");
+});
+
+Deno.test("registered scripts advance by step and repeat the last", async () => {
+    setActiveConfig({ mock_models: { two: { steps: ["print({{step}})", "FINAL('{{who}}')"], vars: { who: "x" } } } });
+    try {
+        const first = await generateMockCode([probe], "mock:two", false);
+        assertEquals(first.code, "print(0)");
+        const history = [probe, first.message, { role: "user", content: "Output: 0" }];
+        assertEquals((await generateMockCode(history, "mock:two?who=y", false)).code, "FINAL('y')");
+        const digest = { role: "user", content: "[Steps 1-5 are summarized to save context; ...]" };
+        assertEquals((await generateMockCode([probe, digest], "mock:two", false)).code, "FINAL('x')");
+    } finally {
+        setActiveConfig(null);
+    }
+});
+
+Deno.test("token counts and prices make the cost", async () => {
+    const out = await generateMockCode(
+        [probe], "mock:leaf?prompt_tokens=1000&completion_tokens=100&input_price=2&output_price=10", false);
+    assertEquals(out.usage.prompt_tokens, 1000);
+    assertEquals(out.usage.total_tokens, 1100);
+    assertEquals(out.usage.cost, (1000 * 2 + 100 * 10) / 1_000_000);
+    const guard = await confirmMockDelegation([probe], "Delegate?", "mock:leaf", false);
+    assert(guard.approve);
+});
+
+Deno.test("error_rate=1 fails every call; unknown scripts are rejected", async () => {
+    await assertRejects(() => generateMockCode([probe], "mock:leaf?error_rate=1", false), Error, "simulated");
+    await assertRejects(() => generateMockCode([probe], "mock:nope", false), Error, "Unknown mock model");
+});
+
+Deno.test("latency distributions", () => {
+    let x = 0;
+    const rand = () => (x = (x + 0.37) % 1);
+    assertEquals(sampleLatency("fixed:120", rand), 120);
+    for (let i = 0; i < 100; i++) {
+        const u = sampleLatency("uniform:10,20", rand);
+        assert(u >= 10 && u <= 20);
+        assert(sampleLatency("exp:100", rand) >= 0);
+        assert(sampleLatency("lognormal:100,0.5", rand) > 0);
+        assert(sampleLatency("normal:5,50", rand) >= 0);
+    }
+    assertEquals(sampleLatency("fixed", rand), 0);
+});
@@ -0,0 +1,44 @@
+// Unit test: the price table (pricing.ts) and the local token estimator
+// (llm_stream.ts) behind costs the provider didn't report and the pre-flight
+// budget checks — no network.
+//
+// Run:  deno test tests/pricing_test.ts
+import { assert, assertAlmostEquals, assertEquals } from "jsr:@std/assert@^1.0.0";
+import { configurePricing, costOf, priceFor, withCost } from "../src/pricing.ts";
+import { estimatePromptTokens, estimateTokens } from "../src/llm_stream.ts";
+import { emptyUsage } from "../src/usage.ts";
+
+Deno.test("model strings match by provider-free longest prefix", () => {
+    assertEquals(priceFor("anthropic/claude-sonnet-4.5")?.input, 3);
+    assertEquals(priceFor("claude-haiku-4-5-20251001")?.output, 5);
+    assertEquals(priceFor("openai/gpt-5-mini")?.input, 0.25);
+    assertEquals(priceFor("vertex/google/gemini-2.5-flash")?.input, 0.3);
+    assertEquals(priceFor("gpt-50"), null);
+    assertEquals(priceFor("z-ai/glm-5"), null);
+});
+
+Deno.test("model_prices override and extend the table", () => {
+    configurePricing({ "z-ai/glm-5": { input: 1, output: 3 }, "gpt-5-mini": { input: 9, output: 9 } });
+    try {
+        assertEquals(priceFor("z-ai/glm-5")?.output, 3);
+        assertEquals(priceFor("openai/gpt-5-mini")?.input, 9);
+    } finally {
+        configurePricing(null);
+    }
+});
+
+Deno.test("costs price cached prompt tokens separately and keep reported costs", () => {
+    const usage = { ...emptyUsage(), prompt_tokens: 1_000_000, cached_tokens: 500_000, completion_tokens: 100_000 };
+    // 0.5M × $3 + 0.5M × $0.3 + 0.1M × $15
+    assertAlmostEquals(costOf("claude-sonnet-4-6", usage)!, 1.5 + 0.15 + 1.5);
+    assertEquals(withCost("claude-sonnet-4-6", { ...usage, cost: 0.01 }).cost, 0.01);
+    assertEquals(withCost("unknown-model", usage).cost, undefined);
+});
+
+Deno.test("the estimator counts code and numbers above chars / 4", () => {
+    assertEquals(estimateTokens(""), 0);
+    assertEquals(estimateTokens("Hello world, this is a test."), 8);
+    const code = 'def f(x):\n    return {"a": [1, 2, 3]}';
+    assert(estimateTokens(code) > code.length / 4);
+    assert(estimatePromptTokens("system", [{ role: "user", content: "hi" }]) > estimateTokens("system hi"));
+});
@@ -0,0 +1,221 @@
+// Unit test: adaptive rate limiting (rate_limit.ts) — the rpm/tpm sliding
+// window, the in-flight cap a 429 halves, Retry-After pauses, cancellation
+// and retries, driven by the mock backend's error_status — no network.
+//
+// Run:  deno test --allow-read --allow-env tests/rate_limit_test.ts
+import { assert, assertEquals, assertRejects } from "jsr:@std/assert@^1.0.0";
+import { FakeTime } from "jsr:@std/testing@^1.0.0/time";
+import { generateMockCode } from "../src/mock.ts";
+import {
+    configureRateLimits,
+    isRetryable,
+    rateLimited,
+    rateLimiterStats,
+    retryAfterMs,
+} from "../src/rate_limit.ts";
+import { emptyUsage } from "../src/usage.ts";
+
+const probe = { role: "user", content: "context probe" };
+const THROTTLED = "mock:leaf?error_rate=1&error_status=429";
+
+// Each test uses its own model name, so it gets its own limiter.
+function stats(name: string) {
+    return rateLimiterStats().find((s) => s.name === name)!;
+}
+
+function reply(totalTokens = 1) {
+    return Promise.resolve({ usage: { ...emptyUsage(), total_tokens: totalTokens } });
+}
+
+function mockCall(model: string) {
+    return () => generateMockCode([probe], model, true);
+}
+
+const tick = () => new Promise((r) => setTimeout(r, 0));
+
+Deno.test("rpm: calls past the limit wait for the oldest to leave the 60s window", async () => {
+    const time = new FakeTime();
+    configureRateLimits({ "t-rpm": { rpm: 2 } });
+    try {
+        const started: number[] = [];
+        const calls = [0, 1, 2].map((i) =>
+            rateLimited("mock", "t-rpm", 1, 0, null, () => {
+                started.push(i);
+                return reply();
+            })
+        );
+        await time.tickAsync(0);
+        assertEquals(started, [0, 1]);
+        await time.tickAsync(59_999);
+        assertEquals(started, [0, 1]);
+        await time.tickAsync(1);
+        assertEquals(started, [0, 1, 2]);
+        await Promise.all(calls);
+        assertEquals(stats("t-rpm").queued, 1);
+    } finally {
+        time.restore();
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("tpm: a call waits until the window has room for its tokens", async () => {
+    const time = new FakeTime();
+    configureRateLimits({ "t-tpm": { tpm: 1000 } });
+    try {
+        // Queued at an estimate of 600, the first call reports 700: the
+        // window counts the reported total.
+        await rateLimited("mock", "t-tpm", 600, 0, null, () => reply(700));
+        await rateLimited("mock", "t-tpm", 200, 0, null, () => reply(200));
+        let started = false;
+        const third = rateLimited("mock", "t-tpm", 200, 0, null, () => {
+            started = true;
+            return reply(200);
+        });
+        await time.tickAsync(59_999);
+        assert(!started);
+        await time.tickAsync(1);
+        assert(started);
+        await third;
+    } finally {
+        time.restore();
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("a 429 halves the in-flight cap; successes grow it back one step at a time", async () => {
+    configureRateLimits({ "t-cap": { max_in_flight: 8 } });
+    try {
+        const gates: (() => void)[] = [];
+        const gated = (model: string) => () =>
+            new Promise<void>((resolve) => gates.push(resolve)).then(mockCall(model));
+        const throttled = rateLimited("mock", "t-cap", 1, 0, null, gated(THROTTLED));
+        const rest = Array.from({ length: 7 }, () => rateLimited("mock", "t-cap", 1, 0, null, gated("mock:leaf")));
+        await tick();
+        assertEquals(gates.length, 8);
+        assertEquals(stats("t-cap").in_flight_cap, null);
+
+        gates[0]();
+        await assertRejects(() => throttled, Error, "simulated");
+        assertEquals(stats("t-cap").rate_limited, 1);
+        assertEquals(stats("t-cap").in_flight_cap, 4);
+
+        // Seven calls are still in flight, over the new cap: a new one queues
+        // until fewer than the cap are.
+        let lateStarted = false;
+        const late = rateLimited("mock", "t-cap", 1, 0, null, () => {
+            lateStarted = true;
+            return gated("mock:leaf")();
+        });
+        const caps: (number | null)[] = [];
+        for (let i = 0; i < rest.length; i++) {
+            gates[i + 1]();
+            await rest[i];
+            caps.push(stats("t-cap").in_flight_cap);
+            if (i === 2) assert(!lateStarted);
+        }
+        // +1 per cap's worth of successes: 4 calls to reach 5.
+        assertEquals(caps, [4, 4, 4, 5, 5, 5, 5]);
+        assert(lateStarted);
+        gates[8]();
+        await late;
+    } finally {
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("Retry-After pauses the whole limiter, not just the throttled call", async () => {
+    const time = new FakeTime();
+    configureRateLimits({ "t-pause": {} });
+    try {
+        let attempts = 0;
+        const first = rateLimited("mock", "t-pause", 1, 1, null, () => {
+            attempts++;
+            return mockCall(attempts === 1 ? `${THROTTLED}&retry_after=5` : "mock:leaf")();
+        });
+        await time.tickAsync(0);
+        assertEquals(attempts, 1);
+
+        let otherStarted = false;
+        const other = rateLimited("mock", "t-pause", 1, 0, null, () => {
+            otherStarted = true;
+            return mockCall("mock:leaf")();
+        });
+        await time.tickAsync(4_999);
+        assertEquals(attempts, 1);
+        assert(!otherStarted);
+        await time.tickAsync(1);
+        assertEquals(attempts, 2);
+        assert(otherStarted);
+        await Promise.all([first, other]);
+    } finally {
+        time.restore();
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("aborting a queued call removes it from the queue", async () => {
+    configureRateLimits({ "t-abort": { max_in_flight: 1 } });
+    try {
+        let finish!: () => void;
+        const busy = rateLimited("mock", "t-abort", 1, 0, null, () =>
+            new Promise<void>((resolve) => (finish = resolve)).then(() => reply()));
+        const controller = new AbortController();
+        let ran = false;
+        const queued = rateLimited("mock", "t-abort", 1, 0, controller.signal, () => {
+            ran = true;
+            return reply();
+        });
+        const next = rateLimited("mock", "t-abort", 1, 0, null, () => reply());
+        await tick();
+        controller.abort(new Error("cancelled"));
+        await assertRejects(() => queued, Error, "cancelled");
+        finish();
+        await Promise.all([busy, next]);
+        assert(!ran);
+        assertEquals(stats("t-abort").calls, 2);
+        // Already aborted: rejected without queueing.
+        await assertRejects(() => rateLimited("mock", "t-abort", 1, 0, controller.signal, () => reply()), Error, "cancelled");
+    } finally {
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("retryable failures are retried up to maxRetries times; others are not", async () => {
+    configureRateLimits({ "t-retry": {} });
+    try {
+        let attempts = 0;
+        const counted = (model: string) => () => {
+            attempts++;
+            return mockCall(model)();
+        };
+        await assertRejects(
+            () => rateLimited("mock", "t-retry", 1, 2, null, counted(`${THROTTLED}&retry_after=0`)),
+            Error,
+            "simulated",
+        );
+        assertEquals(attempts, 3);
+        assertEquals(stats("t-retry").rate_limited, 3);
+
+        attempts = 0;
+        await assertRejects(
+            () => rateLimited("mock", "t-retry", 1, 2, null, counted("mock:leaf?error_rate=1&error_status=400")),
+            Error,
+            "simulated",
+        );
+        assertEquals(attempts, 1);
+    } finally {
+        configureRateLimits(null);
+    }
+});
+
+Deno.test("Retry-After headers and retryable statuses", () => {
+    const withHeaders = (headers: Record<string, string>, status = 429) => Object.assign(new Error(), { status, headers });
+    assertEquals(retryAfterMs(withHeaders({ "retry-after": "3" })), 3000);
+    assertEquals(retryAfterMs(withHeaders({ "retry-after-ms": "250", "retry-after": "3" })), 250);
+    assertEquals(retryAfterMs(withHeaders({})), null);
+    assertEquals(retryAfterMs(new Error("no headers")), null);
+    assert(isRetryable(withHeaders({}, 429)));
+    assert(isRetryable(withHeaders({}, 503)));
+    assert(!isRetryable(withHeaders({}, 400)));
+    assert(!isRetryable(new Error("plain")));
+});
@@ -0,0 +1,55 @@
+// Real-Pyodide test: a pooled REPL handed back by one agent comes out of the
+// next acquire() in its post-boot state — rebound globals, patched modules,
+// new imports and leftover tasks from the previous agent are gone.
+//
+// Run:  deno test --allow-read --allow-env --allow-net --allow-write tests/repl_pool_test.ts
+import { assertEquals, assertStrictEquals } from "jsr:@std/assert@^1.0.0";
+import { ReplPool } from "../src/repl_pool.ts";
+
+// The pool boots spares in the background, which outlives the test.
+const opts = { sanitizeOps: false, sanitizeResources: false };
+
+Deno.test("release() resets the REPL the next acquire() gets", opts, async () => {
+    const pool = new ReplPool(1);
+    pool.configure({ size: 1, snapshots: false, packages: [], workers: false });
+    await pool.warm();
+
+    const first = await pool.acquire();
+    await first.run(`
+import asyncio, json, os.path, sys, xml.dom.minidom
+FINAL = lambda x: "rebound"
+json.dumps = lambda *a, **k: "patched"
+os.path.join = None
+sys.meta_path.append(object())
+__leftover__ = asyncio.ensure_future(asyncio.sleep(3600))
+`);
+    await pool.release(first);
+
+    // The spare booting in the background takes far longer than this agent,
+    // so the released REPL is the one handed out next.
+    const second = await pool.acquire();
+    assertStrictEquals(second, first);
+    await second.run(`
+import asyncio, json, os.path, sys
+FINAL(1)
+__probe__ = {
+    "final": __final_result__,
+    "dumps": json.dumps({"a": 1}),
+    "join": os.path.join("a", "b"),
+    "minidom": "xml.dom.minidom" in sys.modules,
+    "meta_path_objects": sum(type(f) is object for f in sys.meta_path),
+    "leftover": "__leftover__" in globals(),
+    "tasks": len([t for t in asyncio.all_tasks() if t is not asyncio.current_task()]),
+}
+`);
+    assertEquals(await second.get("__probe__"), {
+        final: 1,
+        dumps: '{"a": 1}',
+        join: "a/b",
+        minidom: false,
+        meta_path_objects: 0,
+        leftover: false,
+        tasks: 0,
+    });
+    second.close();
+});